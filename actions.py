@@ -0,0 +1,79 @@
+from typing import List, Tuple, Optional, Dict
+import terrain
+import targeter
+import sprite
+import gaia
+import profiler
+
+# Lists every legal action of the active civ, encoded as ints for AI search.
+# An action is encoded as ((doer + 1) * len(kinds) + kind) * w * h + y * w + x, where (x, y) is its target tile
+# (or 0 if it has none). So 'End', which has no doer or target, is 0.
+
+kinds = [ 'End', 'move', 'attack', 'gnome', 'dwarf', 'elf', 'dragon', 'fort', 'castle', 'hut', 'chop', 'plant', 'farm', 'trebuchet', 'mine' ]
+kind_index = { descr: i for i, descr in enumerate(kinds) }
+
+# What each menu action costs, as (food, wood, gold). (Model.do_action does nothing if the civ cannot afford it.)
+costs: Dict[str, Tuple[int, int, int]] = {
+	'gnome': (2, 0, 0),
+	'dwarf': (3, 0, 0),
+	'elf': (0, 0, 2),
+	'dragon': (0, 0, 13),
+	'fort': (0, 5, 0),
+	'castle': (0, 8, 0),
+	'hut': (0, 1, 0),
+	'chop': (0, 0, 0),
+	'plant': (0, 0, 0),
+	'farm': (0, 2, 0),
+	'trebuchet': (0, 0, 3),
+	'mine': (0, 3, 0),
+}
+
+# The menu actions that make a new unit next to a building (as opposed to turning the doer into something)
+spawns = { 'gnome', 'dwarf', 'elf', 'dragon' }
+
+tile_count = terrain.Terrain.w * terrain.Terrain.h
+
+def encode(descr: str, doer: int, target: Optional[Tuple[int, int]]) -> int:
+	t = 0 if target is None else target[1] * terrain.Terrain.w + target[0]
+	return ((doer + 1) * len(kinds) + kind_index[descr]) * tile_count + t
+
+def decode(code: int) -> gaia.Action:
+	rest, t = divmod(code, tile_count)
+	doer, kind = divmod(rest, len(kinds))
+	descr = kinds[kind]
+	target = (t % terrain.Terrain.w, t // terrain.Terrain.w) if descr == 'move' or descr == 'attack' else None
+	return gaia.Action(descr, doer - 1, target)
+
+# Returns every legal action of the active civ, encoded. One Targeter, with its occupancy and terrain bitboards,
+# is shared by all of the civ's units.
+@profiler.timed('actions.legal_actions')
+def legal_actions(model: gaia.Model) -> List[int]:
+	terr = model.terr
+	c = model.civs[model.active_civ]
+	tt = targeter.Targeter(terr, model.civs)
+	board_full = tt.occupied == tt.grid.full
+	codes = [ 0 ] # (End)
+	for i, s in enumerate(c.population):
+		if s.exhausted:
+			continue
+		base = (i + 1) * len(kinds) * tile_count
+
+		# Menu actions
+		for opt in s.menu_options(terr.tile(s.tile)):
+			n = opt.find(' ')
+			descr = opt if n < 0 else opt[:n]
+			food, wood, gold = costs[descr]
+			if c.food < food or c.wood < wood or c.gold < gold:
+				continue
+			if descr in spawns and board_full:
+				continue # (no room for the new unit)
+			codes.append(base + kind_index[descr] * tile_count)
+
+		# Moves and attacks
+		if s.move_range() > 0:
+			for spot in tt.get_move_targets(s.tile, terr, s.move_range(), s.can_fly() or c.wood >= 1, s.can_fly()):
+				codes.append(base + tile_count + spot.tile[1] * terrain.Terrain.w + spot.tile[0])
+		if s.attack_range() > 0:
+			for spot in tt.get_attack_targets(s.tile, terr, s.attack_range(), model.active_civ, s.can_shoot()):
+				codes.append(base + 2 * tile_count + spot.tile[1] * terrain.Terrain.w + spot.tile[0])
+	return codes
@@ -0,0 +1,177 @@
+from typing import List, Tuple, Dict, Optional
+import time
+import multiprocessing
+import concurrent.futures
+import gaia
+import actions
+import blob
+import rng
+import profiler
+
+# The computer player. It picks an action by flat Monte Carlo search: it tries each legal action many times,
+# each time following it with a short random playout and scoring the position that results, and picks the action
+# with the best average score. Actions are tried with Model.make and taken back with Model.unmake, so nothing is copied.
+#
+# The search is root-parallel: every worker process searches the same position (sent as a blob, see blob.py) with its own
+# random playouts until a shared deadline, and the statistics of all the workers that report back by then are added up.
+
+unit_values = { 'Building': 6., 'Farm': 3., 'Mine': 3., 'Gnome': 2., 'Dwarf': 3., 'Trebuchet': 4., 'Elf': 4., 'Dragon': 12. }
+life_value = 0.2
+resource_value = 0.1
+lost_value = -100.
+
+# Scores a position for a civ: its units and resources, less those of its strongest opponent
+def evaluate(model: gaia.Model, civ_index: int) -> float:
+	worth: List[float] = []
+	for c in model.civs:
+		if not c.alive or len(c.population) == 0:
+			worth.append(lost_value)
+			continue
+		w = sum(unit_values[type(s).__name__] + life_value * s.life for s in c.population)
+		worth.append(w + resource_value * (c.food + c.wood + c.gold))
+	others = worth[:civ_index] + worth[civ_index + 1:]
+	return worth[civ_index] - (max(others) if len(others) > 0 else 0.)
+
+def game_over(model: gaia.Model) -> bool:
+	return sum(1 for c in model.civs if c.alive and len(c.population) > 0) <= 1
+
+# Plays up to length random legal actions, and returns how many were made
+def playout(model: gaia.Model, rand: rng.Stream, length: int) -> int:
+	for i in range(length):
+		if game_over(model):
+			return i
+		codes = actions.legal_actions(model)
+		model.make(actions.decode(codes[rand.randrange(len(codes))]))
+	return length
+
+# Makes an action, follows it with a random playout, and takes it all back. Returns the score of the position the playout reached.
+def try_action(model: gaia.Model, code: int, rand: rng.Stream, playout_length: int, civ_index: int) -> float:
+	model.searching += 1 # (so the playout's turns can be taken back)
+	model.make(actions.decode(code))
+	made = 1 + playout(model, rand, playout_length)
+	score = evaluate(model, civ_index)
+	for k in range(made):
+		model.unmake()
+	model.searching -= 1
+	return score
+
+# Searches a position in this process with a fixed number of playouts of each legal action (so the result depends only on rand),
+# and returns the best action
+def choose_by_playouts(model: gaia.Model, rand: rng.Stream, playouts_per_action: int, playout_length: int = 12) -> int:
+	codes = actions.legal_actions(model)
+	if len(codes) == 1:
+		return codes[0]
+	totals = [ 0. ] * len(codes)
+	for i in range(playouts_per_action):
+		for j, code in enumerate(codes):
+			totals[j] += try_action(model, code, rand, playout_length, model.active_civ)
+	return codes[max(range(len(codes)), key = lambda j: totals[j])]
+
+# The model each worker process searches in (made once per process)
+worker_model: Optional[gaia.Model] = None
+
+def get_worker_model() -> gaia.Model:
+	global worker_model
+	if worker_model is None:
+		worker_model = gaia.Model()
+		worker_model.display_mode = False
+		worker_model.draws_canvas = False
+	return worker_model
+
+# Imports the game and makes the worker's model, so the first search does not spend its budget on that
+def warm_up() -> None:
+	get_worker_model()
+
+# Searches a position until the deadline (a time.time() value). Returns the visits and the total score of each root action.
+# (This runs in the worker processes.)
+def search(data: bytes, codes: List[int], deadline: float, seed: int, playout_length: int) -> Tuple[List[int], List[float]]:
+	m = get_worker_model()
+	blob.unpack(m, data)
+	civ_index = m.active_civ
+	rand = rng.Stream(seed)
+	visits = [ 0 ] * len(codes)
+	totals = [ 0. ] * len(codes)
+	first = rand.randrange(len(codes)) # (so workers that run out of time early have tried different actions)
+	i = first
+	while i == first or time.time() < deadline: # (at least one playout, so a worker that starts late still reports something)
+		j = i % len(codes)
+		totals[j] += try_action(m, codes[j], rand, playout_length, civ_index)
+		visits[j] += 1
+		i += 1
+	return visits, totals
+
+# Runs searches in a pool of worker processes and merges their results.
+# The workers are spawned (not forked), so they do not inherit the game's threads, and they start warming up at once.
+class Searcher():
+	grace = 0.25 # seconds past the deadline to wait for workers to report
+
+	def __init__(self, processes: int, budget: float = 1., playout_length: int = 12) -> None:
+		self.processes = processes
+		self.budget = budget # seconds per decision
+		self.playout_length = playout_length
+		self.pool = concurrent.futures.ProcessPoolExecutor(max_workers = processes, mp_context = multiprocessing.get_context('spawn'))
+		for i in range(processes):
+			self.pool.submit(warm_up)
+		self.seeds = rng.Stream(0x5ea7c4)
+		self.futures: List[concurrent.futures.Future] = []
+		self.codes: List[int] = []
+		self.deadline = 0.
+		self.simulations = 0 # playouts merged into the last decision
+
+	# Starts searching the model's position in the background
+	def start(self, model: gaia.Model) -> None:
+		self.codes = actions.legal_actions(model)
+		data = blob.pack(model)
+		self.deadline = time.time() + self.budget
+		self.futures = [ self.pool.submit(search, data, self.codes, self.deadline, self.seeds.next64(), self.playout_length) for i in range(self.processes) ]
+
+	def busy(self) -> bool:
+		return len(self.futures) > 0
+
+	# Returns the best action found, or None if the workers are still searching. Once the deadline (and a little grace)
+	# has passed, workers that have not reported are left out, unless none has reported yet. If every worker failed,
+	# this raises the first one's exception.
+	def poll(self) -> Optional[int]:
+		done = [ f for f in self.futures if f.done() ]
+		if len(done) < len(self.futures) and (time.time() < self.deadline + Searcher.grace or len(done) == 0):
+			return None
+		reported = [ f for f in done if f.exception() is None ]
+		if len(reported) == 0:
+			self.futures = []
+			raise RuntimeError('every search worker failed') from done[0].exception()
+		visits = [ 0 ] * len(self.codes)
+		totals = [ 0. ] * len(self.codes)
+		for f in reported:
+			v, t = f.result()
+			for i in range(len(self.codes)):
+				visits[i] += v[i]
+				totals[i] += t[i]
+		for f in self.futures:
+			if not f.done():
+				f.cancel()
+				profiler.count('ai workers late')
+		profiler.count('ai workers failed', len(done) - len(reported))
+		self.futures = []
+		self.simulations = sum(visits)
+		profiler.count('ai playouts', self.simulations)
+		best = max(range(len(self.codes)), key = lambda i: totals[i] / visits[i] if visits[i] > 0 else float('-inf'))
+		return self.codes[best]
+
+	# Searches the model's position and returns the best action (blocking until it is found)
+	def choose(self, model: gaia.Model) -> int:
+		self.start(model)
+		while True:
+			code = self.poll()
+			if code is not None:
+				return code
+			time.sleep(0.01)
+
+	# Plays for a computer civ in a game on the screen. (See Model.computer_player.) Returns the action to do, or None while it is still thinking.
+	def think(self, model: gaia.Model) -> Optional[gaia.Action]:
+		if not self.busy():
+			self.start(model)
+		code = self.poll()
+		return None if code is None else actions.decode(code)
+
+	def close(self) -> None:
+		self.pool.shutdown(cancel_futures = True)
@@ -0,0 +1,92 @@
+from typing import List, Tuple, Dict
+import colorsys
+import numpy as np
+import pygame
+import image
+
+# The border colors that used to be painted into pics/civ0 .. pics/civ3 (in BGR order)
+civ_colors: List[Tuple[int, int, int]] = [
+	(0, 0, 160),
+	(0, 128, 0),
+	(255, 128, 0),
+	(192, 192, 192),
+]
+
+# Returns the color (in BGR order) that represents the specified civilization.
+# Civilizations beyond the first four get hues spaced by the golden angle.
+def civ_color(civ: int) -> Tuple[int, int, int]:
+	if civ < len(civ_colors):
+		return civ_colors[civ]
+	hue = (civ * 0.618033988749895) % 1.0
+	r, g, b = colorsys.hsv_to_rgb(hue, 0.9, 0.8)
+	return (int(b * 255), int(g * 255), int(r * 255))
+
+# Packs many small images into a few large surfaces.
+# Rectangles are placed left-to-right on horizontal shelves, and a new page is started when one fills up.
+# Pages are small (a page holds the units of about two civs), so a game with few civs does not pay for empty pages.
+# A rectangle bigger than a page gets a page of its own size.
+class Atlas():
+	page_size = 512
+
+	def __init__(self) -> None:
+		self.pages: List[pygame.Surface] = []
+		self.shelf_x = 0
+		self.shelf_y = 0
+		self.shelf_h = 0
+
+	# Reserves a w-by-h region and returns it as a subsurface of one of the pages
+	def pack(self, w: int, h: int) -> pygame.Surface:
+		size = max(Atlas.page_size, w, h)
+		if len(self.pages) > 0 and self.shelf_x + w > self.pages[-1].get_width():
+			self.shelf_x = 0
+			self.shelf_y += self.shelf_h
+			self.shelf_h = 0
+		if len(self.pages) == 0 or self.shelf_y + h > self.pages[-1].get_height():
+			self.pages.append(pygame.Surface((size, size), pygame.SRCALPHA))
+			self.shelf_x = 0
+			self.shelf_y = 0
+			self.shelf_h = 0
+		region = self.pages[-1].subsurface((self.shelf_x, self.shelf_y, w, h))
+		self.shelf_x += w
+		self.shelf_h = max(self.shelf_h, h)
+		return region
+
+
+# Holds the base art for each kind of unit, and lazily makes a tinted copy for each civilization
+class UnitArt():
+	def __init__(self) -> None:
+		self.atlas = Atlas()
+		self.bases: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+		self.variants: Dict[Tuple[str, int], pygame.Surface] = {}
+
+	# Loads and scales one image. Its pixels are kept as (rgb, alpha) arrays so they can be tinted later.
+	def add(self, name: str, filename: str, scale: float) -> None:
+		im = image.scale_pg_image(pygame.image.load(filename), scale)
+		if im.get_flags() & pygame.SRCALPHA:
+			alpha = pygame.surfarray.array_alpha(im)
+		else:
+			alpha = np.full(im.get_size(), 255, dtype = np.uint8)
+		self.bases[name] = (pygame.surfarray.array3d(im), alpha)
+
+	# Returns the image of the named unit in the colors of the specified civilization
+	def get(self, name: str, civ: int) -> pygame.Surface:
+		key = (name, civ)
+		if key not in self.variants:
+			rgb, alpha = self.bases[name]
+			b, g, r = civ_color(civ)
+			tinted = image.tint(rgb, 0.5 + r / 255., 0.5 + g / 255., 0.5 + b / 255.) # (surfarray pixels are in RGB order)
+			region = self.atlas.pack(rgb.shape[0], rgb.shape[1])
+			pixels = pygame.surfarray.pixels3d(region)
+			pixels[:, :, :] = tinted
+			del pixels # unlock the surface
+			pixels_alpha = pygame.surfarray.pixels_alpha(region)
+			pixels_alpha[:, :] = alpha
+			del pixels_alpha
+			self.variants[key] = region
+		return self.variants[key]
+
+	# Makes all the variants needed for a game with the specified number of civilizations
+	def preload(self, num_civs: int) -> None:
+		for civ in range(num_civs):
+			for name in self.bases:
+				self.get(name, civ)
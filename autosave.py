@@ -0,0 +1,78 @@
+from typing import Mapping, Callable, Any, Optional, Dict
+import os
+import json
+import atexit
+import threading
+import profiler
+
+# Writes a JSON file so that readers only ever see the old contents or the new contents, never a partial file
+def write_atomically(filename: str, ob: Any) -> None:
+	b = bytes(json.dumps(ob), 'utf8')
+	tmp_filename = filename + '.tmp'
+	with open(tmp_filename, mode='wb+') as file:
+		file.write(b)
+		file.flush()
+		os.fsync(file.fileno())
+	os.replace(tmp_filename, filename)
+
+# Serializes and writes saved games on a background thread, so the UI does not wait for the disk.
+# If a file is saved several times while another write is in progress, only its newest contents get written.
+class AutoSaver():
+	idle_timeout = 5. # seconds before an idle writer thread exits (it is restarted by the next save)
+
+	def __init__(self) -> None:
+		self.cond = threading.Condition()
+		self.thread: Optional[threading.Thread] = None
+		self.pending: Optional[Dict[str, Optional[Callable[[], Any]]]] = None
+		self.busy = False
+		self.registered = False
+
+	# Queues files to be written, in order. files maps each filename to a function that returns the object
+	# to write as JSON, or to None to delete the file. The functions are called on the writer thread,
+	# so they should only read from a snapshot that nothing else will change.
+	def save(self, files: Mapping[str, Optional[Callable[[], Any]]]) -> None:
+		with self.cond:
+			if self.pending is None:
+				self.pending = {}
+			for filename, make_ob in files.items():
+				if filename in self.pending:
+					profiler.count('autosaves coalesced')
+					del self.pending[filename] # (re-insert it at the end, so files are still written in the order they were queued)
+				self.pending[filename] = make_ob
+			if not self.registered:
+				atexit.register(self.flush) # make sure the last save reaches the disk
+				self.registered = True
+			if self.thread is None:
+				self.thread = threading.Thread(target=self.run, name='AutoSaver', daemon=True)
+				self.thread.start()
+			self.cond.notify_all()
+
+	def run(self) -> None:
+		while True:
+			with self.cond:
+				self.busy = False
+				self.cond.notify_all()
+				if self.pending is None:
+					self.cond.wait(AutoSaver.idle_timeout)
+				if self.pending is None:
+					self.thread = None
+					return
+				files = self.pending
+				self.pending = None
+				self.busy = True
+			try:
+				with profiler.span('AutoSaver write'):
+					for filename, make_ob in files.items():
+						if make_ob is None:
+							if os.path.exists(filename):
+								os.remove(filename)
+						else:
+							write_atomically(filename, make_ob())
+			except Exception as e:
+				print('Failed to save the game: ' + str(e))
+
+	# Blocks until every queued save has been written
+	def flush(self) -> None:
+		with self.cond:
+			while self.pending is not None or self.busy:
+				self.cond.wait()
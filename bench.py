@@ -0,0 +1,377 @@
+from typing import List, Dict, Callable, Any, Optional, Tuple
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import statistics
+
+# Run headless, from the directory that holds the pics folder
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import cv2
+import gaia
+import terrain
+import civ
+import image
+import sprite
+import targeter
+import rng
+import minimap
+import actions
+import env
+import influence
+import ai
+
+baseline_filename = 'bench_baseline.json'
+
+# Returns a freshly started game with a fixed seed
+def new_game(seed: int, num_civs: int) -> gaia.Model:
+	m = gaia.Model()
+	m.display_mode = False
+	m.start_game(num_civs, seed)
+	m.message = ''
+	m.update_canvas()
+	return m
+
+# Processes queued actions and animations until the model is idle
+def settle(m: gaia.Model) -> None:
+	while m.animating_sprite is not None or m.history_pos < len(m.history):
+		m.update()
+
+# Appends one action to the history and plays it out
+def play(m: gaia.Model, act: gaia.Action) -> None:
+	m.history.append(act)
+	settle(m)
+
+# A simple policy for benchmarking: every unit does its first affordable menu option, then moves as far as it can
+def play_turn(m: gaia.Model, rand: random.Random) -> None:
+	c = m.civs[m.active_civ]
+	i = 0
+	while i < len(c.population):
+		s = c.population[i]
+		if not s.exhausted:
+			opts = s.menu_options(m.terr.tile(s.tile))
+			if len(opts) > 0:
+				opt = opts[rand.randrange(len(opts))]
+				n = opt.find(' ')
+				play(m, gaia.Action(opt if n < 0 else opt[:n], i, None))
+		if i < len(c.population) and c.population[i] is s and not s.exhausted and s.move_range() > 0:
+			tt = targeter.Targeter(m.terr, m.civs)
+			attacks = tt.get_attack_targets(s.tile, m.terr, s.attack_range(), m.active_civ, s.can_shoot())
+			if len(attacks) > 0:
+				play(m, gaia.Action('attack', i, attacks[0].tile))
+			else:
+				moves = tt.get_move_targets(s.tile, m.terr, s.move_range(), s.can_fly() or c.wood >= 1, s.can_fly())
+				if len(moves) > 0:
+					play(m, gaia.Action('move', i, moves[rand.randrange(len(moves))].tile))
+		i += 1
+	play(m, gaia.Action('End', -1, None))
+
+# Plays the specified number of civ turns (each civ's turn counts as one). Stops early if any civilization runs out of units.
+def simulate(m: gaia.Model, turns: int, seed: int) -> None:
+	rand = random.Random(seed)
+	for turn in range(turns):
+		if any(len(c.population) == 0 for c in m.civs):
+			break
+		play_turn(m, rand)
+
+
+# Returns the run times (in seconds) of the specified function
+def measure(func: Callable[[], Any], repeat: int) -> List[float]:
+	times: List[float] = []
+	for i in range(repeat):
+		t = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - t)
+	return times
+
+def bench_generate_terrain() -> None:
+	rand = rng.Stream(1)
+	for i in range(20):
+		terrain.Terrain().generate_terrain(rand)
+
+def bench_canvas_full(m: gaia.Model) -> Callable[[], None]:
+	return lambda: m.update_canvas()
+
+# (This changes tiles, so it works on a copy of the game that the other cases share)
+def bench_canvas_incremental(m: gaia.Model) -> Callable[[], None]:
+	m2 = gaia.Model()
+	m2.display_mode = False
+	m2.unmarshall(m.marshall())
+	m2.update_canvas()
+	spot = next(c.population[0].tile for c in m2.civs if len(c.population) > 0)
+	def run() -> None:
+		m2.set_tile(spot, 2 if m2.terr.tile(spot) == 3 else 3)
+		m2.update_canvas()
+	return run
+
+def bench_perspective_blit4(m: gaia.Model) -> Callable[[], None]:
+	canvas = np.zeros((722, 1552, 3), dtype = np.uint8)
+	transform = np.array([[0.36, 0.05, 100.], [0., 0.36, 100.], [0., 0.0001, 1.]])
+	def run() -> None:
+		for i in range(64):
+			image.perspective_blit4(canvas, terrain.Terrain.images[3], transform)
+	return run
+
+def bench_blit4(m: gaia.Model) -> Callable[[], None]:
+	canvas = np.zeros((722, 1552, 3), dtype = np.uint8)
+	src = terrain.Terrain.images[3]
+	def run() -> None:
+		for i in range(64):
+			image.blit4(canvas, src, (i * 37) % 1400, (i * 53) % 600)
+	return run
+
+def bench_visibility(m: gaia.Model) -> Callable[[], None]:
+	def run() -> None:
+		for i in range(50):
+			for c in m.civs:
+				c.make_visibility_map()
+	return run
+
+def bench_targets(m: gaia.Model) -> Callable[[], None]:
+	def run() -> None:
+		for i in range(20):
+			tt = targeter.Targeter(m.terr, m.civs)
+			for ci, c in enumerate(m.civs):
+				for s in c.population:
+					tt.get_move_targets(s.tile, m.terr, 4, True, False)
+					tt.get_attack_targets(s.tile, m.terr, 5, ci, True)
+	return run
+
+def bench_minimap(m: gaia.Model) -> Callable[[], None]:
+	mm = minimap.Minimap(8)
+	def run() -> None:
+		for i in range(1000):
+			mm.update(m.terr.tiles, m.owned_spots(), m.visibility)
+	return run
+
+def bench_legal_actions(m: gaia.Model) -> Callable[[], None]:
+	active = m.active_civ
+	def run() -> None:
+		for i in range(100):
+			for civ in range(len(m.civs)):
+				m.active_civ = civ
+				actions.legal_actions(m)
+		m.active_civ = active
+	return run
+
+# Returns how many legal actions all the civs have
+def count_legal_actions(m: gaia.Model) -> int:
+	active = m.active_civ
+	count = 0
+	for civ in range(len(m.civs)):
+		m.active_civ = civ
+		count += len(actions.legal_actions(m))
+	m.active_civ = active
+	return count
+
+def bench_influence(m: gaia.Model) -> Callable[[], None]:
+	def run() -> None:
+		for i in range(100):
+			influence.compute(m.terr, m.civs)
+	return run
+
+def bench_rehash(m: gaia.Model) -> Callable[[], None]:
+	def run() -> None:
+		for i in range(100):
+			m.rehash()
+	return run
+
+def bench_env(num_envs: int, steps: int) -> Callable[[], None]:
+	e = env.SyncVecEnv(num_envs, 3)
+	e.reset(range(num_envs))
+	rand = random.Random(1)
+	def run() -> None:
+		for i in range(steps):
+			e.step([ legal[rand.randrange(len(legal))] for legal in e.legal ])
+	return run
+
+def bench_save_load(m: gaia.Model) -> Callable[[], None]:
+	def run() -> None:
+		for i in range(20):
+			b = bytes(json.dumps(m.marshall()), 'utf8')
+			hist = bytes(json.dumps([ act.marshall() for act in m.history ]), 'utf8')
+			m2 = gaia.Model()
+			m2.unmarshall(json.loads(b))
+			[ gaia.Action.unmarshall(ob) for ob in json.loads(hist) ]
+	return run
+
+def bench_replay(m: gaia.Model, seed: int, num_civs: int) -> Callable[[], None]:
+	hist = [ gaia.Action.unmarshall(act.marshall()) for act in m.history ]
+	def run() -> None:
+		m2 = new_game(seed, num_civs)
+		m2.history = list(hist)
+		settle(m2)
+	return run
+
+def bench_simulate(seed: int, num_civs: int, turns: int) -> Callable[[], None]:
+	def run() -> None:
+		m2 = new_game(seed, num_civs)
+		simulate(m2, turns, seed)
+	return run
+
+# Runs every benchmark and returns a map from benchmark name to its stats
+def run_all(repeat: int, only: Optional[str]) -> Dict[str, Dict[str, float]]:
+	seed = 1234
+	num_civs = 3
+	turns = 12
+
+	# Play a reference game to get an interesting board and a history to replay
+	m = new_game(seed, num_civs)
+	simulate(m, turns, seed)
+	m.update_canvas()
+
+	# Each case has a name, a function to time, and the number of items it processes (for throughput)
+	action_count = len(m.history)
+	cases: List[Tuple[str, Callable[[], None], int]] = [
+		('generate_terrain x20', bench_generate_terrain, 20),
+		('canvas full rebuild', bench_canvas_full(m), 1),
+		('canvas after one-tile change', bench_canvas_incremental(m), 1),
+		('perspective_blit4 x64', bench_perspective_blit4(m), 64),
+		('blit4 x64', bench_blit4(m), 64),
+		('visibility maps x50', bench_visibility(m), 50 * num_civs),
+		('move and attack targets x20', bench_targets(m), 20),
+		('minimap x1000', bench_minimap(m), 1000),
+		('legal actions x100', bench_legal_actions(m), 100 * count_legal_actions(m)),
+		('influence maps x100', bench_influence(m), 100),
+		('rehash x100', bench_rehash(m), 100),
+		('env 64 games x20 steps', bench_env(64, 20), 64 * 20),
+		('save/load round-trip x20', bench_save_load(m), 20),
+		('replay ' + str(action_count) + ' actions', bench_replay(m, seed, num_civs), action_count),
+		('simulate ' + str(turns) + ' civ turns', bench_simulate(seed, num_civs, turns), action_count),
+	]
+	results: Dict[str, Dict[str, float]] = {}
+	for name, func, items in cases:
+		if only is not None and only not in name:
+			continue
+		times = measure(func, repeat)
+		results[name] = {
+			'median': statistics.median(times),
+			'min': min(times),
+			'runs': len(times),
+			'per_second': items / statistics.median(times),
+		}
+		print('{:<32} median {:9.3f}ms   min {:9.3f}ms   {:10.1f}/s'.format(name, results[name]['median'] * 1000, results[name]['min'] * 1000, results[name]['per_second']), file=sys.stderr)
+	return results
+
+# Times full canvas renders with different numbers of compositing threads, on square maps of different sizes
+def run_scaling(repeat: int, sizes: List[int], thread_counts: List[int]) -> Dict[str, Dict[str, float]]:
+	results: Dict[str, Dict[str, float]] = {}
+	rand = rng.Stream(1)
+	for size in sizes:
+		terr = terrain.Terrain()
+		terr.w = size
+		terr.h = size
+		terr.make_tilt()
+		tiles = [ [ rand.randrange(1, 6) for x in range(size) ] for y in range(size) ]
+		owned = [ [ (x, y, (x + y) % 2 == 0) for x in range(0, size, 3) for y in range(i, size, 4) ] for i in range(4) ]
+		visibility = [ [ True for x in range(size) ] for y in range(size) ]
+		w, h = terr.canvas_size
+		canvas = np.zeros((h, w, 3), dtype = np.uint8)
+		terr.render(canvas, tiles, owned, visibility) # warm up the warp cache
+		serial = 0.
+		for threads in thread_counts:
+			terrain.Terrain.set_render_threads(threads)
+			times = measure(lambda: terr.render(canvas, tiles, owned, visibility), repeat)
+			name = 'render {}x{} with {} threads'.format(size, size, threads)
+			results[name] = {
+				'median': statistics.median(times),
+				'min': min(times),
+				'runs': len(times),
+				'per_second': 1. / statistics.median(times),
+			}
+			if threads == thread_counts[0]:
+				serial = results[name]['median']
+			print('{:<32} median {:9.3f}ms   speedup {:5.2f}x'.format(name, results[name]['median'] * 1000, serial / results[name]['median']), file=sys.stderr)
+	return results
+
+# Reports how many playouts the computer player's search makes within its budget with each number of worker processes.
+# (The speedup is against the first process count. Each search is of the same mid-game position.)
+def run_search_scaling(repeat: int, process_counts: List[int], budget: float) -> Dict[str, Dict[str, float]]:
+	m = gaia.Model()
+	m.display_mode = False
+	m.draws_canvas = False
+	m.start_game(2, 1)
+	m.message = ''
+	rand = rng.Stream(2)
+	for i in range(200):
+		codes = actions.legal_actions(m)
+		m.make(actions.decode(codes[rand.randrange(len(codes))]))
+	results: Dict[str, Dict[str, float]] = {}
+	serial = 0.
+	for processes in process_counts:
+		searcher = ai.Searcher(processes, budget)
+		searcher.choose(m) # warm up the worker processes
+		per_playout: List[float] = []
+		for i in range(repeat):
+			searcher.choose(m)
+			per_playout.append(budget / max(1, searcher.simulations))
+		searcher.close()
+		name = 'search with {} processes'.format(processes)
+		results[name] = {
+			'median': statistics.median(per_playout),
+			'min': min(per_playout),
+			'runs': len(per_playout),
+			'per_second': 1. / statistics.median(per_playout),
+		}
+		if processes == process_counts[0]:
+			serial = results[name]['median']
+		print('{:<32} {:7.0f} playouts/s   speedup {:5.2f}x'.format(name, results[name]['per_second'], serial / results[name]['median']), file=sys.stderr)
+	return results
+
+# Compares results against a baseline. Returns the names of the benchmarks that got slower than tolerance allows.
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+	regressions: List[str] = []
+	for name in results:
+		if name not in baseline:
+			continue
+		ratio = results[name]['median'] / baseline[name]['median']
+		flag = ''
+		if ratio > tolerance:
+			flag = '  REGRESSION'
+			regressions.append(name)
+		print('{:<32} {:6.2f}x baseline{}'.format(name, ratio, flag), file=sys.stderr)
+	return regressions
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description='Headless benchmarks for the Gaia engine and renderer')
+	parser.add_argument('--repeat', type=int, default=5, help='number of timed runs of each benchmark')
+	parser.add_argument('--only', help='only run benchmarks whose names contain this string')
+	parser.add_argument('--out', help='write the results as JSON to this file (default: stdout)')
+	parser.add_argument('--baseline', default=baseline_filename, help='baseline file to compare against')
+	parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+	parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown ratio that counts as a regression')
+	parser.add_argument('--scaling', action='store_true', help='instead, report how canvas rendering scales with compositing threads and map size')
+	parser.add_argument('--search-scaling', action='store_true', help='instead, report how the computer player\'s search scales with worker processes, from 1 to one per core')
+	parser.add_argument('--budget', type=float, default=1., help='seconds per search, for --search-scaling')
+	args = parser.parse_args()
+
+	if args.scaling:
+		results = run_scaling(args.repeat, [16, 32, 48], [1, 2, 4, 8])
+	elif args.search_scaling:
+		cores = os.cpu_count() or 1
+		results = run_search_scaling(args.repeat, sorted(set([ 1, 2, 4, 8, 16, 32, 64 ][:cores.bit_length()] + [ cores ])), args.budget)
+	else:
+		results = run_all(args.repeat, args.only)
+	b = json.dumps(results, indent=1)
+	if args.out:
+		with open(args.out, mode='w') as file:
+			file.write(b)
+	else:
+		print(b)
+	if args.save_baseline:
+		with open(args.baseline, mode='w') as file:
+			file.write(b)
+	elif os.path.exists(args.baseline):
+		with open(args.baseline, mode='r') as file:
+			baseline = json.loads(file.read())
+		if len(compare(results, baseline, args.tolerance)) > 0:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,86 @@
+from typing import List, Tuple, Dict
+import functools
+
+# Sets of tiles stored in the bits of Python ints (bitboards), where tile (x, y) is bit y * w + x.
+# Unions, intersections, and counts of sets of tiles are single operations on the whole board,
+# and the neighbors of a whole set of tiles are found with a few shifts.
+# Like Terrain.adjacent, odd columns sit half a tile lower than even columns.
+class Grid():
+	def __init__(self, w: int, h: int) -> None:
+		self.w = w
+		self.h = h
+		self.full = (1 << (w * h)) - 1
+		def every_row(row: int) -> int:
+			return sum(row << (y * w) for y in range(h))
+		self.not_first_col = self.full ^ every_row(1)
+		self.not_last_col = self.full ^ every_row(1 << (w - 1))
+		self.even_cols = every_row(sum(1 << x for x in range(0, w, 2)))
+		self.odd_cols = self.full ^ self.even_cols
+		self.balls: Dict[Tuple[int, int, int], int] = {}
+
+	def bit(self, x: int, y: int) -> int:
+		return 1 << (y * self.w + x)
+
+	# Returns the tiles next to any tile in m
+	def neighbors(self, m: int) -> int:
+		w = self.w
+		even = m & self.even_cols
+		odd = m & self.odd_cols
+		n = (m >> w) | (m << w) # up and down
+		n |= ((m >> 1) & self.not_last_col) | ((m << 1) & self.not_first_col) # left and right
+		n |= ((even >> (w + 1)) & self.not_last_col) | ((even >> (w - 1)) & self.not_first_col) # up-left and up-right of even columns
+		n |= ((odd << (w - 1)) & self.not_last_col) | ((odd << (w + 1)) & self.not_first_col) # down-left and down-right of odd columns
+		return n & self.full
+
+	# Returns the tiles within the specified number of steps of (x, y)
+	def ball(self, x: int, y: int, steps: int) -> int:
+		key = (x, y, steps)
+		if key not in self.balls:
+			m = self.bit(x, y)
+			for i in range(steps):
+				m |= self.neighbors(m)
+			self.balls[key] = m
+		return self.balls[key]
+
+	# Returns the tiles reached from start in each step of a flood, beginning with start itself. Each step enters the
+	# not-yet-reached neighbors in enterable of the tiles reached by the step before that are also in through.
+	def flood(self, start: int, through: int, enterable: int, steps: int) -> List[int]:
+		layers = [ start ]
+		reached = start
+		frontier = start
+		for i in range(steps):
+			frontier = self.neighbors(frontier & through) & enterable & ~reached
+			if frontier == 0:
+				break
+			reached |= frontier
+			layers.append(frontier)
+		return layers
+
+	# Returns the tiles in m, in row-major order
+	def spots(self, m: int) -> List[Tuple[int, int]]:
+		w = self.w
+		spots: List[Tuple[int, int]] = []
+		while m:
+			low = m & -m
+			i = low.bit_length() - 1
+			spots.append((i % w, i // w))
+			m ^= low
+		return spots
+
+	def from_rows(self, rows: List[List[bool]]) -> int:
+		m = 0
+		for y, row in enumerate(rows):
+			for x, b in enumerate(row):
+				if b:
+					m |= 1 << (y * self.w + x)
+		return m
+
+	def to_rows(self, m: int) -> List[List[bool]]:
+		w = self.w
+		bits = format(m, '0' + str(w * self.h) + 'b')[::-1]
+		return [ [ c == '1' for c in bits[y * w:(y + 1) * w] ] for y in range(self.h) ]
+
+# Returns the (shared) grid for boards of the specified size
+@functools.lru_cache(maxsize = 8)
+def grid(w: int, h: int) -> Grid:
+	return Grid(w, h)
@@ -0,0 +1,76 @@
+from typing import List
+import struct
+import sprite
+import civ
+import rng
+import zobrist
+import gaia
+
+# Packs a game position into a few hundred bytes, for shipping to worker processes and over the network.
+# (Model.marshall makes JSON-ready objects, which are much bigger and slower to rebuild.)
+# A blob holds the tiles, every civ and unit, whose turn it is, the turn number, and the random streams, but not the history.
+
+magic = b'GAIA'
+version = 1
+header = struct.Struct('<4sBBBBBIQQQ') # magic, version, w, h, number of civs, active civ, turn, seed, map stream, play stream
+civ_record = struct.Struct('<iiiBH') # food, wood, gold, flags (1 = alive, 2 = human), number of units
+unit_record = struct.Struct('<BBBBiB') # kind (see zobrist.unit_kinds), building state, x, y, life, flags (1 = exhausted, 2 = on a raft)
+unit_classes = [ getattr(sprite, name) for name in zobrist.unit_kinds ]
+
+def pack(model: gaia.Model) -> bytes:
+	terr = model.terr
+	parts: List[bytes] = [
+		header.pack(magic, version, terr.w, terr.h, len(model.civs), model.active_civ, model.turn, model.rng.seed, model.rng.map.state, model.rng.play.state),
+		bytes(t for row in terr.tiles for t in row),
+	]
+	for c in model.civs:
+		parts.append(civ_record.pack(c.food, c.wood, c.gold, (1 if c.alive else 0) | (2 if c.human else 0), len(c.population)))
+		for s in c.population:
+			state = s.state() if isinstance(s, sprite.Building) else 0
+			flags = (1 if s.exhausted else 0) | (2 if getattr(s, 'raft', False) else 0)
+			parts.append(unit_record.pack(zobrist.unit_kinds[type(s).__name__], state, s.tile[0], s.tile[1], s.life, flags))
+	return b''.join(parts)
+
+# Replaces the position in model with the one in a blob, and clears its history
+def unpack(model: gaia.Model, data: bytes) -> None:
+	tag, ver, w, h, num_civs, active_civ, turn, seed, map_state, play_state = header.unpack_from(data, 0)
+	if tag != magic or ver != version:
+		raise ValueError('Not a game blob, or an unsupported version')
+	pos = header.size
+	model.terr.unmarshall([ list(data[pos + y * w:pos + (y + 1) * w]) for y in range(h) ])
+	pos += w * h
+	model.civs = []
+	for i in range(num_civs):
+		food, wood, gold, flags, count = civ_record.unpack_from(data, pos)
+		pos += civ_record.size
+		c = civ.Civ(model.terr)
+		c.food, c.wood, c.gold = food, wood, gold
+		c.alive = (flags & 1) != 0
+		c.human = (flags & 2) != 0
+		for j in range(count):
+			kind, state, x, y, life, unit_flags = unit_record.unpack_from(data, pos)
+			pos += unit_record.size
+			s = unit_classes[kind]()
+			s.set_tile_and_pos((x, y), model.terr)
+			s.life = life
+			s.exhausted = (unit_flags & 1) != 0
+			if hasattr(s, 'raft'):
+				s.raft = (unit_flags & 2) != 0
+			if isinstance(s, sprite.Building):
+				for k in range(state):
+					s.upgrade()
+				s.exhausted = (unit_flags & 1) != 0 # (upgrading exhausts it)
+			c.population.append(s)
+		model.civs.append(c)
+	model.active_civ = active_civ
+	model.perspective_civ = active_civ
+	model.turn = turn
+	model.rng = rng.Rng(seed)
+	model.rng.map.state = map_state
+	model.rng.play.state = play_state
+	model.history = []
+	model.history_pos = 0
+	model.undone = []
+	model.rehash()
+	model.delta = None
+	model.deltas = []
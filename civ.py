@@ -1,15 +1,17 @@
-from typing import List, Deque, Tuple, Mapping, Any, Optional
+from typing import List, Tuple, Mapping, Any, Optional
 import pygame
 import terrain
 import sprite
-import random
 import targeter
-import collections
+import profiler
+import bitboard
 
 class Civ():
 	im_food = pygame.image.load("pics/game/food.png")
 	im_wood = pygame.image.load("pics/game/wood.png")
 	im_gold = pygame.image.load("pics/game/gold.png")
+	panel_x = 1200
+	panel_size = (352, 700)
 
 	def __init__(self, terr: terrain.Terrain) -> None:
 		self.alive = True
@@ -21,6 +23,8 @@ class Civ():
 		self.gold = 1
 		self.last_state: Mapping[str, Any] = {}
 		self.last_history_pos: int = 0
+		self.panel: Optional[pygame.Surface] = None
+		self.panel_key = (-1, -1, -1)
 
 	def marshall(self) -> Mapping[str, Any]:
 		return {
@@ -29,6 +33,7 @@ class Civ():
 			'food': self.food,
 			'wood': self.wood,
 			'gold': self.gold,
+			'human': self.human,
 		}
 
 	def unmarshall(self, ob: Mapping[str, Any], old_civ: Optional['Civ'] = None) -> None:
@@ -39,33 +44,15 @@ class Civ():
 		self.food = ob['food']
 		self.wood = ob['wood']
 		self.gold = ob['gold']
+		if 'human' in ob:
+			self.human = ob['human']
 		if old_civ is not None:
 			self.last_state = old_civ.last_state
 			self.last_history_pos = old_civ.last_history_pos
 
-	def place_starter_hut(self, civs: List['Civ']) -> None:
-		# Find a starting spot
-		candidates = self.terr.get_tile_spots([2, 3, 4, 5])
-		start_spot = (0, 0)
-		aloneness = 0
-		for attempt in range(12):
-			spot = candidates[random.randrange(len(candidates))]
-
-			# Approximate the closest sprite
-			closest_dist = 1000000
-			for civ in civs:
-				for s in civ.population:
-					crude_dist = (spot[0] - s.tile[0]) ** 2 + (spot[1] - s.tile[1]) ** 2
-					closest_dist = min(closest_dist, crude_dist)
-
-			# Evaluate the spot
-			if closest_dist > aloneness:
-				aloneness = closest_dist
-				start_spot = spot
-
-		# Place a hut
+	def place_starter_hut(self, spot: Tuple[int, int]) -> None:
 		hut = sprite.Building()
-		hut.set_tile_and_pos(start_spot, self.terr)
+		hut.set_tile_and_pos(spot, self.terr)
 		self.population.append(hut)
 
 	def set_last_state(self, state: Mapping[str, Any], history_pos: int) -> None:
@@ -95,33 +82,34 @@ class Civ():
 		if creature_count == 0 and (building_count == 0 or (self.food < 2 and farm_count == 0)):
 			self.alive = False
 
+	@profiler.timed('Civ.make_visibility_map')
 	def make_visibility_map(self) -> List[List[bool]]:
-		vis = [ [ False for x in range(16) ] for y in range(16) ]
-		for spr in self.population:
-			s = set()
-			q: Deque[Tuple[Tuple[int, int], int]] = collections.deque()
-			s.add(spr.tile)
-			q.append((spr.tile, 0))
-			vis[spr.tile[1]][spr.tile[0]] = True
-			while len(q) > 0:
-				spot, depth = q.popleft()
-				if depth < spr.visibility():
-					for neigh in terrain.Terrain.adjacent(spot):
-						if neigh in s:
-							continue # Already been there
-						vis[neigh[1]][neigh[0]] = True
-						s.add(neigh)
-						q.append((neigh, depth + 1))
+		return Civ.visibility_map([ (spr.tile, spr.visibility()) for spr in self.population ])
+
+	# Returns which tiles can be seen by units at the specified tiles with the specified visibility ranges
+	@staticmethod
+	def visibility_map(units: List[Tuple[Tuple[int, int], int]]) -> List[List[bool]]:
+		return bitboard.grid(terrain.Terrain.w, terrain.Terrain.h).to_rows(Civ.visibility_mask(units))
+
+	# Returns a bitboard (see bitboard.py) of the tiles that units at the specified tiles with the specified visibility ranges can see
+	@staticmethod
+	def visibility_mask(units: List[Tuple[Tuple[int, int], int]]) -> int:
+		g = bitboard.grid(terrain.Terrain.w, terrain.Terrain.h)
+		vis = 0
+		for tile, dist in units:
+			vis |= g.ball(tile[0], tile[1], dist)
 		return vis
 
 
-	def draw_resources(self, screen: pygame.Surface) -> None:
+	# Draws the food, wood, and gold icons onto a panel that is cached until the counts change
+	def render_resources(self) -> pygame.Surface:
+		panel = pygame.Surface(Civ.panel_size, pygame.SRCALPHA)
 		# Draw food
 		x = 1200
 		y = 10
 		im_rect = Civ.im_food.get_rect()
 		for i in range(min(self.food, 38)):
-			screen.blit(Civ.im_food, (x, y, x + im_rect.w, y + im_rect.h))
+			panel.blit(Civ.im_food, (x - Civ.panel_x, y, x - Civ.panel_x + im_rect.w, y + im_rect.h))
 			x += 43
 			if x > 1520:
 				x = 1200
@@ -134,7 +122,7 @@ class Civ():
 		y = 130
 		im_rect = Civ.im_wood.get_rect()
 		for i in range(min(self.wood, 36)):
-			screen.blit(Civ.im_wood, (x, y, x + im_rect.w, y + im_rect.h))
+			panel.blit(Civ.im_wood, (x - Civ.panel_x, y, x - Civ.panel_x + im_rect.w, y + im_rect.h))
 			x += 26
 			if x > 1520:
 				y += 46
@@ -145,8 +133,16 @@ class Civ():
 		y = 320
 		im_rect = Civ.im_gold.get_rect()
 		for i in range(min(self.gold, 37)):
-			screen.blit(Civ.im_gold, (x, y, x + im_rect.w, y + im_rect.h))
+			panel.blit(Civ.im_gold, (x - Civ.panel_x, y, x - Civ.panel_x + im_rect.w, y + im_rect.h))
 			x += 20
 			if x > 1520:
 				y += 46
 				x = 1200 + y // 2
+		return panel
+
+	def draw_resources(self, screen: pygame.Surface) -> None:
+		key = (self.food, self.wood, self.gold)
+		if self.panel is None or key != self.panel_key:
+			self.panel = self.render_resources()
+			self.panel_key = key
+		screen.blit(self.panel, (Civ.panel_x, 0))
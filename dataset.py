@@ -0,0 +1,229 @@
+from typing import List, Tuple, Dict, Mapping, Any, Optional
+import os
+import sys
+import json
+import glob
+import argparse
+import numpy as np
+import terrain
+import civ
+import gaia
+import actions
+import autosave
+import bitboard
+import zobrist
+
+# Encodes game positions as fixed-shape planes for training models, and stores many of them in shards of .npy files
+# that are memory-mapped when read, so a loader can pick any position without reading the rest into memory.
+#
+# Each position is seen by one civ (normally the one whose turn it is), which is always civ slot 0. The others follow in turn order.
+# Planes (uint8, one per channel, each h x w):
+#   0-4    one-hot tile types (water, forest, land, desert, mountain), zero under fog
+#   5      fog (tiles the civ cannot see)
+#   6-45   for each of max_civs civ slots: one-hot unit kinds (8, see zobrist.unit_kinds), life (up to 255), and exhausted
+# Scalars (int32): the turn, the number of civs, and for each civ slot its food, wood, gold, and whether it is alive.
+
+max_civs = 4
+terrain_channels = 5
+fog_channel = terrain_channels
+civ_channels = len(zobrist.unit_kinds) + 2
+channel_count = terrain_channels + 1 + max_civs * civ_channels
+scalar_count = 2 + max_civs * 4
+
+# Labels (int64): the action taken in the position (encoded, see actions.py), the outcome for the civ that took it
+# (1 for a win, -1 for a loss, 0 if the game did not finish), and the game it came from.
+label_count = 3
+
+def encode(model: gaia.Model, civ_index: int, planes: Optional[np.ndarray] = None, scalars: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+	h = terrain.Terrain.h
+	w = terrain.Terrain.w
+	if planes is None:
+		planes = np.zeros((channel_count, h, w), dtype = np.uint8)
+	else:
+		planes[:] = 0
+	if scalars is None:
+		scalars = np.zeros(scalar_count, dtype = np.int32)
+	else:
+		scalars[:] = 0
+	me = model.civs[civ_index]
+	visible = np.array(bitboard.grid(w, h).to_rows(civ.Civ.visibility_mask([ (s.tile, s.visibility()) for s in me.population ])))
+	tiles = np.array(model.terr.tiles)
+	for t in range(terrain_channels):
+		planes[t] = (tiles == t + 1) & visible
+	planes[fog_channel] = ~visible
+	num_civs = len(model.civs)
+	scalars[0] = model.turn
+	scalars[1] = num_civs
+	for i in range(min(num_civs, max_civs)):
+		ci = (civ_index + i) % num_civs
+		c = model.civs[ci]
+		base = terrain_channels + 1 + i * civ_channels
+		for s in c.population:
+			x, y = s.tile
+			if visible[y, x]:
+				planes[base + zobrist.unit_kinds[type(s).__name__], y, x] = 1
+				planes[base + len(zobrist.unit_kinds), y, x] = min(s.life, 255)
+				planes[base + len(zobrist.unit_kinds) + 1, y, x] = s.exhausted
+		scalars[2 + i * 4:6 + i * 4] = (c.food, c.wood, c.gold, c.alive)
+	return planes, scalars
+
+
+# Writes positions into shards in a dataset directory. Each shard is three .npy files (planes, scalars, and labels)
+# of at most shard_size positions. index.json lists the shards and how many positions each holds, and is rewritten
+# whenever a shard is finished, so a dataset can be read while more games are being added to it.
+# The last shard is trimmed to its positions on close, and the next writer starts a new shard after it.
+class ShardWriter():
+	def __init__(self, dirname: str, shard_size: int = 1 << 15) -> None:
+		self.dirname = dirname
+		self.shard_size = shard_size
+		os.makedirs(dirname, exist_ok = True)
+		self.index: Dict[str, Any] = { 'channels': channel_count, 'scalars': scalar_count, 'games': 0, 'shards': [] }
+		if os.path.exists(os.path.join(dirname, 'index.json')):
+			with open(os.path.join(dirname, 'index.json'), mode='rb') as file:
+				self.index = json.loads(file.read())
+		self.count = 0 # positions in the current shard
+		self.arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None # the memory maps of the current shard
+
+	def filename(self, name: str, part: str) -> str:
+		return os.path.join(self.dirname, name + '.' + part + '.npy')
+
+	def open_shard(self) -> None:
+		name = 'shard' + str(len(self.index['shards'])).zfill(4)
+		h = terrain.Terrain.h
+		w = terrain.Terrain.w
+		self.arrays = (
+			np.lib.format.open_memmap(self.filename(name, 'planes'), mode = 'w+', dtype = np.uint8, shape = (self.shard_size, channel_count, h, w)),
+			np.lib.format.open_memmap(self.filename(name, 'scalars'), mode = 'w+', dtype = np.int32, shape = (self.shard_size, scalar_count)),
+			np.lib.format.open_memmap(self.filename(name, 'labels'), mode = 'w+', dtype = np.int64, shape = (self.shard_size, label_count)),
+		)
+		self.index['shards'].append({ 'name': name, 'count': 0 })
+		self.count = 0
+
+	# Adds the positions of one game. planes, scalars, and labels hold one row per position.
+	def add_game(self, planes: np.ndarray, scalars: np.ndarray, labels: np.ndarray) -> None:
+		labels[:, 2] = self.index['games']
+		self.index['games'] += 1
+		done = 0
+		while done < len(planes):
+			if self.arrays is None:
+				self.open_shard()
+			assert self.arrays is not None
+			n = min(len(planes) - done, self.shard_size - self.count)
+			for dest, src in zip(self.arrays, (planes, scalars, labels)):
+				dest[self.count:self.count + n] = src[done:done + n]
+			self.count += n
+			done += n
+			self.index['shards'][-1]['count'] = self.count
+			if self.count == self.shard_size:
+				self.finish_shard()
+
+	def finish_shard(self) -> None:
+		if self.arrays is None:
+			return
+		for a in self.arrays:
+			a.flush()
+		self.arrays = None
+		autosave.write_atomically(os.path.join(self.dirname, 'index.json'), self.index)
+
+	# Rewrites the files of the current shard to hold only the positions in it, so a shard that is left partly filled
+	# does not take as much room as a full one. (Later positions go into a new shard.)
+	def trim_shard(self) -> None:
+		assert self.arrays is not None
+		name = self.index['shards'][-1]['name']
+		parts = ('planes', 'scalars', 'labels')
+		for i, part in enumerate(parts):
+			old = self.arrays[i]
+			trimmed = np.lib.format.open_memmap(self.filename(name, part) + '.tmp', mode = 'w+', dtype = old.dtype, shape = (self.count,) + old.shape[1:])
+			trimmed[:] = old[:self.count]
+			trimmed.flush()
+			del trimmed, old
+		self.arrays = None # (unmaps the old files, which Windows will not replace while they are mapped)
+		for part in parts:
+			os.replace(self.filename(name, part) + '.tmp', self.filename(name, part))
+
+	def close(self) -> None:
+		if self.arrays is not None and self.count < self.shard_size:
+			self.trim_shard()
+		if self.arrays is not None:
+			self.finish_shard()
+		else:
+			autosave.write_atomically(os.path.join(self.dirname, 'index.json'), self.index)
+
+
+# Reads a dataset that ShardWriter wrote. Positions are returned as read-only views into the memory-mapped shards,
+# so only the pages that are touched get read from disk.
+class Dataset():
+	def __init__(self, dirname: str) -> None:
+		with open(os.path.join(dirname, 'index.json'), mode='rb') as file:
+			self.index = json.loads(file.read())
+		self.shards: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+		for shard in self.index['shards']:
+			n = shard['count']
+			arrays = [ np.load(os.path.join(dirname, shard['name'] + '.' + part + '.npy'), mmap_mode = 'r') for part in ('planes', 'scalars', 'labels') ]
+			self.shards.append((arrays[0][:n], arrays[1][:n], arrays[2][:n]))
+		self.starts = np.cumsum([ 0 ] + [ len(shard[0]) for shard in self.shards ])
+
+	def __len__(self) -> int:
+		return int(self.starts[-1])
+
+	# Returns the planes, scalars, and labels of position i
+	def __getitem__(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+		if i < 0 or i >= len(self):
+			raise IndexError('position ' + str(i) + ' is not in the dataset')
+		s = int(np.searchsorted(self.starts, i, side = 'right')) - 1
+		j = i - int(self.starts[s])
+		planes, scalars, labels = self.shards[s]
+		return planes[j], scalars[j], labels[j]
+
+
+# Replays a recorded game and returns the planes, scalars, and labels of the position before each action, as seen by the civ that acted.
+# The game is rebuilt from its seed, so the history must start at the beginning of the game.
+def game_positions(seed: int, num_civs: int, history: List[Mapping[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+	m = gaia.Model()
+	m.display_mode = False
+	m.draws_canvas = False
+	m.start_game(num_civs, seed)
+	h = terrain.Terrain.h
+	w = terrain.Terrain.w
+	planes = np.zeros((len(history), channel_count, h, w), dtype = np.uint8)
+	scalars = np.zeros((len(history), scalar_count), dtype = np.int32)
+	labels = np.zeros((len(history), label_count), dtype = np.int64)
+	actors: List[int] = []
+	for i, ob in enumerate(history):
+		act = gaia.Action.unmarshall(ob)
+		encode(m, m.active_civ, planes[i], scalars[i])
+		labels[i, 0] = actions.encode(act.descr, act.doer, act.target)
+		actors.append(m.active_civ)
+		m.make(act)
+	standing = [ c.alive and len(c.population) > 0 for c in m.civs ]
+	if sum(standing) == 1:
+		labels[:, 1] = [ 1 if standing[a] else -1 for a in actors ]
+	return planes, scalars, labels
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description='Turns saved games into a dataset of encoded positions for training')
+	parser.add_argument('games', nargs='*', help='saved game files (each with its .history file next to it). (default: every game in the saves folder)')
+	parser.add_argument('--out', default='dataset', help='dataset directory (games are added to it if it already exists)')
+	parser.add_argument('--shard-size', type=int, default=1 << 15, help='positions per shard')
+	args = parser.parse_args()
+
+	filenames = args.games if len(args.games) > 0 else [ f for f in sorted(glob.glob(os.path.join('saves', '*.json'))) if not f.endswith('.history.json') and not f.endswith('index.json') ]
+	writer = ShardWriter(args.out, args.shard_size)
+	positions = 0
+	for filename in filenames:
+		history_filename = filename[:-len('.json')] + '.history.json'
+		with open(filename, mode='rb') as file:
+			state = json.loads(file.read())
+		if 'rng' not in state or not os.path.exists(history_filename):
+			print('skipping ' + filename + ' (it has no seed or no history)', file=sys.stderr)
+			continue
+		with open(history_filename, mode='rb') as file:
+			history = json.loads(file.read())
+		planes, scalars, labels = game_positions(state['rng']['seed'], len(state['civs']), history)
+		writer.add_game(planes, scalars, labels)
+		positions += len(planes)
+	writer.close()
+	print('added {} positions from {} games to {}'.format(positions, len(filenames), args.out), file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
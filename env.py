@@ -0,0 +1,127 @@
+from typing import List, Tuple, Dict, Sequence
+import numpy as np
+import gaia
+import actions
+import terrain
+import zobrist
+import profiler
+
+# Steps many independent games in lockstep, for reinforcement learning. It follows the Gym vector-environment
+# convention: reset(seeds) starts a game in every slot, and step(codes) does one action in each game and returns
+# the observations, the rewards, which games ended, and the legal actions. (Games that end are started again at once.)
+#
+# Like Gym's SyncVectorEnv, it is synchronous: the games themselves are not batched. Each slot is a headless gaia.Model,
+# and step does the actions one game at a time with Model.make, so the rules stay in one place and cannot drift apart
+# from the real game. Only what a learner reads (observations, rewards, dones and legal-action masks) is kept
+# in batched NumPy arrays, one row per game, and only the rows of the games that changed are rewritten.
+class SyncVecEnv():
+	max_units = 32 # units beyond this many in a civ cannot be picked as doers (their actions are not in the masks)
+	unit_types = { name: i + 1 for name, i in zobrist.unit_kinds.items() } # (0 means no unit)
+
+	def __init__(self, num_envs: int, num_civs: int = 2, max_actions: int = 2000) -> None:
+		self.num_envs = num_envs
+		self.num_civs = num_civs
+		self.max_actions = max_actions # games are cut off (and count as draws) after this many actions
+		self.action_count = (SyncVecEnv.max_units + 1) * len(actions.kinds) * actions.tile_count # (codes are encoded by actions.encode)
+		self.models: List[gaia.Model] = []
+		for i in range(num_envs):
+			m = gaia.Model()
+			m.display_mode = False
+			m.draws_canvas = False
+			self.models.append(m)
+		self.seeds = np.zeros(num_envs, dtype = np.int64)
+
+		# Observations
+		h = terrain.Terrain.h
+		w = terrain.Terrain.w
+		self.tiles = np.zeros((num_envs, h, w), dtype = np.int8) # tile types
+		self.units = np.zeros((num_envs, num_civs, h, w), dtype = np.int8) # unit types (see unit_types) of each civ
+		self.life = np.zeros((num_envs, num_civs, h, w), dtype = np.int16)
+		self.exhausted = np.zeros((num_envs, num_civs, h, w), dtype = bool)
+		self.resources = np.zeros((num_envs, num_civs, 3), dtype = np.int32) # food, wood, and gold
+		self.active = np.zeros(num_envs, dtype = np.int8) # the civ whose turn it is
+
+		# Results of the last step
+		self.rewards = np.zeros((num_envs, num_civs), dtype = np.float32)
+		self.dones = np.zeros(num_envs, dtype = bool)
+		self.masks = np.zeros((num_envs, self.action_count), dtype = bool)
+		self.legal: List[List[int]] = [ [] for i in range(num_envs) ]
+
+	# Starts a new game in every slot with the specified seeds. (The seed of each game is seeds[i] + num_envs * the number of games the slot has played before.)
+	def reset(self, seeds: Sequence[int]) -> Dict[str, np.ndarray]:
+		assert len(seeds) == self.num_envs
+		for i in range(self.num_envs):
+			self.seeds[i] = seeds[i]
+			self.start(i)
+		self.dones[:] = False
+		self.rewards[:] = 0.
+		return self.observations()
+
+	# Does one action (an encoded code from the legal actions) in every game. Returns the observations,
+	# the reward of each civ for this step (1 for winning, -1 for losing), and which games ended with this step.
+	@profiler.timed('SyncVecEnv.step')
+	def step(self, codes: Sequence[int]) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+		assert len(codes) == self.num_envs
+		self.rewards[:] = 0.
+		self.dones[:] = False
+		for i, code in enumerate(codes):
+			if code < 0 or code >= self.action_count or not self.masks[i, code]:
+				raise ValueError('Illegal action ' + str(code) + ' in game ' + str(i))
+			m = self.models[i]
+			m.make(actions.decode(int(code)))
+			profiler.count('env steps')
+			standing = [ c.alive and len(c.population) > 0 for c in m.civs ]
+			if sum(standing) <= 1 or len(m.history) >= self.max_actions:
+				if sum(standing) == 1:
+					self.rewards[i] = [ 1. if b else -1. for b in standing ]
+				self.dones[i] = True
+				self.seeds[i] += self.num_envs
+				self.start(i)
+			else:
+				for spot, t in m.deltas[-1].tiles:
+					self.tiles[i, spot[1], spot[0]] = m.terr.tile(spot)
+				self.observe(i)
+		return self.observations(), self.rewards, self.dones
+
+	# Returns the arrays that describe every game. (They are overwritten by the next step, so copy them to keep them.)
+	def observations(self) -> Dict[str, np.ndarray]:
+		return {
+			'tiles': self.tiles,
+			'units': self.units,
+			'life': self.life,
+			'exhausted': self.exhausted,
+			'resources': self.resources,
+			'active': self.active,
+			'legal': self.masks,
+		}
+
+	def start(self, i: int) -> None:
+		m = self.models[i]
+		m.start_game(self.num_civs, int(self.seeds[i]))
+		m.message = ''
+		self.tiles[i] = m.terr.tiles
+		self.observe(i)
+
+	# Rewrites the rows of game i, except for its tiles (which step updates as they change)
+	def observe(self, i: int) -> None:
+		m = self.models[i]
+		units = self.units[i]
+		life = self.life[i]
+		exhausted = self.exhausted[i]
+		units[:] = 0
+		life[:] = 0
+		exhausted[:] = False
+		for ci, c in enumerate(m.civs):
+			for s in c.population:
+				x, y = s.tile
+				units[ci, y, x] = SyncVecEnv.unit_types[type(s).__name__]
+				life[ci, y, x] = s.life
+				exhausted[ci, y, x] = s.exhausted
+			self.resources[i, ci] = (c.food, c.wood, c.gold)
+		self.active[i] = m.active_civ
+
+		# Legal actions
+		mask = self.masks[i]
+		mask[self.legal[i]] = False
+		self.legal[i] = [ code for code in actions.legal_actions(m) if code < self.action_count ]
+		mask[self.legal[i]] = True
@@ -1,4 +1,4 @@
-from typing import Tuple, List, Optional, Mapping, Any
+from typing import Tuple, List, Optional, Mapping, Any, Dict, Callable
 import pygame
 import pygame.locals as pg
 import terrain
@@ -9,9 +9,20 @@ import sprite
 import targeter
 import sys
 import json
-import random
-
-# random.seed(1234)
+import base64
+import cv2
+import profiler
+import rng
+import rebuilder
+import autosave
+import library
+import minimap
+import maps
+import zobrist
+import influence
+
+# The owned spots of each civ, and the visibility map of the perspective civ
+Board = Tuple[List[List[Tuple[int, int, bool]]], List[List[bool]]]
 
 class Action:
 	def __init__(self, descr: str, doer: int, target: Optional[Tuple[int, int]]) -> None:
@@ -45,13 +56,31 @@ class Action:
 			target = ( targ[0], targ[1] )
 		return Action(descr, doer, target)
 
+# The old values of everything an action changed, so it can be reversed (see Model.unmake).
+# Only what the action touched is recorded, so making and reversing a delta costs about as much as the action itself.
+class Delta:
+	def __init__(self, act: Action, model: 'Model') -> None:
+		self.act = act
+		self.active_civ = model.active_civ
+		self.perspective_civ = model.perspective_civ
+		self.turn = model.turn
+		self.play_state = model.rng.play.state
+		self.hash_key = model.hash_key
+		self.units: Dict[sprite.Sprite, Dict[str, Any]] = {} # the attributes of each touched unit
+		self.unit_keys: Dict[sprite.Sprite, Optional[int]] = {} # the hash key of each touched unit, or None if it was new
+		self.civs: Dict[int, Tuple[int, int, int, bool, Mapping[str, Any], int, int]] = {} # the resources, alive flag, last state, and hash key of each touched civ
+		self.tiles: List[Tuple[Tuple[int, int], int]] = [] # each changed tile with its old type, in order
+		self.population: List[Tuple[int, int, sprite.Sprite, bool]] = [] # (civ, index, unit, added) for each unit added to or removed from a civ, in order
+
 
 class Model(mvc.Model):
 	def __init__(self) -> None:
 		self.terr = terrain.Terrain()
+		self.rng = rng.Rng()
 		self.civs: List[civ.Civ] = []
 		self.active_civ = 0
 		self.perspective_civ = 0
+		self.turn = 1
 		self.pointer = sprite.Pointer()
 		self.selected_sprite: Optional[sprite.Sprite] = None
 		self.selected_index: int
@@ -64,20 +93,55 @@ class Model(mvc.Model):
 		self.history: List[Action] = []
 		self.history_pos = 0
 		self.display_mode = True
+		self.draws_canvas = True # (Models that are never shown, such as the ones AI and training play in, can skip rebuilding the canvas)
 		self.replay = False
-
-	def start_game(self, num_civs: int) -> None:
-		if num_civs > 4:
-			raise ValueError('Sorry, only up to 4 players are currently supported')
-		self.terr.generate_terrain()
-		self.terr.update_canvas([], [[ False for x in range(16) ] for y in range(16)])
+		self.rebuilder = rebuilder.CanvasRebuilder(self.terr)
+		self.saver = autosave.AutoSaver()
+		self.library = library.SaveLibrary('saves', self.saver)
+		self.minimap = minimap.Minimap(8)
+		self.thumbnailer = minimap.Minimap(4)
+		self.maps = maps.MapLibrary('maps')
+		self.influence = influence.InfluenceMaps()
+		self.computer_player: Optional[Callable[['Model'], Optional[Action]]] = None # picks actions for civs that are not human (and is asked on every turn if send_action is set), or returns None while it thinks
+		self.sees_all = False # whether the screen shows every civ's units (for spectators), not just what the perspective civ can see
+		self.send_action: Optional[Callable[[Action], bool]] = None # if set, actions the player at this screen takes go through it (to a game server), and are dropped if it returns False
+		self.requested_board: Optional[Board] = None
+		self.hash_key = 0 # the Zobrist hash of the position (see zobrist.py). It is kept up to date by do_action.
+		self.unit_keys: Dict[sprite.Sprite, int] = {} # the key each unit currently adds to the hash
+		self.civ_keys: List[int] = [] # the key each civ's resources currently add to the hash
+		self.rekeyed_units: Dict[sprite.Sprite, int] = {} # units taken out of the hash until the current action is done, with their civs
+		self.rekeyed_civs: List[int] = [] # civs taken out of the hash until the current action is done
+		self.delta: Optional[Delta] = None # what the current action has changed so far
+		self.deltas: List[Delta] = [] # what each action in the history up to history_pos changed (back to the last End, or further while searching)
+		self.searching = 0 # how many searches are walking the game tree with make and unmake. (While none is, deltas before the last End are dropped.)
+		self.undone: List[Action] = [] # actions taken back with undo, for redo
+
+	# Starts a new game. If seed is None, a map is picked from the map library (see maps.py),
+	# or if it has none for this many civs, a random seed is picked. (Either way, the seed is recorded in self.rng.seed.)
+	def start_game(self, num_civs: int, seed: Optional[int] = None) -> None:
+		picked = self.maps.pick(num_civs) if seed is None else None
+		if picked is None:
+			self.rng = rng.Rng(seed)
+			self.terr.generate_terrain(self.rng.map)
+			starts = self.terr.start_spots(num_civs, self.rng.map)
+		else:
+			seed, tiles, starts = picked
+			self.terr.unmarshall(tiles)
+			self.rng = rng.Rng(seed) # (The map stream is not used after the map is made, so skipping that does not change the game)
 		self.civs = []
 		for i in range(num_civs):
 			self.civs.append(civ.Civ(self.terr))
-		for c in self.civs:
-			c.place_starter_hut(self.civs)
+		for c, spot in zip(self.civs, starts):
+			c.place_starter_hut(spot)
 		self.active_civ = 0
 		self.perspective_civ = 0
+		self.turn = 1
+		self.history = []
+		self.history_pos = 0
+		self.delta = None
+		self.deltas = []
+		self.undone = []
+		self.rehash()
 		if len(self.civs) > 1:
 			self.message = 'Player 1, get ready!'
 
@@ -86,6 +150,8 @@ class Model(mvc.Model):
 			'terr': self.terr.marshall(),
 			'civs': [ civ.marshall() for civ in self.civs ],
 			'ac': self.active_civ,
+			'turn': self.turn,
+			'rng': self.rng.marshall(),
 		}
 
 	def unmarshall(self, ob: Mapping[str, Any]) -> None:
@@ -97,32 +163,225 @@ class Model(mvc.Model):
 			c.unmarshall(serialized, old_civs[i] if i < len(old_civs) else None)
 			self.civs.append(c)
 		self.active_civ = ob['ac']
+		if 'turn' in ob:
+			self.turn = ob['turn']
+		if 'rng' in ob:
+			self.rng = rng.Rng.unmarshall(ob['rng'])
+		self.rehash()
+		self.delta = None
+		self.deltas = []
+
+	# Computes the hash of the position from scratch
+	def rehash(self) -> None:
+		self.hash_key = zobrist.terrain_key(self.terr.tiles) ^ zobrist.active_key(self.active_civ)
+		self.unit_keys = {}
+		self.civ_keys = []
+		for i, c in enumerate(self.civs):
+			self.civ_keys.append(zobrist.civ_key(c, i))
+			self.hash_key ^= self.civ_keys[i]
+			for s in c.population:
+				self.unit_keys[s] = zobrist.unit_key(s, i)
+				self.hash_key ^= self.unit_keys[s]
+		self.rekeyed_units = {}
+		self.rekeyed_civs = []
+
+	# Called before the current action changes a unit. This records the unit in the action's delta and takes it out of the hash.
+	# When the action is done (including its animation), finish_action puts it back in the hash as a unit of the specified civ,
+	# or leaves it out if the civ is -1 (because it is gone).
+	def touch_unit(self, s: sprite.Sprite, civ_index: int) -> None:
+		if self.delta is not None and s not in self.delta.units:
+			self.delta.units[s] = dict(s.__dict__)
+			self.delta.unit_keys[s] = self.unit_keys.get(s)
+		self.hash_key ^= self.unit_keys.pop(s, 0)
+		self.rekeyed_units[s] = civ_index
+
+	# Called before the current action changes a civ's resources or alive flag
+	def touch_civ(self, civ_index: int) -> None:
+		if civ_index in self.rekeyed_civs:
+			return
+		c = self.civs[civ_index]
+		if self.delta is not None:
+			self.delta.civs[civ_index] = (c.food, c.wood, c.gold, c.alive, c.last_state, c.last_history_pos, self.civ_keys[civ_index])
+		self.hash_key ^= self.civ_keys[civ_index]
+		self.rekeyed_civs.append(civ_index)
+
+	def set_tile(self, spot: Tuple[int, int], t: int) -> None:
+		if self.delta is not None:
+			self.delta.tiles.append((spot, self.terr.tile(spot)))
+		self.hash_key ^= zobrist.tile_key(spot, self.terr.tile(spot)) ^ zobrist.tile_key(spot, t)
+		self.terr.set_tile(spot, t)
+
+	def add_unit(self, civ_index: int, s: sprite.Sprite) -> None:
+		pop = self.civs[civ_index].population
+		if self.delta is not None:
+			self.delta.population.append((civ_index, len(pop), s, True))
+		pop.append(s)
+
+	def remove_unit(self, civ_index: int, s: sprite.Sprite) -> None:
+		pop = self.civs[civ_index].population
+		i = pop.index(s)
+		if self.delta is not None:
+			self.delta.population.append((civ_index, i, s, False))
+		del pop[i]
+
+	# Called when the current action is done, including its animation
+	def finish_action(self) -> None:
+		for s, civ_index in self.rekeyed_units.items():
+			if civ_index >= 0:
+				self.unit_keys[s] = zobrist.unit_key(s, civ_index)
+				self.hash_key ^= self.unit_keys[s]
+		for civ_index in self.rekeyed_civs:
+			self.civ_keys[civ_index] = zobrist.civ_key(self.civs[civ_index], civ_index)
+			self.hash_key ^= self.civ_keys[civ_index]
+		self.rekeyed_units = {}
+		self.rekeyed_civs = []
+		if self.delta is not None:
+			if self.delta.act.descr == 'End' and self.searching == 0:
+				self.deltas = [] # (Undo cannot take back a turn, so nothing needs them)
+			self.deltas.append(self.delta)
+			self.delta = None
+
+	# If an action is being animated, skips to the end of it
+	def finish_animation(self) -> None:
+		if self.animating_sprite is not None:
+			self.animating_sprite.stop_animation()
+			self.animating_sprite = None
+			self.finish_action()
+
+	# Does an action at once, without animating it, and adds it to the history
+	def make(self, act: Action) -> None:
+		self.finish_animation()
+		self.history[self.history_pos:] = [ act ]
+		self.do_action(act)
+		self.history_pos += 1
+		self.finish_animation()
+
+	# Reverses the last action in the history, and removes it from the history. Together with make, this lets
+	# AI search walk the game tree in place, since a move and its reversal only cost as much as the things the move changed.
+	def unmake(self) -> Action:
+		self.finish_animation()
+		delta = self.deltas.pop()
+		for civ_index, i, s, added in reversed(delta.population):
+			if added:
+				del self.civs[civ_index].population[i]
+			else:
+				self.civs[civ_index].population.insert(i, s)
+		for spot, t in reversed(delta.tiles):
+			self.terr.set_tile(spot, t)
+		for s, attributes in delta.units.items():
+			s.__dict__.clear()
+			s.__dict__.update(attributes)
+			k = delta.unit_keys[s]
+			if k is None:
+				self.unit_keys.pop(s, None)
+			else:
+				self.unit_keys[s] = k
+		for civ_index, (food, wood, gold, alive, last_state, last_history_pos, k) in delta.civs.items():
+			c = self.civs[civ_index]
+			c.food, c.wood, c.gold, c.alive = food, wood, gold, alive
+			c.set_last_state(last_state, last_history_pos)
+			self.civ_keys[civ_index] = k
+		self.active_civ = delta.active_civ
+		self.perspective_civ = delta.perspective_civ
+		self.turn = delta.turn
+		self.rng.play.state = delta.play_state
+		self.hash_key = delta.hash_key
+		self.history_pos -= 1
+		return self.history.pop(self.history_pos)
+
+	# Takes back the last action of this turn, for the undo key. Returns whether there was one.
+	# (Turns cannot be taken back this way, since the next player may have seen the board, and nor can actions already sent to a game server.)
+	def undo(self) -> bool:
+		if len(self.message) > 0 or self.replay or self.history_pos < len(self.history) or not self.civs[self.active_civ].human or self.send_action is not None:
+			return False
+		if len(self.deltas) == 0 or self.deltas[-1].act.descr == 'End':
+			return False
+		self.undone.append(self.unmake())
+		self.clear_selection()
+		self.request_canvas()
+		return True
+
+	# Does again the last action that was taken back with undo. Returns whether there was one.
+	def redo(self) -> bool:
+		if len(self.message) > 0 or self.replay or self.history_pos < len(self.history) or len(self.undone) == 0:
+			return False
+		self.clear_selection()
+		self.history.append(self.undone.pop())
+		return True
+
+	# Saves the game state and history into a new slot of the save library, in the background.
+	# (They are snapshotted here, so the game can carry on right away.) Autosaves are pruned by the library's retention policy.
+	def save_game(self, name: str = 'Autosave', auto: bool = True) -> str:
+		with profiler.span('Model.save_game snapshot'):
+			state = self.marshall()
+			history = [ act.marshall() for act in self.history ]
+			meta = {
+				'turn': self.turn,
+				'civs': len(self.civs),
+				'active': self.active_civ,
+				'resources': [ [ c.food, c.wood, c.gold ] for c in self.civs ],
+				'thumb': self.thumbnail(),
+			}
+		return self.library.save(name, auto, state, history, meta)
 
-	def save_game(self) -> None:
-        # Save game state
-		ob = self.marshall()
-		b = bytes(json.dumps(ob), 'utf8')
-		with open('game.json', mode='wb+') as file:
-			file.write(b)
-
-        # Save the history
-		hist = [ act.marshall() for act in self.history ]
-		b = bytes(json.dumps(hist), 'utf8')
-		with open('history.json', mode='wb+') as file:
-			file.write(b)
-
-	def load_game(self) -> None:
-		filecontents = None
-		with open('game.json', mode='rb') as file:
-			filecontents = file.read()
-		ob = json.loads(filecontents)
+	# Returns a small map of the board as the perspective civ sees it, as base64-encoded PNG
+	def thumbnail(self) -> str:
+		self.thumbnailer.update(self.terr.tiles, self.owned_spots(), self.visibility)
+		return str(base64.b64encode(cv2.imencode('.png', self.thumbnailer.buffer)[1].tobytes()), 'ascii')
+
+	def load_game(self, slot: str) -> None:
+		ob, history = self.library.load(slot)
 		self.unmarshall(ob)
+		self.history = [ Action.unmarshall(act) for act in history ]
+		self.history_pos = len(self.history)
 		self.update_canvas()
 
+	# Rebuilds the canvas and waits for it
+	@profiler.timed('Model.update_canvas')
 	def update_canvas(self) -> None:
-		self.visibility = self.civs[self.perspective_civ].make_visibility_map()
-		self.terr.update_canvas(self.owned_spots(), self.visibility)
-		self.canvas = image.to_pygame_surface(self.terr.canvas)
+		self.request_canvas()
+		self.swap_canvas(self.rebuilder.wait())
+
+	# Starts rebuilding the canvas on a worker thread, and returns right away. (See board for what the arguments mean.)
+	# The previous canvas stays on the screen until update swaps in the new one.
+	def request_canvas(self,
+		moves: Optional[Mapping[sprite.Sprite, Tuple[int, int]]] = None,
+		removed: Optional[sprite.Sprite] = None,
+		captured: Optional[sprite.Sprite] = None,
+	) -> None:
+		if not self.draws_canvas:
+			return
+		profiler.count('canvas rebuilds')
+		board = self.board(moves, removed, captured)
+		self.requested_board = board
+		self.rebuilder.request(board[0], board[1])
+
+	def swap_canvas(self, frame: Optional[Tuple[pygame.Surface, List[List[bool]]]]) -> bool:
+		if frame is None:
+			return False
+		self.canvas, self.visibility = frame
+		return True
+
+	# Returns the owned spots and the perspective civ's visibility map, as the board will be once the current animation finishes.
+	# moves maps sprites to the tiles they are headed for, removed is a sprite that is about to be killed,
+	# and captured is a sprite that is about to join the active civilization.
+	def board(self,
+		moves: Optional[Mapping[sprite.Sprite, Tuple[int, int]]] = None,
+		removed: Optional[sprite.Sprite] = None,
+		captured: Optional[sprite.Sprite] = None,
+	) -> Board:
+		if moves is None:
+			moves = {}
+		owned: List[List[Tuple[int, int, bool]]] = []
+		units: List[Tuple[Tuple[int, int], int]] = []
+		for i, c in enumerate(self.civs):
+			members = [ s for s in c.population if s is not removed and s is not captured ]
+			if i == self.active_civ and captured is not None:
+				members.append(captured)
+			owned.append([ moves.get(s, s.tile) + (s.exhausted,) for s in members ])
+			if i == self.perspective_civ or self.sees_all:
+				units += [ (moves.get(s, s.tile), s.visibility()) for s in members ]
+		return owned, civ.Civ.visibility_map(units)
 
 	# Returns a list of all the sprites on the screen, sorted from back to front for display purposes
 	def sorted_visible_sprites(self) -> List[sprite.Sprite]:
@@ -183,22 +442,30 @@ class Model(mvc.Model):
 		return owned
 
 	def update(self) -> bool:
+		swapped = self.swap_canvas(self.rebuilder.poll())
 		if len(self.message) > 0:
-			return False
+			return swapped
 		elif self.animating_sprite is None:
 			if self.history_pos < len(self.history):
 				self.do_action(self.history[self.history_pos])
 				self.history_pos += 1
 			else:
 				self.replay = False
+				if self.computer_player is not None and (not self.civs[self.active_civ].human or self.send_action is not None):
+					act = self.computer_player(self)
+					if act is not None:
+						self.history.append(act)
 		else:
 			if self.animating_sprite.animate():
 				self.animating_sprite = None # animation done
-				self.update_canvas()
+				self.finish_action()
+				if self.draws_canvas and self.board() != self.requested_board:
+					self.request_canvas() # (The rebuild requested when the action started did not predict this board)
 			return True # invalidate the view
-		return False # don't invalidate the view
+		return swapped # only invalidate the view if a new canvas was swapped in
 
 	def spawn_sprite(self, origin: sprite.Sprite, spr: sprite.Sprite) -> None:
+		self.touch_unit(origin, self.active_civ)
 		if origin.is_building():
 			sm = targeter.Targeter(self.terr, self.civs)
 			spot = sm.nearest_open_spot(origin.tile, self.terr, allow_water=False)
@@ -212,7 +479,8 @@ class Model(mvc.Model):
 			spot = origin.tile
 			spr.exhausted = True
 		assert spot is not None
-		self.civs[self.active_civ].population.append(spr)
+		self.touch_unit(spr, self.active_civ)
+		self.add_unit(self.active_civ, spr)
 		if origin.is_building():
 			# animate
 			spr.set_tile_and_pos(origin.tile, self.terr)
@@ -220,15 +488,21 @@ class Model(mvc.Model):
 			self.animating_sprite = spr
 			self.animating_sprite.start_animation((dest_x, dest_y + 149), sprite.Animation.move, lambda: self.animating_sprite.set_tile_and_pos(spot, self.terr)) # type: ignore
 			self.animating_sprite.exhausted = True
+			self.request_canvas({ spr: spot })
 		else:
 			# just appear
 			spr.set_tile_and_pos(spot, self.terr)
-			self.update_canvas()
+			self.request_canvas()
+
+	# Whether civs keep the state their last turn ended in, for the replay that change_perspective shows the next human player.
+	# Only a hot-seat game on the screen needs them, so searches and headless games skip marshalling the board every turn.
+	def keeps_last_states(self) -> bool:
+		return self.display_mode and self.searching == 0 and sum(1 for c in self.civs if c.human) > 1
 
 	def change_perspective(self) -> None:
 		self.update_canvas()
 		self.save_game()
-		if len(self.civs) > 1:
+		if sum(1 for c in self.civs if c.human) > 1:
 			self.message = 'Player ' + str(self.active_civ + 1) + ', get ready!'
 			civ = self.civs[self.active_civ]
 			if civ.human and 'civs' in civ.last_state:
@@ -241,6 +515,10 @@ class Model(mvc.Model):
 				print('no replay for civ ' + str(self.active_civ) + '. human? ' + str(civ.human) + ', backup? ' + str('civs' in civ.last_state))
 
 	def do_action(self, act: Action) -> None:
+		profiler.count('actions')
+		self.delta = Delta(act, self)
+		if act.descr != 'End':
+			self.touch_civ(self.active_civ) # (for its resources)
 		civ = self.civs[self.active_civ]
 		doer: sprite.Sprite = civ.population[act.doer]
 		# if self.replay:
@@ -248,23 +526,35 @@ class Model(mvc.Model):
 		# print('Civ ' + str(self.active_civ) + ' tile ' + str(doer.tile) + ' action ' + str(act.descr) + ', history_pos=' + str(self.history_pos))
 		if act.descr == 'End':
 			for spr in civ.population:
+				self.touch_unit(spr, self.active_civ)
 				spr.exhausted = False
 			prev_civ = self.active_civ
+			self.touch_civ(prev_civ) # (for its last state)
 			while True:
 				self.active_civ += 1
 				if self.active_civ >= len(self.civs):
 					self.active_civ = 0
-				civ.start_turn(self.civs, self.active_civ)
-				if civ.alive:
+				next_civ = self.civs[self.active_civ]
+				for spr in next_civ.population:
+					self.touch_unit(spr, self.active_civ)
+				self.touch_civ(self.active_civ)
+				next_civ.start_turn(self.civs, self.active_civ)
+				if next_civ.alive or self.active_civ == prev_civ: # (if every civ starved, the turn stays with the one that ended it)
 					break
-			self.perspective_civ = self.active_civ
-			if len(self.civs) > 1 and not self.replay:
+			self.hash_key ^= zobrist.active_key(prev_civ) ^ zobrist.active_key(self.active_civ)
+			if self.active_civ <= prev_civ:
+				self.turn += 1
+			if next_civ.human or self.sees_all:
+				self.perspective_civ = self.active_civ # (Computer players' turns are watched from the last human player's perspective)
+			if self.keeps_last_states() and self.civs[prev_civ].human and not self.replay:
 				state = self.marshall()
 				self.civs[prev_civ].set_last_state(state, len(self.history))
-			if self.display_mode and not self.replay:
+			self.finish_action()
+			if self.display_mode and not self.replay and next_civ.human:
 				self.change_perspective()
 		elif act.descr == 'move':
 			assert act.target
+			self.touch_unit(doer, self.active_civ)
 			tx, ty = self.terr.tile_to_pixel(act.target[0], act.target[1])
 			self.targets.clear()
 			self.menu.clear()
@@ -274,22 +564,34 @@ class Model(mvc.Model):
 				civ.wood -= 1
 			self.animating_sprite.start_animation((tx, ty + 149), sprite.Animation.move, lambda: self.animating_sprite.set_tile_and_pos(act.target, self.terr)) # type: ignore
 			self.animating_sprite.exhausted = True
+			self.request_canvas({ doer: act.target })
 		elif act.descr == 'attack':
 			assert act.target
 			opponent = self.find_opponent(act.target)
 			assert opponent is not None
+			self.touch_unit(doer, self.active_civ)
 			tx, ty = self.terr.tile_to_pixel(act.target[0], act.target[1])
 			self.targets.clear()
 			self.menu.clear()
 			self.animating_sprite = doer
+			moves: Dict[sprite.Sprite, Tuple[int, int]] = {}
+			removed: Optional[sprite.Sprite] = None
+			captured: Optional[sprite.Sprite] = None
 			if opponent.is_creature():
 				if self.animating_sprite.get_attack_strength() >= opponent.life:
 					self.animating_sprite.start_animation((tx, ty + 149), sprite.Animation.kill, lambda: self.kill_opponent(self.animating_sprite, opponent), opponent) # type: ignore
+					moves[doer] = opponent.tile
+					removed = opponent
+					self.touch_unit(opponent, -1)
 				else:
+					self.touch_unit(opponent, next(i for i, c in enumerate(self.civs) if opponent in c.population))
 					self.animating_sprite.start_animation((tx, ty + 149), sprite.Animation.strike, lambda: self.animating_sprite.strike_opponent(opponent, self.animating_sprite.tile, self.terr)) # type: ignore
 			else:
 				self.animating_sprite.start_animation((tx, ty + 149), sprite.Animation.strike, lambda: self.capture_opponent(self.animating_sprite, opponent), opponent) # type: ignore
+				captured = opponent
+				self.touch_unit(opponent, self.active_civ)
 			self.animating_sprite.exhausted = True
+			self.request_canvas(moves, removed, captured)
 		elif act.descr == 'gnome':
 			if civ.food >= 2:
 				civ.food -= 2
@@ -309,55 +611,65 @@ class Model(mvc.Model):
 		elif act.descr == 'fort':
 			if civ.wood >= 5:
 				civ.wood -= 5
+				self.touch_unit(doer, self.active_civ)
 				doer.upgrade() # type: ignore
-				self.update_canvas()
+				self.request_canvas()
 		elif act.descr == 'castle':
 			if civ.wood >= 8:
 				civ.wood -= 8
+				self.touch_unit(doer, self.active_civ)
 				doer.upgrade() # type: ignore
-				self.update_canvas()
+				self.request_canvas()
 		elif act.descr == 'hut':
 			if civ.wood >= 1:
 				civ.wood -= 1
 				assert doer is not None
 				self.spawn_sprite(doer, sprite.Building())
-				civ.population.remove(doer)
-				self.update_canvas()
+				self.touch_unit(doer, -1)
+				self.remove_unit(self.active_civ, doer)
+				self.request_canvas()
 		elif act.descr == 'chop':
-			land_tile = self.terr.random_tile([3])
+			land_tile = self.terr.random_tile([3], self.rng.play)
 			if land_tile is not None:
-				self.terr.set_tile(land_tile, 2) # grow new forest on random land tile
+				self.set_tile(land_tile, 2) # grow new forest on random land tile
 			assert doer is not None
+			self.touch_unit(doer, self.active_civ)
 			doer.exhausted = True
-			self.terr.set_tile(doer.tile, 3) # change this forest tile to land
+			self.set_tile(doer.tile, 3) # change this forest tile to land
 			civ.wood += 3
-			self.update_canvas()
+			self.request_canvas()
 		elif act.descr == 'plant':
 			assert doer is not None
+			self.touch_unit(doer, self.active_civ)
 			doer.exhausted = True
-			self.terr.set_tile(doer.tile, 2) # change this land tile to forest
-			self.update_canvas()
+			self.set_tile(doer.tile, 2) # change this land tile to forest
+			self.request_canvas()
 		elif act.descr == 'farm':
 			if civ.wood >= 2:
 				civ.wood -= 2
 				assert doer is not None
 				self.spawn_sprite(doer, sprite.Farm())
-				civ.population.remove(doer)
-				self.update_canvas()
+				self.touch_unit(doer, -1)
+				self.remove_unit(self.active_civ, doer)
+				self.request_canvas()
 		elif act.descr == 'trebuchet':
 			if civ.gold >= 3:
 				civ.gold -= 3
 				assert doer is not None
 				self.spawn_sprite(doer, sprite.Trebuchet())
-				civ.population.remove(doer)
+				self.touch_unit(doer, -1)
+				self.remove_unit(self.active_civ, doer)
 		elif act.descr == 'mine':
 			if civ.wood >= 3:
 				civ.wood -= 3
 				assert doer is not None
 				self.spawn_sprite(doer, sprite.Mine())
-				civ.population.remove(doer)
+				self.touch_unit(doer, -1)
+				self.remove_unit(self.active_civ, doer)
 		else:
 			raise ValueError('Unrecognized action: ' + act.descr)
+		if act.descr != 'End' and self.animating_sprite is None:
+			self.finish_action()
 
 	def clear_selection(self) -> None:
 		self.targets.clear()
@@ -376,17 +688,16 @@ class Model(mvc.Model):
 		attacker.set_tile_and_pos(victim.tile, self.terr)
 		attacker.life += 1
 		victim.life = 0
-		for civ in self.civs:
+		for i, civ in enumerate(self.civs):
 			if victim in civ.population:
-				civ.population.remove(victim)
+				self.remove_unit(i, victim)
 
 	def capture_opponent(self, attacker: sprite.Sprite, victim: sprite.Sprite) -> None:
 		attacker.set_tile_and_pos(attacker.tile, self.terr)
-		for civ in self.civs:
+		for i, civ in enumerate(self.civs):
 			if victim in civ.population:
-				civ.population.remove(victim)
-		self.civs[self.active_civ].population.append(victim)
-		self.update_canvas()
+				self.remove_unit(i, victim)
+		self.add_unit(self.active_civ, victim)
 
 	def select_sprite(self, s: sprite.Sprite, index: int) -> None:
 		self.move_pointer(s.pos)
@@ -427,7 +738,7 @@ class Model(mvc.Model):
 				y += 75
 
 	def on_mouse_down(self, pos: Tuple[int, int]) -> None:
-		if len(self.message) > 0:
+		if len(self.message) > 0 or not self.civs[self.active_civ].human:
 			return
 		if self.animating_sprite is not None:
 			self.animating_sprite.stop_animation()
@@ -444,23 +755,33 @@ class Model(mvc.Model):
 				if s.is_button():
 					self.pushed_button = s # type: ignore
 				elif s.is_move_target():
-					self.history.append(Action('move', self.selected_index, s.tile))
+					self.add_player_action(Action('move', self.selected_index, s.tile))
 				elif s.is_attack_target():
-					self.history.append(Action('attack', self.selected_index, s.tile))
+					self.add_player_action(Action('attack', self.selected_index, s.tile))
 				else:
 					self.select_sprite(s, index)
 
+	# Queues an action that the player at this screen took
+	def add_player_action(self, act: Action) -> None:
+		if self.send_action is not None:
+			if self.history_pos < len(self.history) or not self.send_action(act):
+				return
+		self.history.append(act)
+		self.undone.clear()
+
 	def on_mouse_up(self, pos: Tuple[int, int]) -> None:
 		if len(self.message) > 0:
 			self.message = ''
 			return
+		if not self.civs[self.active_civ].human:
+			return
 		s, index = self.find_sprite(pos)
 		if s is not None:
 			if s is self.pushed_button:
 				n = s.text.find(' ') # type: ignore
 				descr = s.text if n < 0 else s.text[:n] # type: ignore
 				prev_player = self.active_civ
-				self.history.append(Action(descr, self.selected_index, None))
+				self.add_player_action(Action(descr, self.selected_index, None))
 				self.pushed_button.on_mouse_up()
 				self.pushed_button = None
 				self.clear_selection()
@@ -491,6 +812,9 @@ class View(mvc.View):
 	def __init__(self, model: Model) -> None:
 		super().__init__(model)
 		self.dirty = True
+		self.show_profile = False
+		self.show_minimap = True
+		self.show_danger = False
 		self.model = model
 		self.model.update_canvas()
 
@@ -510,6 +834,9 @@ class View(mvc.View):
 			# Game play
 			self.screen.fill([0, 0, 0])
 			self.screen.blit(self.model.canvas, (0, 149, 1552, 873))
+			if self.show_danger:
+				m = self.model
+				self.screen.blit(m.influence.overlay(m.hash_key, m.terr, m.civs, m.perspective_civ, m.visibility), (0, 149))
 			sprites = self.model.sorted_visible_sprites()
 			self.model.pointer.draw_back(self.screen)
 			for s in sprites:
@@ -524,19 +851,42 @@ class View(mvc.View):
 			if self.model.selected_sprite is not None and self.model.selected_sprite.is_creature():
 				self.model.selected_sprite.draw_life(self.screen) # type: ignore
 			self.model.pointer.draw(self.screen)
-		pygame.display.flip()
+			if self.show_minimap:
+				mm = self.model.minimap.update(self.model.terr.tiles, self.model.owned_spots(), self.model.visibility)
+				self.screen.blit(mm, (1542 - mm.get_width(), 863 - mm.get_height()))
+		if self.show_profile:
+			profiler.draw_overlay(self.screen)
+		with profiler.span('pygame.display.flip'):
+			pygame.display.flip()
 		self.dirty = False
 
 class Controller(mvc.Controller):
-	def __init__(self, num_civs: int) -> None:
+	# Starts a new game with num_civs human civilizations and the specified number of computer ones (which computer_player plays),
+	# or if num_civs is 0, loads the game in the specified slot of the save library
+	def __init__(self,
+		num_civs: int,
+		seed: Optional[int] = None,
+		slot: Optional[str] = None,
+		computers: int = 0,
+		computer_player: Optional[Callable[[Model], Optional[Action]]] = None,
+	) -> None:
 		self.model = Model()
+		self.model.computer_player = computer_player
 		if num_civs == 0:
-			self.model.load_game()
+			assert slot is not None
+			self.model.load_game(slot)
 		else:
-			self.model.start_game(num_civs)
+			self.model.start_game(num_civs + computers, seed)
+			for c in self.model.civs[num_civs:]:
+				c.human = False
+		sprite.units.preload(len(self.model.civs))
 		self.view = View(self.model)
 		super().__init__(self.view)
 
+	def run(self) -> None:
+		super().run()
+		self.model.saver.flush()
+
 	def update(self) -> None:
 		for event in pygame.event.get():
 			if event.type == pg.QUIT:
@@ -544,6 +894,25 @@ class Controller(mvc.Controller):
 			elif event.type == pg.KEYDOWN:
 				if event.key == pg.K_ESCAPE:
 					self.keep_going = False
+				elif event.key == pg.K_F3:
+					self.view.show_profile = not self.view.show_profile
+					profiler.enable(self.view.show_profile)
+					self.view.dirty = True
+				elif event.key == pg.K_m:
+					self.view.show_minimap = not self.view.show_minimap
+					self.view.dirty = True
+				elif event.key == pg.K_d:
+					self.view.show_danger = not self.view.show_danger
+					self.view.dirty = True
+				elif event.key == pg.K_F5:
+					self.model.save_game('Saved game', False)
+					self.model.message = 'Saved'
+					self.view.dirty = True
+				elif event.key == pg.K_z and event.mod & pg.KMOD_CTRL:
+					if self.model.undo():
+						self.view.dirty = True
+				elif event.key == pg.K_y and event.mod & pg.KMOD_CTRL:
+					self.model.redo()
 			elif event.type == pygame.MOUSEBUTTONDOWN:
 				self.view.dirty = True
 				self.model.on_mouse_down(pygame.mouse.get_pos())
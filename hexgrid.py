@@ -0,0 +1,54 @@
+from typing import List, Tuple
+import functools
+import cv2
+import numpy as np
+
+# Vectorized operations on hex grids stored as NumPy arrays indexed [..., y, x].
+# Like Terrain.adjacent, odd columns sit half a tile lower than even columns, so tile (x, y) touches
+# (x, y - 1) and (x, y + 1), (x - 1, y) and (x + 1, y), and also (x - 1, y - 1) and (x + 1, y - 1) if x is even,
+# or (x - 1, y + 1) and (x + 1, y + 1) if x is odd.
+
+# Returns six arrays, each holding every tile's neighbor in one direction. Neighbors beyond the edge get fill.
+def neighbors(a: np.ndarray, fill: float) -> List[np.ndarray]:
+	h, w = a.shape[-2:]
+	p = np.full(a.shape[:-2] + (h + 2, w + 2), fill, dtype = a.dtype)
+	p[..., 1:h + 1, 1:w + 1] = a
+	even = (np.arange(w) & 1) == 0
+	up_left = np.where(even, p[..., 0:h, 0:w], p[..., 1:h + 1, 0:w])
+	down_left = np.where(even, p[..., 1:h + 1, 0:w], p[..., 2:h + 2, 0:w])
+	up_right = np.where(even, p[..., 0:h, 2:w + 2], p[..., 1:h + 1, 2:w + 2])
+	down_right = np.where(even, p[..., 1:h + 1, 2:w + 2], p[..., 2:h + 2, 2:w + 2])
+	return [ p[..., 0:h, 1:w + 1], p[..., 2:h + 2, 1:w + 1], up_left, down_left, up_right, down_right ]
+
+# Returns how many tiles each tile averages with in smooth
+@functools.lru_cache(maxsize = 8)
+def smooth_counts(h: int, w: int) -> np.ndarray:
+	return 1 + sum(neighbors(np.ones((h, w)), 0.))
+
+# Returns the average of each tile and its neighbors. (Tiles on the edge only average the neighbors they have.)
+def smooth(a: np.ndarray) -> np.ndarray:
+	return (a + sum(neighbors(a, 0.))) / smooth_counts(a.shape[-2], a.shape[-1])
+
+# Labels the connected groups of True tiles in mask.
+# Returns the number of groups and an array that holds the group of each tile (1 to the number of groups), or 0 for False tiles.
+def label(mask: np.ndarray) -> Tuple[int, np.ndarray]:
+	# Stretch each tile over two rows, starting a row lower in odd columns. Then tiles that share an edge
+	# on the hex grid are exactly the tiles that share an edge on this grid, so OpenCV's 4-connected labeling works.
+	h, w = mask.shape
+	tall = np.zeros((2 * h + 1, w), dtype = np.uint8)
+	odd = (np.arange(w) & 1) == 1
+	doubled = np.repeat(mask.astype(np.uint8), 2, axis = 0)
+	tall[0:2 * h, ~odd] = doubled[:, ~odd]
+	tall[1:2 * h + 1, odd] = doubled[:, odd]
+	count, labels = cv2.connectedComponents(tall, connectivity = 4)
+	rows = 2 * np.arange(h)[:, np.newaxis] + odd[np.newaxis, :]
+	return count - 1, labels[rows, np.arange(w)[np.newaxis, :]]
+
+# Returns the distance in steps from every tile to the tile (x, y)
+def distance_from(x: int, y: int, w: int, h: int) -> np.ndarray:
+	xs = np.arange(w)[np.newaxis, :]
+	ys = np.arange(h)[:, np.newaxis]
+	# Convert to cube coordinates, where the distance is the largest difference along the three axes
+	dq = xs - x
+	dr = (ys - (xs - (xs & 1)) // 2) - (y - (x - (x & 1)) // 2)
+	return np.maximum(np.maximum(np.abs(dq), np.abs(dr)), np.abs(dq + dr))
@@ -10,6 +10,7 @@ import statistics
 import math
 import csv
 import pygame
+import profiler
 
 # Input: a source image and perspective transform
 # Output: a warped image and 2 translation terms
@@ -29,6 +30,32 @@ def perspective_warp(image: np.ndarray, transform: np.ndarray) -> Tuple[np.ndarr
     corrected_transform = np.matmul(translate, transform)
     return cv2.warpPerspective(image, corrected_transform, (math.ceil(xmax - xmin), math.ceil(ymax - ymin))), x_adj, y_adj
 
+# Like perspective_warp, but it returns where the top-left corner of the warped image lands instead of
+# an adjustment to the transform's translation terms. (This also works for transforms with perspective terms.)
+def perspective_warp_to(image: np.ndarray, transform: np.ndarray) -> Tuple[np.ndarray, int, int]:
+    h, w = image.shape[:2]
+    corners_bef = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+    corners_aft = cv2.perspectiveTransform(corners_bef, transform)
+    xmin = math.floor(corners_aft[:, 0, 0].min())
+    ymin = math.floor(corners_aft[:, 0, 1].min())
+    xmax = math.ceil(corners_aft[:, 0, 0].max())
+    ymax = math.ceil(corners_aft[:, 0, 1].max())
+    translate = np.eye(3)
+    translate[0, 2] = -xmin
+    translate[1, 2] = -ymin
+    corrected_transform = np.matmul(translate, transform)
+    return cv2.warpPerspective(image, corrected_transform, (xmax - xmin, ymax - ymin)), xmin, ymin
+
+# Like perspective_warp_to, but for a 4-channel image. The colors are interpolated with premultiplied alpha,
+# so the transparent pixels around the edges do not bleed dark fringes into the result.
+def perspective_warp_to4(image: np.ndarray, transform: np.ndarray) -> Tuple[np.ndarray, int, int]:
+    alpha = image[:, :, 3:4].astype(np.float32)
+    premultiplied = np.concatenate([image[:, :, 0:3].astype(np.float32) * alpha / 255., alpha], axis = 2)
+    warped, x, y = perspective_warp_to(premultiplied, transform)
+    warped_alpha = warped[:, :, 3:4]
+    colors = warped[:, :, 0:3] * 255. / np.maximum(warped_alpha, 1e-3)
+    return np.clip(np.concatenate([colors, warped_alpha], axis = 2), 0, 255).astype(np.uint8), x, y
+
 # Just like perspective_warp, but it also returns an alpha mask that can be used for blitting
 def perspective_warp_with_mask(image: np.ndarray, transform: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int, int]:
     mask_in = np.empty(image.shape, dtype = np.uint8)
@@ -38,6 +65,7 @@ def perspective_warp_with_mask(image: np.ndarray, transform: np.ndarray) -> Tupl
     return output, mask, x_adj, y_adj
 
 # alpha_blits a 4-channel image onto a 3-channel image
+@profiler.timed('image.blit4')
 def blit4(dest: np.ndarray, src: np.ndarray, x: int, y: int) -> None:
     dl = max(x, 0)
     dt = max(y, 0)
@@ -70,6 +98,7 @@ def perspective_blit(dest: np.ndarray, src: np.ndarray, transform: np.ndarray) -
     alpha_blit(dest, blitme, mask, int(transform[0, 2] + x_adj), int(transform[1, 2] + y_adj))
 
 # blits a 4-channel perspective-warped src image onto a 3-channel dest
+@profiler.timed('image.perspective_blit4')
 def perspective_blit4(dest: np.ndarray, src: np.ndarray, transform: np.ndarray) -> None:
     blitme, x_adj, y_adj = perspective_warp(src, transform)
     blit4(dest, blitme, int(transform[0, 2] + x_adj), int(transform[1, 2] + y_adj))
@@ -129,8 +158,23 @@ def adjust_lighting(image: np.ndarray, b: float, g: float, r: float) -> np.ndarr
     lut = np.concatenate([lut_b, lut_g, lut_r], axis = 1).reshape([256, 1, 3])
     return cv2.LUT(image, lut)
 
+# Tints the input image by scaling each color channel through a lookup table. b, g, and r are gains centered at 1.
+# If the image has an alpha channel, it is left unchanged.
+def tint(image: np.ndarray, b: float, g: float, r: float) -> np.ndarray:
+    lut_b = np.expand_dims(np.clip(np.arange(256) * b, 0, 255).astype('uint8'), 1)
+    lut_g = np.expand_dims(np.clip(np.arange(256) * g, 0, 255).astype('uint8'), 1)
+    lut_r = np.expand_dims(np.clip(np.arange(256) * r, 0, 255).astype('uint8'), 1)
+    lut = np.concatenate([lut_b, lut_g, lut_r], axis = 1).reshape([256, 1, 3])
+    colors = cv2.LUT(np.ascontiguousarray(image[:, :, 0:3]), lut)
+    if image.shape[2] == 3:
+        return colors
+    return np.concatenate([colors, image[:, :, 3:]], axis = 2)
+
+# Wraps a 3-channel BGR image in a pygame surface without copying or converting it.
+# The surface shares memory with the image, so later changes to the image show up in the surface.
 def to_pygame_surface(image: np.ndarray) -> pygame.Surface:
-    return pygame.surfarray.make_surface(cv2.cvtColor(np.transpose(image, axes=(1, 0, 2)), cv2.COLOR_BGR2RGB))
+    h, w = image.shape[:2]
+    return pygame.image.frombuffer(np.ascontiguousarray(image), (w, h), 'BGR')
 
 def scale_pg_image(image: pygame.image, scale: float) -> pygame.image:
     r = image.get_rect()
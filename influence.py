@@ -0,0 +1,117 @@
+from typing import List, Tuple, Optional
+import functools
+import numpy as np
+import cv2
+import pygame
+import terrain
+import civ
+import hexgrid
+import bitboard
+import profiler
+
+# Influence and threat maps. Most of each is a convolution of the units with a kernel that depends only on hex distance,
+# done for all the civs at once as a matrix product with a tile-to-tile kernel (which is made once per board size).
+#   threat[c, y, x] is the total attack strength that civ c's units could bring against tile (x, y) next turn, if nothing
+#     stood in their way. Units that can shoot reach every tile in range. Units that cannot shoot cannot attack across water,
+#     so their reach is flooded over land from their tile instead (as in Targeter.get_attack_targets), and stops at the shore.
+#   influence[c, y, x] is how strongly civ c is present around tile (x, y): each unit adds 1 on its own tile, and half as much for each step away.
+
+max_range = 8 # (longer attack ranges are cut to this)
+falloff = 0.5
+
+# Returns the distance in steps between every pair of tiles, indexed [y0 * w + x0, y1 * w + x1]
+@functools.lru_cache(maxsize = 4)
+def distances(w: int, h: int) -> np.ndarray:
+	return np.stack([ hexgrid.distance_from(x, y, w, h).reshape(-1) for y in range(h) for x in range(w) ])
+
+# Returns the tile-to-tile kernel of an attack of each range (1 for the tiles from 1 to range steps away)
+@functools.lru_cache(maxsize = 4)
+def reach_kernels(w: int, h: int) -> np.ndarray:
+	d = distances(w, h)
+	return np.stack([ ((d >= 1) & (d <= r)).astype(np.float32) for r in range(max_range + 1) ])
+
+@functools.lru_cache(maxsize = 4)
+def influence_kernel(w: int, h: int) -> np.ndarray:
+	return (falloff ** distances(w, h)).astype(np.float32)
+
+# Returns the tiles (1 for each, indexed [y * w + x]) that a unit on the specified tile can reach over land in 1 to steps steps.
+# land is a bitboard of the tiles that are not water.
+@functools.lru_cache(maxsize = 4096)
+def land_reach(w: int, h: int, land: int, tile: int, steps: int) -> np.ndarray:
+	g = bitboard.grid(w, h)
+	origin = 1 << tile
+	reached = 0
+	for layer in g.flood(origin, land | origin, land, steps)[1:]:
+		reached |= layer
+	return np.array(g.to_rows(reached), dtype = np.float32).reshape(-1)
+
+# Computes the threat and influence maps of every civ. If seen is specified, only units on tiles where it is True count.
+def compute(terr: terrain.Terrain, civs: List[civ.Civ], seen: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+	w = terr.w
+	h = terr.h
+	sources = np.zeros((2, max_range + 1, len(civs), w * h), dtype = np.float32) # attack strength by [can shoot, range, civ, tile]
+	presence = np.zeros((len(civs), w * h), dtype = np.float32)
+	for ci, c in enumerate(civs):
+		for s in c.population:
+			x, y = s.tile
+			if seen is not None and not seen[y, x]:
+				continue
+			presence[ci, y * w + x] += 1.
+			r = min(s.attack_range(), max_range)
+			strength = s.get_attack_strength()
+			if r > 0 and strength > 0:
+				sources[int(s.can_shoot()), r, ci, y * w + x] += strength
+	kernels = reach_kernels(w, h)
+	threat = np.zeros((len(civs), w * h), dtype = np.float32)
+	for r in np.nonzero(sources[1].any(axis = (1, 2)))[0]:
+		threat += sources[1, r] @ kernels[r]
+	land = bitboard.grid(w, h).full & ~terr.masks()[1]
+	for r, tile in zip(*np.nonzero(sources[0].any(axis = 1))):
+		threat += np.outer(sources[0, r, :, tile], land_reach(w, h, land, int(tile), int(r)))
+	influence = presence @ influence_kernel(w, h)
+	return threat.reshape(len(civs), h, w), influence.reshape(len(civs), h, w)
+
+
+# The danger overlay of a game, remade only when the board (as told by Model.hash_key) or the perspective changes.
+# Anything else that needs the maps can call compute.
+class InfluenceMaps():
+	overlay_color = (255, 40, 0)
+	overlay_max_alpha = 150
+	overlay_full_threat = 8. # threat that gets the most opaque color
+
+	def __init__(self) -> None:
+		self.overlay_key: Tuple[int, int] = (-1, -1)
+		self.overlay_surface: Optional[pygame.Surface] = None
+		self.outlines: Optional[np.ndarray] = None
+
+	# Returns a transparent surface the size of the canvas that shades each tile by the threat to a civ from the enemy units it can see.
+	# (Unseen units are left out, so the overlay does not give them away.)
+	@profiler.timed('InfluenceMaps.overlay')
+	def overlay(self, key: int, terr: terrain.Terrain, civs: List[civ.Civ], civ_index: int, visibility: List[List[bool]]) -> pygame.Surface:
+		if self.overlay_surface is not None and self.overlay_key == (key, civ_index):
+			return self.overlay_surface
+		threat = compute(terr, civs, np.array(visibility))[0]
+		danger = threat.sum(axis = 0) - threat[civ_index]
+		if self.outlines is None:
+			self.outlines = InfluenceMaps.tile_outlines(terr)
+		surface = pygame.Surface(terr.canvas_size, pygame.SRCALPHA)
+		alpha = np.minimum(1., danger / InfluenceMaps.overlay_full_threat) * InfluenceMaps.overlay_max_alpha
+		for y, x in zip(*np.nonzero(danger)):
+			pygame.draw.polygon(surface, InfluenceMaps.overlay_color + (int(alpha[y, x]),), self.outlines[y * terr.w + x])
+		self.overlay_surface = surface
+		self.overlay_key = (key, civ_index)
+		return surface
+
+	# Returns the six corners of every tile on the canvas, indexed [y * w + x]
+	@staticmethod
+	def tile_outlines(terr: terrain.Terrain) -> np.ndarray:
+		qw = terr.qw * terr.scale
+		hh = terr.hh * terr.scale
+		hexagon = [ (-2 * qw, 0.), (-qw, -hh), (qw, -hh), (2 * qw, 0.), (qw, hh), (-qw, hh) ]
+		points = []
+		for y in range(terr.h):
+			for x in range(terr.w):
+				xx, yy = terr.corner(x, y)
+				points += [ [ [ 2 * qw + xx + dx, hh + yy + dy ] ] for dx, dy in hexagon ]
+		outlines = cv2.perspectiveTransform(np.float32(points), terr.transform)
+		return outlines.reshape(terr.w * terr.h, 6, 2).astype(np.int32)
@@ -0,0 +1,83 @@
+from typing import Dict, List, Tuple, Mapping, Any, Optional
+import os
+import json
+import time
+import autosave
+
+# A directory of saved games with many slots. Each slot has a game file and a history file,
+# and index.json holds a little metadata about every slot (turn, civs, resources, timestamp, and a thumbnail),
+# so the load menu can list all the saves without opening any of the game files.
+class SaveLibrary():
+	max_autosaves = 10 # only this many of the newest autosaves are kept. (Named saves are kept until they are deleted.)
+
+	def __init__(self, dirname: str = 'saves', saver: Optional[autosave.AutoSaver] = None) -> None:
+		self.dirname = dirname
+		self.saver = saver if saver is not None else autosave.AutoSaver()
+		self.index: Optional[Dict[str, Any]] = None # (loaded when first needed)
+
+	def filename(self, name: str) -> str:
+		return os.path.join(self.dirname, name + '.json')
+
+	def read_index(self) -> Dict[str, Any]:
+		if self.index is None:
+			self.index = { 'next': 1, 'slots': {} }
+			if os.path.exists(self.filename('index')):
+				with open(self.filename('index'), mode='rb') as file:
+					self.index = json.loads(file.read())
+		return self.index
+
+	# Returns (slot, metadata) for every save, newest first
+	def slots(self) -> List[Tuple[str, Mapping[str, Any]]]:
+		return sorted(self.read_index()['slots'].items(), key = lambda item: -item[1]['time'])
+
+	# Saves a game into a new slot and returns the slot's name. state and history should be snapshots
+	# that nothing else will change, because they are written in the background.
+	# meta is the metadata to list (to which the name, timestamp, and whether it is an autosave get added).
+	def save(self, name: str, auto: bool, state: Mapping[str, Any], history: List[Mapping[str, Any]], meta: Mapping[str, Any]) -> str:
+		os.makedirs(self.dirname, exist_ok = True)
+		current = self.read_index()
+		slot = ('auto' if auto else 'save') + str(current['next']).zfill(4)
+		current['next'] += 1
+		entry = dict(meta)
+		entry['name'] = name
+		entry['auto'] = auto
+		entry['time'] = time.time()
+		current['slots'][slot] = entry
+		files = {
+			self.filename(slot): lambda: state,
+			self.filename(slot + '.history'): lambda: history,
+		}
+		for old in self.expired():
+			del current['slots'][old]
+			files[self.filename(old)] = None
+			files[self.filename(old + '.history')] = None
+		index = { 'next': current['next'], 'slots': dict(current['slots']) } # (snapshot it, because the writer reads it later)
+		files[self.filename('index')] = lambda: index # (written last, so it never lists a slot whose files are not there yet)
+		self.saver.save(files)
+		return slot
+
+	def delete(self, slot: str) -> None:
+		current = self.read_index()
+		del current['slots'][slot]
+		index = { 'next': current['next'], 'slots': dict(current['slots']) }
+		self.saver.save({
+			self.filename('index'): lambda: index, # (written first, so it never lists a slot whose files are gone)
+			self.filename(slot): None,
+			self.filename(slot + '.history'): None,
+		})
+
+	# Returns the slots that the retention policy says to delete
+	def expired(self) -> List[str]:
+		autosaves = [ slot for slot, meta in self.slots() if meta['auto'] ]
+		return autosaves[SaveLibrary.max_autosaves:]
+
+	# Returns the game state and the history of actions in the specified slot
+	def load(self, slot: str) -> Tuple[Mapping[str, Any], List[Mapping[str, Any]]]:
+		self.saver.flush()
+		with open(self.filename(slot), mode='rb') as file:
+			state = json.loads(file.read())
+		history: List[Mapping[str, Any]] = []
+		if os.path.exists(self.filename(slot + '.history')):
+			with open(self.filename(slot + '.history'), mode='rb') as file:
+				history = json.loads(file.read())
+		return state, history
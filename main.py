@@ -1,4 +1,4 @@
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, Mapping, Any
 import mvc
 import pygame
 import pygame.locals as pg
@@ -10,15 +10,76 @@ import numpy as np
 import image
 import sprite
 import gaia
+import ai
+import server
+import profiler
+import library
+import io
+import base64
+import datetime
+import argparse
+import os
+import sys
+
+searcher: Optional[ai.Searcher] = None
+
+# Returns the computer player, starting its worker processes the first time a game needs them
+def computer_player() -> ai.Searcher:
+	global searcher
+	if searcher is None:
+		searcher = ai.Searcher(args.ai_processes, args.ai_budget)
+	return searcher
+
+# A button in the load menu. It shows a thumbnail of the saved game and a line about it.
+class SlotButton(sprite.Button):
+	font = pygame.font.Font('freesansbold.ttf', 20)
+
+	def __init__(self, pos: Tuple[int, int], slot: str, meta: Mapping[str, Any]) -> None:
+		super().__init__(pos, meta['name'])
+		self.slot = slot
+		self.thumb = pygame.image.load(io.BytesIO(base64.b64decode(meta['thumb'])), 'thumb.png')
+		when = datetime.datetime.fromtimestamp(meta['time']).strftime('%Y-%m-%d %H:%M')
+		resources = meta['resources'][meta['active']]
+		descr = '{}, turn {}, {} player{}, player {} has {} food, {} wood, {} gold'.format(
+			when, meta['turn'], meta['civs'], '' if meta['civs'] == 1 else 's', meta['active'] + 1, resources[0], resources[1], resources[2])
+		self.descr_image = SlotButton.font.render(descr, True, (0, 0, 0))
+
+	def draw(self, screen: pygame.Surface) -> None:
+		super().draw(screen)
+		r = self.rect()
+		screen.blit(self.thumb, (r[2] + 20, r[1] + 3))
+		screen.blit(self.descr_image, (r[2] + 104, r[1] + 26))
 
 class Model(mvc.Model):
+	slots_per_page = 8
+
 	def __init__(self) -> None:
 		self.sprites: List[sprite.Sprite] = []
+		self.show_main_menu()
+
+	def show_main_menu(self) -> None:
+		self.sprites = []
 		self.sprites.append(sprite.Button((200, 100), 'Load'))
 		self.sprites.append(sprite.Button((800, 300), '1 Player'))
 		self.sprites.append(sprite.Button((800, 400), '2 Players Hot Seat'))
 		self.sprites.append(sprite.Button((800, 500), '3 Players Hot Seat'))
 		self.sprites.append(sprite.Button((800, 600), '4 Players Hot Seat'))
+		self.sprites.append(sprite.Button((800, 700), 'Versus Computer'))
+
+	# Lists a page of saved games, newest first. (This only reads the library's index, not the saved games.)
+	def show_load_menu(self, page: int) -> None:
+		self.page = page
+		slots = library.SaveLibrary().slots()
+		self.sprites = []
+		self.sprites.append(sprite.Button((200, 100), 'Back'))
+		if page > 0:
+			self.sprites.append(sprite.Button((1300, 100), 'Newer'))
+		if (page + 1) * Model.slots_per_page < len(slots):
+			self.sprites.append(sprite.Button((1300, 820), 'Older'))
+		y = 200
+		for slot, meta in slots[page * Model.slots_per_page:(page + 1) * Model.slots_per_page]:
+			self.sprites.append(SlotButton((200, y), slot, meta))
+			y += 80
 
 	def update(self) -> bool:
 		return False
@@ -37,23 +98,36 @@ class Model(mvc.Model):
 
 	def do_action(self, action: str) -> None:
 		if action == 'Load':
-			c = gaia.Controller(0)
-			c.run()
+			self.show_load_menu(0)
+		elif action == 'Back':
+			self.show_main_menu()
+		elif action == 'Newer':
+			self.show_load_menu(self.page - 1)
+		elif action == 'Older':
+			self.show_load_menu(self.page + 1)
 		elif action == '1 Player':
-			c = gaia.Controller(1)
+			c = gaia.Controller(1, args.seed)
 			c.run()
 		elif action == '2 Players Hot Seat':
-			c = gaia.Controller(2)
+			c = gaia.Controller(2, args.seed)
 			c.run()
 		elif action == '3 Players Hot Seat':
-			c = gaia.Controller(3)
+			c = gaia.Controller(3, args.seed)
 			c.run()
 		elif action == '4 Players Hot Seat':
-			c = gaia.Controller(4)
+			c = gaia.Controller(4, args.seed)
+			c.run()
+		elif action == 'Versus Computer':
+			c = gaia.Controller(1, args.seed, computers = args.computers, computer_player = computer_player().think)
 			c.run()
 		else:
 			raise ValueError('Unrecognized action: ' + action)
 
+	def load(self, slot: str) -> None:
+		c = gaia.Controller(0, slot = slot, computer_player = lambda m: computer_player().think(m)) # (only started if the game has computer civs)
+		c.run()
+		self.show_main_menu()
+
 class View(mvc.View):
 	def __init__(self, model: Model) -> None:
 		self.model = model
@@ -88,11 +162,49 @@ class Controller(mvc.Controller):
 				s = self.model.find_sprite(mpos)
 				if s:
 					s.on_mouse_up()
-					if s.is_button():
+					if isinstance(s, SlotButton):
+						self.model.load(s.slot)
+					elif s.is_button():
 						self.model.do_action(s.text) # type: ignore
 			elif event.type == pygame.MOUSEMOTION:
 				pass
 		keys = pygame.key.get_pressed()
 
-c = Controller()
-c.run()
+if __name__ == '__main__': # (the computer player's worker processes may import this module)
+	parser = argparse.ArgumentParser(description='A little turn-taking conquest game')
+	parser.add_argument('--trace', metavar='FILE', help='write a Chrome trace-event JSON file of the timed spans when the game exits')
+	parser.add_argument('--seed', type=int, help='seed for the map and gameplay random numbers of new games')
+	parser.add_argument('--threads', type=int, help='number of threads used to composite the terrain canvas (default: up to 8, one per core)')
+	parser.add_argument('--computers', type=int, default=1, help='number of computer players in a game versus the computer')
+	parser.add_argument('--ai-processes', type=int, default=os.cpu_count() or 1, help='number of worker processes the computer player searches with (default: one per core)')
+	parser.add_argument('--ai-budget', type=float, default=1., help='seconds the computer player thinks about each action')
+	parser.add_argument('--connect', metavar='HOST[:PORT]', help='play at a game server (see server.py) instead of showing the menu')
+	parser.add_argument('--seat', type=int, default=1, help='which player to be at the game server')
+	parser.add_argument('--token', help='the token the game server gave this seat, to take it again after quitting')
+	parser.add_argument('--watch', metavar='HOST[:PORT]', help='watch a game at a game server (live or recorded) instead of showing the menu')
+	args = parser.parse_args()
+	if args.trace:
+		profiler.start_trace(args.trace)
+	if args.threads:
+		terrain.Terrain.set_render_threads(args.threads)
+
+	if args.connect or args.watch:
+		host, _, port = (args.connect or args.watch).partition(':')
+		remote: server.RemoteGame
+		if args.connect:
+			remote = server.NetPlayer(host, int(port) if len(port) > 0 else server.default_port, args.seat - 1, args.token)
+		else:
+			remote = server.Spectator(host, int(port) if len(port) > 0 else server.default_port)
+		seed, num_civs = remote.wait_for_game()
+		if args.connect:
+			print('to rejoin this seat later, add --token ' + str(remote.client.token), file=sys.stderr)
+		game = gaia.Controller(num_civs, seed)
+		remote.attach(game.model)
+		game.run()
+		remote.close()
+	else:
+		c = Controller()
+		c.run()
+	if searcher is not None:
+		searcher.close()
+	profiler.save_trace()
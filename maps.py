@@ -0,0 +1,140 @@
+from typing import List, Tuple, Dict, Mapping, Any, Optional
+import os
+import sys
+import json
+import heapq
+import random
+import argparse
+import concurrent.futures
+import numpy as np
+import terrain
+import hexgrid
+import autosave
+import rng
+
+# A generated map: its score, seed, number of civs, start features, tiles, and start spots
+Candidate = Tuple[float, int, int, List[List[int]], List[List[int]], List[Tuple[int, int]]]
+
+# A library of pre-generated maps that were picked for being fair. The index lists every map with its seed,
+# number of civs, and score, and each map's tiles and start spots are in a file of their own.
+class MapLibrary():
+	def __init__(self, dirname: str = 'maps') -> None:
+		self.dirname = dirname
+		self.index: Optional[Dict[str, Any]] = None # (loaded when first needed)
+
+	def filename(self, name: str) -> str:
+		return os.path.join(self.dirname, name + '.json')
+
+	def entries(self) -> List[Dict[str, Any]]:
+		if self.index is None:
+			self.index = { 'maps': [] }
+			if os.path.exists(self.filename('index')):
+				with open(self.filename('index'), mode='rb') as file:
+					self.index = json.loads(file.read())
+		return self.index['maps']
+
+	# Returns the seed, tiles, and start spots of a random map for num_civs civs, or None if there are none
+	def pick(self, num_civs: int) -> Optional[Tuple[int, List[List[int]], List[Tuple[int, int]]]]:
+		candidates = [ entry for entry in self.entries() if entry['civs'] == num_civs ]
+		if len(candidates) == 0:
+			return None
+		entry = random.SystemRandom().choice(candidates)
+		with open(self.filename(entry['name']), mode='rb') as file:
+			ob = json.loads(file.read())
+		return entry['seed'], ob['tiles'], [ (spot[0], spot[1]) for spot in ob['starts'] ]
+
+	# Adds maps to the library, then keeps only the best few for each number of civs.
+	def add(self, maps: List[Candidate], keep: int) -> None:
+		os.makedirs(self.dirname, exist_ok = True)
+		entries = self.entries()
+		for score, seed, num_civs, features, tiles, starts in maps:
+			name = str(num_civs) + '-' + str(seed)
+			if any(entry['name'] == name for entry in entries):
+				continue
+			autosave.write_atomically(self.filename(name), { 'tiles': tiles, 'starts': [ list(spot) for spot in starts ] })
+			entries.append({ 'name': name, 'seed': seed, 'civs': num_civs, 'score': score, 'features': features })
+		kept: List[Dict[str, Any]] = []
+		for num_civs in sorted(set(entry['civs'] for entry in entries)):
+			best = sorted([ entry for entry in entries if entry['civs'] == num_civs ], key = lambda entry: -entry['score'])
+			kept += best[:keep]
+			for entry in best[keep:]:
+				os.remove(self.filename(entry['name']))
+		self.index = { 'maps': kept }
+		autosave.write_atomically(self.filename('index'), self.index)
+
+
+# How to score the fairness of a map
+reach_radius = 5 # land within this many steps of a start, on the same island, counts as reachable
+nearby_radius = 3 # tiles within this many steps of a start count as nearby
+
+# Returns the features of each start: its reachable land, and its nearby forest, desert, and mountain tiles
+def start_features(tiles: np.ndarray, starts: List[Tuple[int, int]]) -> np.ndarray:
+	h, w = tiles.shape
+	count, islands = hexgrid.label(tiles >= 2)
+	features = np.zeros((len(starts), 4), dtype = np.intp)
+	for i, (x, y) in enumerate(starts):
+		dist = hexgrid.distance_from(x, y, w, h)
+		nearby = dist <= nearby_radius
+		features[i, 0] = np.count_nonzero((dist <= reach_radius) & (islands == islands[y, x]) & (tiles >= 2))
+		features[i, 1] = np.count_nonzero(nearby & (tiles == 2))
+		features[i, 2] = np.count_nonzero(nearby & (tiles == 4))
+		features[i, 3] = np.count_nonzero(nearby & (tiles == 5))
+	return features
+
+# Scores a map (higher is fairer). Each feature that differs between starts costs its spread relative to its mean.
+# Starts with little reachable land, or with no forest, desert, or mountain nearby, cost extra, and starts that are far apart earn a little.
+def fairness(tiles: np.ndarray, starts: List[Tuple[int, int]], features: np.ndarray) -> float:
+	h, w = tiles.shape
+	spread = features.max(axis = 0) - features.min(axis = 0)
+	imbalance = float(np.sum(spread / (features.mean(axis = 0) + 1.)))
+	cramped = float(np.sum(np.maximum(0, 12 - features[:, 0]))) / 12.
+	starved = 0.5 * np.count_nonzero(features[:, 1:] == 0)
+	closest = min([ int(hexgrid.distance_from(x, y, w, h)[starts[j][1], starts[j][0]]) for i, (x, y) in enumerate(starts) for j in range(i) ] + [ w + h ])
+	return -imbalance - cramped - starved + 0.1 * closest
+
+# Makes the map that Model.start_game would make for num_civs civs with this seed, and scores it
+def make_map(seed: int, num_civs: int) -> Candidate:
+	terr = terrain.Terrain()
+	r = rng.Rng(seed)
+	terr.generate_terrain(r.map)
+	starts = terr.start_spots(num_civs, r.map)
+	tiles = np.array(terr.tiles)
+	features = start_features(tiles, starts)
+	return fairness(tiles, starts, features), seed, num_civs, features.tolist(), terr.tiles, starts
+
+def make_maps(seeds: List[int], num_civs: int) -> List[Candidate]:
+	return [ make_map(seed, num_civs) for seed in seeds ]
+
+# Generates and scores count maps in a process pool, and returns the best keep of them
+def generate(first_seed: int, count: int, num_civs: int, keep: int, processes: Optional[int]) -> List[Candidate]:
+	batch = 64
+	best: List[Candidate] = [] # (a min-heap on score)
+	with concurrent.futures.ProcessPoolExecutor(max_workers = processes) as pool:
+		batches = [ list(range(first_seed + i, min(first_seed + count, first_seed + i + batch))) for i in range(0, count, batch) ]
+		for results in pool.map(make_maps, batches, [ num_civs ] * len(batches)):
+			for result in results:
+				if len(best) < keep:
+					heapq.heappush(best, result)
+				else:
+					heapq.heappushpop(best, result)
+	return sorted(best, reverse = True)
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description='Generates many maps in parallel and keeps the fairest ones in the map library, where new games get their maps')
+	parser.add_argument('--count', type=int, default=2000, help='number of maps to generate for each number of civs')
+	parser.add_argument('--civs', type=int, nargs='+', default=[2, 3, 4], help='numbers of civs to make maps for')
+	parser.add_argument('--keep', type=int, default=50, help='number of maps to keep in the library for each number of civs')
+	parser.add_argument('--seed', type=int, help='first seed to try (default: random)')
+	parser.add_argument('--processes', type=int, help='number of worker processes (default: one per core)')
+	parser.add_argument('--dir', default='maps', help='map library directory')
+	args = parser.parse_args()
+
+	first_seed = args.seed if args.seed is not None else random.SystemRandom().randrange(1 << 62)
+	library = MapLibrary(args.dir)
+	for num_civs in args.civs:
+		best = generate(first_seed, args.count, num_civs, args.keep, args.processes)
+		library.add(best, args.keep)
+		print('{} civs: best score {:.2f}, worst kept {:.2f}'.format(num_civs, best[0][0], best[-1][0]), file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
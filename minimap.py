@@ -0,0 +1,63 @@
+from typing import List, Tuple
+import itertools
+import numpy as np
+import pygame
+import terrain
+import atlas
+import image
+import profiler
+
+# Returns the average color (in BGR order) of the opaque part of a tile picture
+def tile_color(pic: np.ndarray) -> Tuple[int, int, int]:
+	opaque = pic[pic[:, :, 3] > 128]
+	b, g, r = np.mean(opaque[:, :3], axis = 0)
+	return (int(b), int(g), int(r))
+
+# Draws the board as a small flat map with a block of cell x cell pixels per tile. Odd columns are shifted down
+# by half a block, like the hex grid. It only indexes a color table with NumPy and repeats the colors into blocks,
+# so it costs microseconds and never touches the terrain canvas.
+class Minimap():
+	tile_colors = [ tile_color(pic) for pic in terrain.Terrain.images ]
+	background = (0, 0, 0)
+
+	# cell is the width and height of a tile in pixels. It must be even.
+	def __init__(self, cell: int) -> None:
+		assert cell % 2 == 0
+		w = terrain.Terrain.w
+		h = terrain.Terrain.h
+		self.w = w
+		self.cell = cell
+		self.colors = np.array(Minimap.tile_colors + [ Minimap.background ], dtype = np.uint8) # civ colors get appended as needed
+
+		# The map is made of blocks that are half a tile tall and one tile wide.
+		# For each block, this is the index of the tile it shows in a flattened grid. (Index w * h is an extra cell for the background.)
+		col = np.arange(w)[np.newaxis, :]
+		half_row = np.arange(2 * h + 1)[:, np.newaxis]
+		row = (half_row - (col & 1)) // 2
+		self.block_cells = np.where((row >= 0) & (row < h), row * w + col, w * h)
+		self.cells = np.zeros(w * h + 1, dtype = np.intp)
+		self.cells[w * h] = len(Minimap.tile_colors)
+
+		self.buffer = np.zeros(((2 * h + 1) * cell // 2, w * cell, 3), dtype = np.uint8)
+		self.surface = image.to_pygame_surface(self.buffer)
+
+	# Draws the specified board into self.buffer (which self.surface shares) and returns the surface.
+	# Tiles that are not visible are drawn as fog, and tiles with a visible unit in the color of its civ.
+	@profiler.timed('Minimap.update')
+	def update(self, tiles: List[List[int]], owned_spots: List[List[Tuple[int, int, bool]]], visibility: List[List[bool]]) -> pygame.Surface:
+		first_civ = len(Minimap.tile_colors) + 1
+		if len(self.colors) < first_civ + len(owned_spots):
+			self.colors = np.array(Minimap.tile_colors + [ Minimap.background ] + [ atlas.civ_color(i) for i in range(len(owned_spots)) ], dtype = np.uint8)
+		visible = np.fromiter(itertools.chain.from_iterable(visibility), dtype = bool, count = len(self.cells) - 1)
+		cells = self.cells[:-1]
+		cells[:] = np.fromiter(itertools.chain.from_iterable(tiles), dtype = np.intp, count = len(cells))
+		cells[~visible] = 0
+		spots = [ (x, y, i) for i, civ_spots in enumerate(owned_spots) for x, y, exhausted in civ_spots ]
+		if len(spots) > 0:
+			xyc = np.array(spots, dtype = np.intp)
+			index = xyc[:, 1] * self.w + xyc[:, 0]
+			shown = visible[index]
+			cells[index[shown]] = first_civ + xyc[shown, 2]
+		block_colors = self.colors[self.cells[self.block_cells]]
+		self.buffer[:] = np.repeat(np.repeat(block_colors, self.cell, axis = 1), self.cell // 2, axis = 0)
+		return self.surface
@@ -4,7 +4,9 @@ import pygame
 from abc import abstractmethod
 import time
 
-pygame.init()
+# Fonts are loaded as classes are defined, so the font module is started here. The rest of pygame and the display are
+# started by the first View, so processes that only import the game (such as the computer player's workers) never open a window.
+pygame.font.init()
 
 class Model():
 	@abstractmethod
@@ -16,12 +18,17 @@ class View():
 	screen_width = 1552
 	screen_size = (screen_width, screen_width * 9 // 16)
 	icon = pygame.image.load("pics/game/icon.png")
-	pygame.display.set_caption('Gaia')
-	pygame.display.set_icon(icon)
-	screen = pygame.display.set_mode(screen_size, pygame.DOUBLEBUF | pygame.HWSURFACE, 32)
+	screen: pygame.Surface
+	opened = False
 
 	def __init__(self, model: Model) -> None:
 		self._model = model
+		if not View.opened:
+			pygame.init()
+			pygame.display.set_caption('Gaia')
+			pygame.display.set_icon(View.icon)
+			View.screen = pygame.display.set_mode(View.screen_size, pygame.DOUBLEBUF | pygame.HWSURFACE, 32)
+			View.opened = True
 
 	@abstractmethod
 	def update(self) -> None:
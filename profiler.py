@@ -0,0 +1,146 @@
+from typing import Dict, List, Any, Callable, TypeVar, Optional, cast
+import time
+import threading
+import json
+import functools
+import pygame
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+# Accumulated timings for one named span
+class SpanStats():
+	def __init__(self) -> None:
+		self.count = 0
+		self.total = 0.
+		self.last = 0.
+		self.max = 0.
+
+	def add(self, duration: float) -> None:
+		self.count += 1
+		self.total += duration
+		self.last = duration
+		self.max = max(self.max, duration)
+
+enabled = False # nothing is recorded unless the overlay is showing or a trace is being taken (see enable)
+spans: Dict[str, SpanStats] = {}
+counters: Dict[str, int] = {}
+trace_events: List[Dict[str, Any]] = []
+trace_filename: Optional[str] = None
+lock = threading.Lock()
+start_time = time.perf_counter()
+
+def record(name: str, begin: float, end: float) -> None:
+	with lock:
+		if name not in spans:
+			spans[name] = SpanStats()
+		spans[name].add(end - begin)
+		if trace_filename is not None:
+			trace_events.append({
+				'name': name,
+				'ph': 'X',
+				'ts': (begin - start_time) * 1e6,
+				'dur': (end - begin) * 1e6,
+				'pid': 0,
+				'tid': threading.get_ident(),
+			})
+
+# Times a block of code. Usage:
+#   with profiler.span('name'):
+#       ...
+class span():
+	def __init__(self, name: str) -> None:
+		self.name = name
+
+	def __enter__(self) -> None:
+		self.begin = time.perf_counter()
+
+	def __exit__(self, *args: Any) -> None:
+		if enabled:
+			record(self.name, self.begin, time.perf_counter())
+
+# A decorator that times every call to a function. (While the profiler is off, the function is just called.)
+def timed(name: str) -> Callable[[F], F]:
+	def decorate(func: F) -> F:
+		@functools.wraps(func)
+		def wrapper(*args: Any, **kwargs: Any) -> Any:
+			if not enabled:
+				return func(*args, **kwargs)
+			begin = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				record(name, begin, time.perf_counter())
+		return cast(F, wrapper)
+	return decorate
+
+# Adds n to the named counter
+def count(name: str, n: int = 1) -> None:
+	if not enabled:
+		return
+	with lock:
+		counters[name] = counters.get(name, 0) + n
+		if trace_filename is not None:
+			trace_events.append({
+				'name': name,
+				'ph': 'C',
+				'ts': (time.perf_counter() - start_time) * 1e6,
+				'pid': 0,
+				'args': { 'value': counters[name] },
+			})
+
+def reset() -> None:
+	with lock:
+		spans.clear()
+		counters.clear()
+		trace_events.clear()
+
+# Starts collecting trace events, which save_trace will write in Chrome's trace-event format
+# (viewable in chrome://tracing or https://ui.perfetto.dev)
+def start_trace(filename: str) -> None:
+	global trace_filename
+	trace_filename = filename
+	enable(True)
+
+# Turns recording on or off (for the overlay). It stays on while a trace is being taken.
+def enable(on: bool) -> None:
+	global enabled
+	enabled = on or trace_filename is not None
+
+def save_trace() -> None:
+	if trace_filename is None:
+		return
+	with lock:
+		b = bytes(json.dumps({ 'traceEvents': trace_events, 'displayTimeUnit': 'ms' }), 'utf8')
+	with open(trace_filename, mode='wb+') as file:
+		file.write(b)
+
+# Returns a few lines of text that summarize the timings and counters
+def summary() -> List[str]:
+	lines: List[str] = []
+	with lock:
+		for name in sorted(spans, key = lambda n: -spans[n].total):
+			s = spans[name]
+			lines.append('{}: {} calls, last {:.2f}ms, avg {:.2f}ms, max {:.2f}ms'.format(name, s.count, s.last * 1000, s.total * 1000 / s.count, s.max * 1000))
+		for name in sorted(counters):
+			lines.append('{}: {}'.format(name, counters[name]))
+		actions = counters.get('actions', 0)
+		if actions > 0:
+			lines.append('canvas rebuilds per action: {:.2f}'.format(counters.get('canvas rebuilds', 0) / actions))
+	return lines
+
+overlay_font: Optional[pygame.font.Font] = None
+
+def draw_overlay(screen: pygame.Surface) -> None:
+	global overlay_font
+	if overlay_font is None:
+		overlay_font = pygame.font.Font('freesansbold.ttf', 14)
+	lines = summary()
+	if len(lines) == 0:
+		return
+	back = pygame.Surface((760, 18 * len(lines) + 8), pygame.SRCALPHA)
+	back.fill((0, 0, 0, 160))
+	screen.blit(back, (4, 150))
+	y = 154
+	for line in lines:
+		screen.blit(overlay_font.render(line, True, (255, 255, 0)), (8, y))
+		y += 18
@@ -0,0 +1,78 @@
+from typing import List, Tuple, Optional
+import threading
+import numpy as np
+import pygame
+import terrain
+import image
+import profiler
+
+# Rebuilds the terrain canvas on a worker thread. (OpenCV and NumPy release the GIL while they work,
+# so this overlaps with animation on the main thread.)
+# There are two canvas buffers. The front one is shown while the worker draws into the back one,
+# and they are swapped on the main thread once the newest requested canvas is finished.
+class CanvasRebuilder():
+	idle_timeout = 5. # seconds before an idle worker thread exits (it is restarted by the next request)
+
+	def __init__(self, terr: terrain.Terrain) -> None:
+		self.terr = terr
+		self.cond = threading.Condition()
+		self.thread: Optional[threading.Thread] = None
+		self.job: Optional[Tuple[int, List[List[int]], List[List[Tuple[int, int, bool]]], List[List[bool]]]] = None
+		self.requested = 0 # generation of the newest request
+		self.finished = 0 # generation of the newest finished canvas (in the back buffer)
+		self.finished_visibility: List[List[bool]] = []
+		self.shown = 0 # generation of the canvas in the front buffer
+		self.buffers: List[np.ndarray] = [] # (made by the first request, so models that never draw do not hold canvases)
+		self.surfaces: List[pygame.Surface] = []
+		self.front = 0
+
+	# Asks for a canvas showing the specified board. This returns immediately,
+	# and abandons any older request that has not finished yet.
+	def request(self, owned_spots: List[List[Tuple[int, int, bool]]], visibility: List[List[bool]]) -> None:
+		with self.cond:
+			if len(self.buffers) == 0:
+				w, h = self.terr.canvas_size
+				self.buffers = [ np.zeros((h, w, 3), dtype = np.uint8) for i in range(2) ]
+				self.surfaces = [ image.to_pygame_surface(b) for b in self.buffers ]
+			self.requested += 1
+			self.job = (self.requested, [ row[:] for row in self.terr.tiles ], owned_spots, visibility)
+			if self.thread is None:
+				self.thread = threading.Thread(target=self.run, name='CanvasRebuilder', daemon=True)
+				self.thread.start()
+			self.cond.notify_all()
+
+	def run(self) -> None:
+		while True:
+			with self.cond:
+				if self.job is None:
+					self.cond.wait(CanvasRebuilder.idle_timeout)
+				if self.job is None:
+					self.thread = None
+					return
+				generation, tiles, owned_spots, visibility = self.job
+				self.job = None
+				back = 1 - self.front
+			if self.terr.render(self.buffers[back], tiles, owned_spots, visibility, lambda: generation != self.requested):
+				with self.cond:
+					self.finished = generation
+					self.finished_visibility = visibility
+					self.cond.notify_all()
+			else:
+				profiler.count('canvas rebuilds cancelled')
+
+	# If the newest requested canvas is ready, swaps it to the front and returns it with its visibility map.
+	# Otherwise returns None. Call this from the main thread.
+	def poll(self) -> Optional[Tuple[pygame.Surface, List[List[bool]]]]:
+		with self.cond:
+			if self.finished != self.requested or self.finished == self.shown:
+				return None
+			self.front = 1 - self.front
+			self.shown = self.finished
+			return self.surfaces[self.front], self.finished_visibility
+
+	# Blocks until the newest requested canvas is finished, then swaps it in
+	def wait(self) -> Optional[Tuple[pygame.Surface, List[List[bool]]]]:
+		with self.cond:
+			while self.finished != self.requested:
+				self.cond.wait()
+		return self.poll()
@@ -0,0 +1,55 @@
+from typing import Optional, Mapping, Any
+import random
+
+mask64 = (1 << 64) - 1
+
+# A small deterministic random number generator (SplitMix64).
+# Its whole state is one 64-bit integer, so it is cheap to copy and to save in a game file.
+class Stream():
+	def __init__(self, state: int) -> None:
+		self.state = state & mask64
+
+	def next64(self) -> int:
+		self.state = (self.state + 0x9e3779b97f4a7c15) & mask64
+		z = self.state
+		z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & mask64
+		z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & mask64
+		return z ^ (z >> 31)
+
+	# Returns a random integer in [start, stop), or in [0, start) if stop is omitted
+	def randrange(self, start: int, stop: Optional[int] = None) -> int:
+		if stop is None:
+			start, stop = 0, start
+		n = stop - start
+		if n <= 0:
+			raise ValueError('empty range for randrange')
+		return start + ((self.next64() * n) >> 64)
+
+	def random(self) -> float:
+		return (self.next64() >> 11) / float(1 << 53)
+
+
+# The random streams owned by one game. Map generation and gameplay draw from separate streams,
+# so changing how a map is made does not change what happens during play, and vice versa.
+class Rng():
+	def __init__(self, seed: Optional[int] = None) -> None:
+		if seed is None:
+			seed = random.SystemRandom().randrange(1 << 63)
+		self.seed = seed
+		seeder = Stream(seed)
+		self.map = Stream(seeder.next64())
+		self.play = Stream(seeder.next64())
+
+	def marshall(self) -> Mapping[str, Any]:
+		return {
+			'seed': self.seed,
+			'map': self.map.state,
+			'play': self.play.state,
+		}
+
+	@staticmethod
+	def unmarshall(ob: Mapping[str, Any]) -> 'Rng':
+		r = Rng(ob['seed'])
+		r.map.state = ob['map']
+		r.play.state = ob['play']
+		return r
@@ -0,0 +1,697 @@
+from typing import List, Dict, Set, Tuple, Any, Mapping, Optional, Callable
+import os
+import sys
+import secrets
+import time
+import json
+import queue
+import asyncio
+import argparse
+import threading
+import statistics
+from abc import abstractmethod
+import gaia
+import actions
+import terrain
+import ai
+import rng
+import profiler
+
+# A game server for playing over the network, each player at their own screen, instead of hot seat.
+#
+# The server owns the real game (a headless gaia.Model). Clients send it the actions their player takes, and it checks
+# each one (that it is that player's turn, that it follows the last action the client knew of, and that it is legal)
+# before doing it and sending it on to every client. Clients never send or get whole game states: they start the
+# game from the same seed, so the actions (in the format of Action.marshall) are all they need to keep up.
+# A client that loses its connection reconnects and asks for the actions since the last one it got.
+#
+# A seat belongs to the first client that takes it. The server gives that client a token, and only a hello with
+# the token can take the seat again (so a player can reconnect, but nobody else can push them out).
+# A client whose action was turned down may have shown it already, so it asks for the game again (see resync).
+#
+# Messages are JSON objects, one per line:
+#   client to server:
+#     { "type": "hello", "seat": civ index (or null to watch), "since": number of actions the client already has, "token": the seat's token (or null) }
+#     { "type": "action", "index": where in the action log the action goes, "action": Action.marshall() }
+#     { "type": "resync" }, to get the newest snapshot and the actions since then
+#   server to client:
+#     { "type": "welcome", "seed": ..., "civs": number of civs, "seat": ..., "actions": length of the action log, "token": the seat's token }
+#     { "type": "refused", "reason": ... }, to a hello that cannot have the seat it asked for (the server then hangs up)
+#     { "type": "action", "index": ..., "action": ... }, for every action from since on, and then for each new one
+#     { "type": "reject", "index": ..., "reason": ... }, to the client whose action was not done
+#     { "type": "snapshot", "index": ..., "state": Model.marshall() }, the game before action index, to spectators (see Subscriber)
+#       and to clients that asked to resync
+#
+# Spectators join with seat null. Rather than every action from the start, a spectator gets the newest snapshot
+# of the game (taken every snapshot_interval actions) and the actions since then.
+
+default_port = 7007
+
+def encode_message(ob: Mapping[str, Any]) -> bytes:
+	return bytes(json.dumps(ob), 'utf8') + b'\n'
+
+def is_int(x: Any) -> bool:
+	return isinstance(x, int) and not isinstance(x, bool)
+
+# Returns the action in an action message, or raises ValueError if it is not a well-formed action
+def read_action(ob: Any) -> gaia.Action:
+	if not isinstance(ob, dict) or not isinstance(ob.get('a'), str) or ob['a'] not in actions.kind_index:
+		raise ValueError('Malformed action: ' + repr(ob))
+	if ('d' in ob or ob['a'] != 'End') and not is_int(ob.get('d')):
+		raise ValueError('Malformed doer: ' + repr(ob))
+	if ob['a'] == 'move' or ob['a'] == 'attack':
+		t = ob.get('t')
+		if not isinstance(t, list) or len(t) != 2 or not all(is_int(v) for v in t) or \
+			not (0 <= t[0] < terrain.Terrain.w and 0 <= t[1] < terrain.Terrain.h):
+			raise ValueError('Malformed target: ' + repr(ob))
+	return gaia.Action.unmarshall(ob)
+
+
+# A connection to a client
+class Connection():
+	def __init__(self, writer: asyncio.StreamWriter) -> None:
+		self.writer = writer
+		self.seat: Optional[int] = None
+		self.subscriber: Optional['Subscriber'] = None # (for spectators)
+
+	def send(self, b: bytes) -> None:
+		self.writer.write(b)
+
+
+# Sends the game to a spectator. Messages wait in a bounded queue, and a task writes them out as fast as the spectator takes them.
+# A spectator that falls so far behind that the queue fills up skips ahead: what is queued is dropped,
+# and it gets the newest snapshot and the actions since then instead. So slow spectators never hold up the game or use up memory.
+class Subscriber():
+	max_queued = 256
+
+	def __init__(self, server: 'GameServer', writer: asyncio.StreamWriter, since: int) -> None:
+		self.server = server
+		self.writer = writer
+		self.queue: asyncio.Queue = asyncio.Queue(Subscriber.max_queued) # encoded messages, or None to catch up from since
+		self.since = since
+		self.queue.put_nowait(None)
+		self.task = asyncio.create_task(self.pump())
+
+	def offer(self, b: bytes) -> None:
+		if self.queue.full():
+			profiler.count('spectators skipped ahead')
+			while not self.queue.empty():
+				self.queue.get_nowait()
+			self.since = 0
+			self.queue.put_nowait(None)
+		self.queue.put_nowait(b)
+
+	async def pump(self) -> None:
+		try:
+			while True:
+				b = await self.queue.get()
+				if b is None:
+					for m in self.server.catch_up(self.since):
+						self.writer.write(m)
+				else:
+					self.writer.write(b)
+				await self.writer.drain()
+		except ConnectionError:
+			self.writer.close()
+
+
+# Keeps the authoritative game and the log of its actions, and serves them to clients
+class GameServer():
+	max_buffered = 1 << 20 # bytes waiting to be sent to a player before it is cut off as too slow (it can reconnect and catch up)
+	snapshot_interval = 64 # actions between snapshots
+
+	def __init__(self, num_civs: int, seed: int) -> None:
+		self.seed = seed
+		self.model = gaia.Model()
+		self.model.display_mode = False
+		self.model.draws_canvas = False
+		self.model.start_game(num_civs, seed)
+		self.model.message = ''
+		self.log: List[bytes] = [] # the encoded action message of each action done so far
+		self.connections: Set[Connection] = set()
+		self.seats: Dict[int, Connection] = {} # the connection playing each civ
+		self.tokens: Dict[int, str] = {} # the token of each seat that has been taken
+		self.server: Optional[asyncio.AbstractServer] = None
+		self.handlers: Set[asyncio.Task] = set()
+		self.recorded = False # (a recorded game plays itself, and only takes spectators)
+		self.take_snapshot()
+
+	# Keeps the state of the game as a snapshot message, for spectators to start from
+	def take_snapshot(self) -> None:
+		self.snapshot_index = len(self.log)
+		self.snapshot = encode_message({ 'type': 'snapshot', 'index': self.snapshot_index, 'state': self.model.marshall() })
+		profiler.count('server snapshots')
+
+	# Returns the messages that bring a client that has the actions before since up to date. If since is
+	# before the newest snapshot, that is the snapshot and the actions after it, so a spectator never needs the whole log.
+	def catch_up(self, since: int) -> List[bytes]:
+		if since < self.snapshot_index:
+			return [ self.snapshot ] + self.log[self.snapshot_index:]
+		return self.log[since:]
+
+	async def start(self, host: str = '127.0.0.1', port: int = default_port) -> None:
+		self.server = await asyncio.start_server(self.serve, host, port)
+
+	# Returns the port the server is listening on (useful when it was started on port 0)
+	def port(self) -> int:
+		assert self.server is not None
+		return self.server.sockets[0].getsockname()[1]
+
+	async def close(self) -> None:
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+		for conn in list(self.connections):
+			conn.writer.close()
+		await asyncio.gather(*self.handlers, return_exceptions = True)
+
+	async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		conn = Connection(writer)
+		self.connections.add(conn)
+		task = asyncio.current_task()
+		assert task is not None
+		self.handlers.add(task)
+		try:
+			while True:
+				line = await reader.readline()
+				if len(line) == 0:
+					break
+				self.receive(conn, json.loads(line))
+				await writer.drain()
+		except ConnectionError:
+			pass
+		except (ValueError, KeyError, TypeError) as e:
+			print('dropped a client that sent a bad message: ' + repr(e), file=sys.stderr)
+		finally:
+			self.connections.discard(conn)
+			if conn.seat is not None and self.seats.get(conn.seat) is conn:
+				del self.seats[conn.seat]
+			if conn.subscriber is not None:
+				conn.subscriber.task.cancel()
+			writer.close()
+			self.handlers.discard(task)
+
+	def receive(self, conn: Connection, ob: Any) -> None:
+		if not isinstance(ob, dict):
+			raise ValueError('Malformed message: ' + repr(ob))
+		if ob['type'] == 'hello':
+			seat = ob['seat']
+			token = ob.get('token')
+			if not (seat is None or is_int(seat)) or not is_int(ob['since']) or ob['since'] < 0 or not (token is None or isinstance(token, str)):
+				raise ValueError('Malformed hello: ' + repr(ob))
+			if seat is not None:
+				if seat < 0 or seat >= len(self.model.civs):
+					raise ValueError('No seat ' + str(seat))
+				if seat in self.tokens and token != self.tokens[seat]:
+					profiler.count('server hellos refused')
+					conn.send(encode_message({ 'type': 'refused', 'reason': 'seat ' + str(seat) + ' is taken' }))
+					conn.writer.close()
+					return
+				self.tokens.setdefault(seat, secrets.token_hex(16))
+				old = self.seats.get(seat)
+				if old is not None and old is not conn:
+					old.writer.close() # (the player reconnected before the old connection was noticed to be gone)
+				self.seats[seat] = conn
+				conn.seat = seat
+			conn.send(encode_message({ 'type': 'welcome', 'seed': self.seed, 'civs': len(self.model.civs), 'seat': seat, 'actions': len(self.log),
+				'token': None if seat is None else self.tokens[seat] }))
+			if seat is None:
+				if conn.subscriber is None:
+					conn.subscriber = Subscriber(self, conn.writer, ob['since'])
+			else:
+				for b in self.log[ob['since']:]:
+					conn.send(b)
+		elif ob['type'] == 'action':
+			reason = self.check(conn, ob)
+			if reason is not None:
+				profiler.count('server actions rejected')
+				conn.send(encode_message({ 'type': 'reject', 'index': ob['index'], 'reason': reason }))
+				return
+			self.publish(read_action(ob['action']))
+		elif ob['type'] == 'resync':
+			profiler.count('server resyncs')
+			conn.send(self.snapshot)
+			for b in self.log[self.snapshot_index:]:
+				conn.send(b)
+		else:
+			raise ValueError('Unrecognized message: ' + str(ob['type']))
+
+	# Does an action and sends it to every client
+	def publish(self, act: gaia.Action) -> None:
+		self.model.make(act)
+		b = encode_message({ 'type': 'action', 'index': len(self.log), 'action': act.marshall() })
+		self.log.append(b)
+		profiler.count('server actions')
+		if len(self.log) % GameServer.snapshot_interval == 0:
+			self.take_snapshot()
+		for c in list(self.connections):
+			if c.subscriber is not None:
+				c.subscriber.offer(b)
+			elif c.seat is None:
+				pass # (it has not said hello yet)
+			elif c.writer.transport.get_write_buffer_size() > GameServer.max_buffered:
+				profiler.count('server clients too slow')
+				c.writer.close()
+				self.connections.discard(c)
+			else:
+				c.send(b)
+
+	# Plays a recorded game (a list of marshalled actions) for spectators, at the specified number of actions per second
+	async def play_recording(self, history: List[Mapping[str, Any]], pace: float) -> None:
+		self.recorded = True
+		for ob in history:
+			await asyncio.sleep(1. / pace)
+			self.publish(gaia.Action.unmarshall(ob))
+
+	# Returns why an action message cannot be done, or None if it can
+	def check(self, conn: Connection, ob: Mapping[str, Any]) -> Optional[str]:
+		if not is_int(ob['index']):
+			raise ValueError('Malformed index: ' + repr(ob['index']))
+		act = read_action(ob['action'])
+		if self.recorded:
+			return 'this is a recorded game'
+		if conn.seat is None or self.seats.get(conn.seat) is not conn:
+			return 'not seated'
+		if ai.game_over(self.model):
+			return 'the game is over'
+		if conn.seat != self.model.active_civ:
+			return 'not your turn'
+		if ob['index'] != len(self.log):
+			return 'out of date'
+		if actions.encode(act.descr, act.doer, act.target) not in actions.legal_actions(self.model):
+			return 'illegal'
+		return None
+
+
+# A client of a GameServer. It reconnects if the connection drops, and keeps the confirmed actions in order.
+# on_action is called with the index of each confirmed action, the action, and whether this client sent it.
+# When the server turns down one of its actions, a client with an on_snapshot asks for the game again, and on_snapshot
+# is called with it before the actions after it come in.
+class GameClient():
+	retry_delay = 0.5
+
+	def __init__(self,
+		seat: Optional[int],
+		on_action: Callable[[int, gaia.Action, bool], None],
+		on_snapshot: Optional[Callable[[int, Mapping[str, Any]], None]] = None,
+		token: Optional[str] = None,
+	) -> None:
+		self.seat = seat
+		self.on_action = on_action
+		self.on_snapshot = on_snapshot # called with the index and the marshalled state of each snapshot that skips this client ahead
+		self.token = token # the seat's token (the server gives it out the first time the seat is taken)
+		self.count = 0 # confirmed actions received
+		self.seed = 0
+		self.num_civs = 0
+		self.log_length = 0 # actions the server had done when this client last connected
+		self.pending: Dict[int, Any] = {} # actions this client sent that are not confirmed yet (as they will come back from JSON), by index
+		self.written: Set[int] = set() # the indexes of the pending actions written to the current connection
+		self.rejected: List[Tuple[int, str]] = []
+		self.resyncing = False # (the next snapshot replaces what this client has, even if it is older)
+		self.refused: Optional[str] = None # why the server would not give this client its seat
+		self.welcomed = asyncio.Event()
+		self.writer: Optional[asyncio.StreamWriter] = None
+		self.closing = False
+
+	# Connects and keeps the connection up until close is called
+	async def run(self, host: str, port: int) -> None:
+		while not self.closing:
+			try:
+				reader, writer = await asyncio.open_connection(host, port)
+			except ConnectionError:
+				await asyncio.sleep(GameClient.retry_delay)
+				continue
+			self.writer = writer
+			self.written.clear()
+			writer.write(encode_message({ 'type': 'hello', 'seat': self.seat, 'since': self.count, 'token': self.token }))
+			if self.resyncing:
+				writer.write(encode_message({ 'type': 'resync' }))
+			try:
+				while True:
+					line = await reader.readline()
+					if len(line) == 0:
+						break
+					self.receive(json.loads(line))
+			except ConnectionError:
+				pass
+			self.writer = None
+			writer.close()
+			if not self.closing:
+				profiler.count('client reconnects')
+				await asyncio.sleep(GameClient.retry_delay)
+
+	def receive(self, ob: Mapping[str, Any]) -> None:
+		if ob['type'] == 'welcome':
+			self.token = ob['token']
+			self.seed = ob['seed']
+			self.num_civs = ob['civs']
+			self.log_length = ob['actions']
+			self.welcomed.set()
+			if ob['actions'] == self.count:
+				self.flush() # (the server did not get the action sent before the connection dropped, if there was one)
+		elif ob['type'] == 'action':
+			index = ob['index']
+			if index < self.count:
+				return # (already seen before a reconnection)
+			own = self.pending.pop(index, None) == ob['action']
+			self.count = index + 1
+			self.on_action(index, gaia.Action.unmarshall(ob['action']), own)
+			self.flush()
+		elif ob['type'] == 'snapshot':
+			if ob['index'] <= self.count and not self.resyncing:
+				return # (the actions after it come next, and the ones this client already has are skipped)
+			assert self.on_snapshot is not None
+			self.resyncing = False
+			self.count = ob['index']
+			self.on_snapshot(ob['index'], ob['state'])
+		elif ob['type'] == 'reject':
+			if ob['index'] < self.count:
+				return # (a resent action that the server had already done)
+			for index in [ i for i in self.pending if i >= ob['index'] ]: # (the actions after it were sent to follow it)
+				del self.pending[index]
+			self.rejected.append((ob['index'], ob['reason']))
+			if self.on_snapshot is not None and not self.resyncing:
+				self.resyncing = True
+				if self.writer is not None:
+					self.writer.write(encode_message({ 'type': 'resync' }))
+		elif ob['type'] == 'refused':
+			self.refused = ob['reason']
+			self.closing = True
+			self.welcomed.set() # (so catch_up stops waiting)
+		else:
+			raise ValueError('Unrecognized message: ' + str(ob['type']))
+
+	# Sends an action to go at the next place in the action log
+	def send(self, act: gaia.Action) -> None:
+		self.pending[self.count + len(self.pending)] = json.loads(json.dumps(act.marshall()))
+		self.flush()
+
+	# Writes the next pending action, if the server can take it now. (Each action is sent once the one before it is confirmed.)
+	def flush(self) -> None:
+		if self.writer is not None and self.count in self.pending and self.count not in self.written:
+			self.writer.write(encode_message({ 'type': 'action', 'index': self.count, 'action': self.pending[self.count] }))
+			self.written.add(self.count)
+
+	# Waits until this client has every action the server had done when it connected
+	async def catch_up(self) -> None:
+		await self.welcomed.wait()
+		if self.refused is not None:
+			raise ConnectionRefusedError(self.refused)
+		while self.count < self.log_length:
+			await asyncio.sleep(0.01)
+
+	def close(self) -> None:
+		self.closing = True
+		if self.writer is not None:
+			self.writer.close()
+
+
+# Follows a game at a game server from the game's screen. The client runs on its own thread, and what it gets waits in
+# the incoming queue until the game's computer_player hook takes it (on the game's thread).
+class RemoteGame():
+	def __init__(self, host: str, port: int, seat: Optional[int], token: Optional[str] = None) -> None:
+		self.incoming: queue.Queue = queue.Queue()
+		self.loop = asyncio.new_event_loop()
+		self.client = GameClient(seat, self.on_action, self.on_snapshot, token)
+		self.model: Optional[gaia.Model] = None
+		self.thread = threading.Thread(target = self.loop.run_until_complete, args = (self.client.run(host, port),), daemon = True)
+		self.thread.start()
+
+	# Waits for the server to say which game it is playing (and to send the actions done so far), and returns its seed and number of civs
+	def wait_for_game(self, timeout: float = 10.) -> Tuple[int, int]:
+		asyncio.run_coroutine_threadsafe(asyncio.wait_for(self.client.catch_up(), timeout), self.loop).result()
+		return self.client.seed, self.client.num_civs
+
+	# Connects a game started with the server's seed
+	@abstractmethod
+	def attach(self, model: gaia.Model) -> None:
+		raise NotImplementedError('stub')
+
+	# Starts over from a snapshot of the game the server sent
+	def jump(self, model: gaia.Model, state: Mapping[str, Any]) -> None:
+		model.finish_animation()
+		model.unmarshall(state)
+		model.history = []
+		model.history_pos = 0
+		model.clear_selection()
+
+	def on_action(self, index: int, act: gaia.Action, own: bool) -> None:
+		if not own:
+			self.incoming.put(act)
+
+	def on_snapshot(self, index: int, state: Mapping[str, Any]) -> None:
+		self.incoming.put(state)
+
+	def close(self) -> None:
+		self.loop.call_soon_threadsafe(self.client.close)
+
+
+# Plays at a game server. The actions of the other players come in as the game's computer_player,
+# and the actions of the player at this screen go out through send_action. The player's actions are shown
+# before the server confirms them, so when the server turns one down, the game starts over from the server's state.
+class NetPlayer(RemoteGame):
+	def __init__(self, host: str, port: int, seat: int, token: Optional[str] = None) -> None:
+		self.seat = seat
+		super().__init__(host, port, seat, token)
+
+	# Connects a game started with the server's seed: civs played at other screens stop being human here,
+	# and the actions done before this player joined (or rejoined) are done at once, without animating them
+	def attach(self, model: gaia.Model) -> None:
+		self.model = model
+		for i, c in enumerate(model.civs):
+			c.human = (i == self.seat)
+		model.display_mode = False
+		while not self.incoming.empty():
+			item = self.incoming.get_nowait()
+			if isinstance(item, gaia.Action):
+				model.make(item)
+			else:
+				self.jump(model, item)
+		model.display_mode = True
+		model.perspective_civ = self.seat
+		model.message = 'You are player ' + str(self.seat + 1)
+		model.update_canvas()
+		model.computer_player = self.remote_action
+		model.send_action = self.send_action
+
+	def jump(self, model: gaia.Model, state: Mapping[str, Any]) -> None:
+		super().jump(model, state)
+		for i, c in enumerate(model.civs):
+			c.human = (i == self.seat)
+		model.perspective_civ = self.seat
+		model.update_canvas()
+
+	def remote_action(self, model: gaia.Model) -> Optional[gaia.Action]:
+		try:
+			item = self.incoming.get_nowait()
+		except queue.Empty:
+			return None
+		if isinstance(item, gaia.Action):
+			return item
+		self.jump(model, item)
+		model.message = 'The server turned down your last action'
+		return None
+
+	def send_action(self, act: gaia.Action) -> bool:
+		assert self.model is not None
+		if not self.incoming.empty() or actions.encode(act.descr, act.doer, act.target) not in actions.legal_actions(self.model):
+			return False
+		self.loop.call_soon_threadsafe(self.client.send, act)
+		return True
+
+
+# Watches a game at a game server, live or recorded, seeing every civ's units. It starts from the server's newest snapshot,
+# and the actions after it are played out (and animated) by Model.update, as in a replay.
+class Spectator(RemoteGame):
+	def __init__(self, host: str, port: int) -> None:
+		super().__init__(host, port, None)
+
+	# Connects a game started with the server's seed, so it shows what the server sends
+	def attach(self, model: gaia.Model) -> None:
+		self.model = model
+		model.sees_all = True
+		for c in model.civs:
+			c.human = False
+		model.display_mode = False
+		while not self.incoming.empty():
+			self.apply(model, self.incoming.get_nowait())
+		model.display_mode = True
+		model.message = ''
+		model.update_canvas()
+		model.computer_player = self.next_action
+
+	def apply(self, model: gaia.Model, item: Any) -> None:
+		if isinstance(item, gaia.Action):
+			model.make(item)
+		else:
+			self.jump(model, item)
+
+	# Skips ahead to a snapshot
+	def jump(self, model: gaia.Model, state: Mapping[str, Any]) -> None:
+		super().jump(model, state)
+		for c in model.civs:
+			c.human = False # (so the hook keeps being asked for actions)
+		model.perspective_civ = model.active_civ
+		model.update_canvas()
+
+	def next_action(self, model: gaia.Model) -> Optional[gaia.Action]:
+		try:
+			item = self.incoming.get_nowait()
+		except queue.Empty:
+			return None
+		if isinstance(item, gaia.Action):
+			return item
+		self.jump(model, item)
+		return None
+
+
+# A client that plays random legal actions for one seat as fast as the server confirms them, and times how long each takes to come back.
+# It stops once the game is over.
+class SimulatedPlayer():
+	def __init__(self, seat: int, seed: int) -> None:
+		self.seat = seat
+		self.rand = rng.Stream(seed)
+		self.model: Optional[gaia.Model] = None
+		self.client = GameClient(seat, self.on_action, self.on_snapshot)
+		self.sent_at = 0.
+		self.latencies: List[float] = []
+
+	# Starts this player's copy of the game (once the server has said which game it is)
+	def start_game(self) -> gaia.Model:
+		if self.model is None:
+			self.model = gaia.Model()
+			self.model.display_mode = False
+			self.model.draws_canvas = False
+			self.model.start_game(self.client.num_civs, self.client.seed)
+			self.model.message = ''
+		return self.model
+
+	def on_action(self, index: int, act: gaia.Action, own: bool) -> None:
+		self.start_game().make(act)
+		if own:
+			self.latencies.append(time.perf_counter() - self.sent_at)
+		self.play()
+
+	# Starts over from the server's state of the game (after an action was turned down)
+	def on_snapshot(self, index: int, state: Mapping[str, Any]) -> None:
+		m = self.start_game()
+		m.unmarshall(state)
+		m.history = []
+		m.history_pos = 0
+		self.play()
+
+	# Takes a turn if it is this player's
+	def play(self) -> None:
+		m = self.start_game()
+		if m.active_civ != self.seat or len(self.client.pending) > 0 or self.client.resyncing or ai.game_over(m):
+			return
+		codes = actions.legal_actions(m)
+		self.sent_at = time.perf_counter()
+		self.client.send(actions.decode(codes[self.rand.randrange(len(codes))]))
+
+# Runs games between simulated players over loopback, each watched by some spectators, until each has actions_per_game actions
+# or is over. Returns the actions per second
+# the servers confirmed, the median and 99th percentile times (in seconds) from a player sending an action to getting it back,
+# how many spectators were kept up to date, and the median time a spectator that joins a game late takes to catch up.
+async def measure(num_games: int, num_civs: int, actions_per_game: int, spectators: int) -> Dict[str, float]:
+	servers: List[GameServer] = []
+	players: List[SimulatedPlayer] = []
+	watchers: List[GameClient] = []
+	tasks: List[asyncio.Task] = []
+	for g in range(num_games):
+		server = GameServer(num_civs, g + 1)
+		await server.start(port = 0)
+		servers.append(server)
+		for seat in range(num_civs):
+			p = SimulatedPlayer(seat, g * 8 + seat)
+			players.append(p)
+			tasks.append(asyncio.create_task(p.client.run('127.0.0.1', server.port())))
+		for i in range(spectators):
+			watcher = GameClient(None, lambda index, act, own: None, lambda index, state: None)
+			watchers.append(watcher)
+			tasks.append(asyncio.create_task(watcher.run('127.0.0.1', server.port())))
+	for p in players:
+		await p.client.welcomed.wait()
+	start = time.perf_counter()
+	for p in players:
+		p.play() # (after this, players move when the action before their turn arrives)
+	while any(len(s.log) < actions_per_game and not ai.game_over(s.model) for s in servers):
+		await asyncio.sleep(0.01)
+	elapsed = time.perf_counter() - start
+	total = sum(len(s.log) for s in servers)
+	for p in players:
+		p.client.close()
+	await asyncio.sleep(0.5) # (for the spectators to get the last actions)
+	current = sum(1 for i, w in enumerate(watchers) if w.count == len(servers[i // max(1, spectators)].log))
+
+	# Spectators that join late
+	joins: List[float] = []
+	for s in servers:
+		late = GameClient(None, lambda index, act, own: None, lambda index, state: None)
+		join_start = time.perf_counter()
+		task = asyncio.create_task(late.run('127.0.0.1', s.port()))
+		await late.catch_up()
+		joins.append(time.perf_counter() - join_start)
+		late.close()
+		await task
+	for w in watchers:
+		w.close()
+	await asyncio.gather(*tasks)
+	for s in servers:
+		await s.close()
+	latencies = sorted(x for p in players for x in p.latencies)
+	return {
+		'actions per second': total / elapsed,
+		'latency median': statistics.median(latencies),
+		'latency 99th percentile': latencies[int(len(latencies) * 0.99)],
+		'spectators up to date': current,
+		'spectators': len(watchers),
+		'late join median': statistics.median(joins),
+	}
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description='Serves a game to players at other screens, and to spectators. (Join with main.py --connect, or watch with main.py --watch.)')
+	parser.add_argument('--civs', type=int, default=2, help='number of players')
+	parser.add_argument('--seed', type=int, help='seed of the map and gameplay (default: random)')
+	parser.add_argument('--host', default='0.0.0.0', help='address to listen on')
+	parser.add_argument('--port', type=int, default=default_port, help='port to listen on')
+	parser.add_argument('--measure', action='store_true', help='instead, time games between simulated players over loopback')
+	parser.add_argument('--games', type=int, default=8, help='games played at once, for --measure')
+	parser.add_argument('--actions', type=int, default=300, help='actions per game, for --measure')
+	parser.add_argument('--spectators', type=int, default=0, help='spectators watching each game, for --measure')
+	parser.add_argument('--replay', metavar='FILE', help='serve a saved game (with its .history file next to it) to spectators, played from the start')
+	parser.add_argument('--pace', type=float, default=2., help='actions per second, for --replay')
+	args = parser.parse_args()
+
+	if args.measure:
+		results = asyncio.run(measure(args.games, args.civs, args.actions, args.spectators))
+		print('{:.0f} actions/s   latency median {:.2f}ms   99th percentile {:.2f}ms'.format(
+			results['actions per second'], results['latency median'] * 1000, results['latency 99th percentile'] * 1000), file=sys.stderr)
+		print('{} of {} spectators up to date   late join median {:.2f}ms'.format(
+			results['spectators up to date'], results['spectators'], results['late join median'] * 1000), file=sys.stderr)
+		return
+
+	async def serve() -> None:
+		history: List[Mapping[str, Any]] = []
+		if args.replay:
+			with open(args.replay, mode='rb') as file:
+				state = json.loads(file.read())
+			with open(args.replay[:-len('.json')] + '.history.json', mode='rb') as file:
+				history = json.loads(file.read())
+			if 'rng' not in state:
+				raise ValueError(args.replay + ' has no seed, so it cannot be replayed')
+			seed = state['rng']['seed']
+			num_civs = len(state['civs'])
+		else:
+			seed = args.seed if args.seed is not None else int.from_bytes(os.urandom(4), 'little')
+			num_civs = args.civs
+		server = GameServer(num_civs, seed)
+		await server.start(args.host, args.port)
+		print('serving a {} player game (seed {}) on port {}'.format(num_civs, seed, server.port()), file=sys.stderr)
+		if args.replay:
+			await server.play_recording(history, args.pace)
+		await asyncio.Event().wait()
+	asyncio.run(serve())
+
+if __name__ == '__main__':
+	main()
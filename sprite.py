@@ -3,6 +3,7 @@ from abc import abstractmethod
 import pygame
 import terrain
 import image
+import atlas
 import enum
 
 def noop() -> None:
@@ -21,6 +22,18 @@ btn_castle = 'castle (-8 wood)'
 btn_wood = 'chop wood'
 btn_mine = 'mine (-3 wood)'
 
+# The art for every kind of creature. Each civilization's colors are tinted from this on demand.
+units = atlas.UnitArt()
+units.add('gnome', 'pics/base/gnome.png', 0.07)
+units.add('gnome_on_raft', 'pics/base/gnome_on_raft.png', 0.15)
+units.add('dwarf', 'pics/base/dwarf.png', 0.15)
+units.add('dwarf_on_raft', 'pics/base/dwarf_on_raft.png', 0.15)
+units.add('trebuchet', 'pics/base/trebuchet.png', 0.15)
+units.add('trebuchet_on_raft', 'pics/base/trebuchet_on_raft.png', 0.15)
+units.add('elf', 'pics/base/elf.png', 0.10)
+units.add('elf_on_raft', 'pics/base/elf_on_raft.png', 0.15)
+units.add('dragon', 'pics/base/dragon.png', 0.2)
+
 class Animation(enum.Enum):
 	done = 0
 	move = 1
@@ -211,13 +224,14 @@ class Button(Sprite):
 	im_up = pygame.image.load("pics/game/button_up.png")
 	im_down = pygame.image.load("pics/game/button_down.png")
 	font = pygame.font.Font('freesansbold.ttf', 24)
+	text_cache: Dict[str, pygame.Surface] = {}
 
 	def __init__(self, pos: Tuple[int, int], text: str) -> None:
 		super().__init__()
 		self.pos = pos
 		self.text = text
 		self.image = Button.im_up
-		self.text_image = Button.font.render(self.text, True, (0, 0, 0))
+		self.text_image = Button.render_text(text)
 		rb = self.rect()
 		rt = self.text_image.get_rect()
 		l = rb[0] + (rb[2] - rb[0] - rt[2]) // 2
@@ -225,6 +239,13 @@ class Button(Sprite):
 		self.text_rect_up = (l, t, l + rt[2], t + rt[3])
 		self.text_rect_down = (l, t + 3, l + rt[2], t + rt[3] + 3)
 
+	# Returns the rendered label, only rasterizing each distinct string once
+	@staticmethod
+	def render_text(text: str) -> pygame.Surface:
+		if text not in Button.text_cache:
+			Button.text_cache[text] = Button.font.render(text, True, (0, 0, 0))
+		return Button.text_cache[text]
+
 	def draw(self, screen: pygame.Surface) -> None:
 		screen.blit(self.image, self.rect())
 		screen.blit(self.text_image, self.text_rect_down if self.image is Button.im_down else self.text_rect_up)
@@ -282,9 +303,7 @@ class Building(Sprite):
 
 	def marshall(self) -> Mapping[str, Any]:
 		ob = super().marshall_base('Building')
-		if self.image == Building.im_hut: ob['state'] = 0
-		elif self.image == Building.im_fortress: ob['state'] = 1
-		else: ob['state'] = 2
+		ob['state'] = self.state()
 		return ob
 
 	@staticmethod
@@ -299,6 +318,12 @@ class Building(Sprite):
 	def is_building(self) -> bool:
 		return True
 
+	# Returns 0 for a hut, 1 for a fort, or 2 for a castle
+	def state(self) -> int:
+		if self.image == Building.im_hut: return 0
+		elif self.image == Building.im_fortress: return 1
+		else: return 2
+
 	def upgrade(self) -> None:
 		if self.image == Building.im_hut:
 			self.image = Building.im_fortress
@@ -391,19 +416,6 @@ class Creature(Sprite):
 					x += 15
 
 class Gnome(Creature):
-	im_gnome = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/gnome.png"), 0.07),
-		image.scale_pg_image(pygame.image.load("pics/civ1/gnome.png"), 0.12),
-		image.scale_pg_image(pygame.image.load("pics/civ2/gnome.png"), 0.07),
-		image.scale_pg_image(pygame.image.load("pics/civ3/gnome.png"), 0.15),
-	]
-	im_gnome_on_raft = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/gnome_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ1/gnome_on_raft.png"), 0.11),
-		image.scale_pg_image(pygame.image.load("pics/civ2/gnome_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ3/gnome_on_raft.png"), 0.15),
-	]
-
 	def marshall(self) -> Mapping[str, Any]:
 		ob = super().marshall_base('Gnome')
 		ob['raft'] = self.raft
@@ -418,15 +430,11 @@ class Gnome(Creature):
 
 	def __init__(self) -> None:
 		super().__init__()
-		self.image = Gnome.im_gnome
 		self.life = 3
 		self.raft = False
 
 	def draw(self, screen: pygame.Surface) -> None:
-		if self.raft:
-			self.image = Gnome.im_gnome_on_raft[self.civ]
-		else:
-			self.image = Gnome.im_gnome[self.civ]
+		self.image = units.get('gnome_on_raft' if self.raft else 'gnome', self.civ)
 		screen.blit(self.image, self.rect())
 
 	def get_attack_strength(self) -> int:
@@ -458,22 +466,8 @@ class Gnome(Creature):
 		return self.raft
 
 class Dwarf(Creature):
-	im_dwarf = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/dwarf.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ1/dwarf.png"), 0.12),
-		image.scale_pg_image(pygame.image.load("pics/civ2/dwarf.png"), 0.10),
-		image.scale_pg_image(pygame.image.load("pics/civ3/dwarf.png"), 0.25),
-	]
-	im_dwarf_on_raft = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/dwarf_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ1/dwarf_on_raft.png"), 0.10),
-		image.scale_pg_image(pygame.image.load("pics/civ2/dwarf_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ3/dwarf_on_raft.png"), 0.15),
-	]
-
 	def __init__(self) -> None:
 		super().__init__()
-		self.image = Dwarf.im_dwarf
 		self.life = 5
 		self.raft = False
 
@@ -490,10 +484,7 @@ class Dwarf(Creature):
 		return s
 
 	def draw(self, screen: pygame.Surface) -> None:
-		if self.raft:
-			self.image = Dwarf.im_dwarf_on_raft[self.civ]
-		else:
-			self.image = Dwarf.im_dwarf[self.civ]
+		self.image = units.get('dwarf_on_raft' if self.raft else 'dwarf', self.civ)
 		screen.blit(self.image, self.rect())
 
 	def visibility(self) -> int:
@@ -503,7 +494,7 @@ class Dwarf(Creature):
 		return 2
 
 	def attack_range(self) -> int:
-		if self.image == Dwarf.im_dwarf: return 3
+		if not self.raft: return 3
 		else: return 2
 
 	def get_attack_strength(self) -> int:
@@ -524,22 +515,8 @@ class Dwarf(Creature):
 		return self.raft
 
 class Trebuchet(Creature):
-	im_trebuchet = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/trebuchet.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ1/trebuchet.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ2/trebuchet.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ3/trebuchet.png"), 0.15),
-	]
-	im_trebuchet_on_raft = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/trebuchet_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ1/trebuchet_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ2/trebuchet_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ3/trebuchet_on_raft.png"), 0.15),
-	]
-
 	def __init__(self) -> None:
 		super().__init__()
-		self.image = Trebuchet.im_trebuchet
 		self.life = 1
 		self.raft = False
 
@@ -556,10 +533,7 @@ class Trebuchet(Creature):
 		return s
 
 	def draw(self, screen: pygame.Surface) -> None:
-		if self.raft:
-			self.image = Trebuchet.im_trebuchet_on_raft[self.civ]
-		else:
-			self.image = Trebuchet.im_trebuchet[self.civ]
+		self.image = units.get('trebuchet_on_raft' if self.raft else 'trebuchet', self.civ)
 		screen.blit(self.image, self.rect())
 
 	def visibility(self) -> int:
@@ -582,22 +556,8 @@ class Trebuchet(Creature):
 
 
 class Elf(Creature):
-	im_elf = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/elf.png"), 0.10),
-		image.scale_pg_image(pygame.image.load("pics/civ1/elf.png"), 0.18),
-		image.scale_pg_image(pygame.image.load("pics/civ2/elf.png"), 0.10),
-		image.scale_pg_image(pygame.image.load("pics/civ3/elf.png"), 0.10),
-	]
-	im_elf_on_raft = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/elf_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ1/elf_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ2/elf_on_raft.png"), 0.15),
-		image.scale_pg_image(pygame.image.load("pics/civ3/elf_on_raft.png"), 0.15),
-	]
-
 	def __init__(self) -> None:
 		super().__init__()
-		self.image = Elf.im_elf
 		self.life = 5
 		self.raft = False
 
@@ -614,17 +574,14 @@ class Elf(Creature):
 		return s
 
 	def draw(self, screen: pygame.Surface) -> None:
-		if self.raft:
-			self.image = Elf.im_elf_on_raft[self.civ]
-		else:
-			self.image = Elf.im_elf[self.civ]
+		self.image = units.get('elf_on_raft' if self.raft else 'elf', self.civ)
 		screen.blit(self.image, self.rect())
 
 	def visibility(self) -> int:
 		return 4
 
 	def move_range(self) -> int:
-		if self.image == Elf.im_elf: return 3 # on land
+		if not self.raft: return 3 # on land
 		else: return 2 # on water
 
 	def attack_range(self) -> int:
@@ -641,16 +598,8 @@ class Elf(Creature):
 
 
 class Dragon(Creature):
-	im_dragon = [
-		image.scale_pg_image(pygame.image.load("pics/civ0/dragon.png"), 0.2),
-		image.scale_pg_image(pygame.image.load("pics/civ1/dragon.png"), 0.2),
-		image.scale_pg_image(pygame.image.load("pics/civ2/dragon.png"), 0.2),
-		image.scale_pg_image(pygame.image.load("pics/civ3/dragon.png"), 0.2),
-	]
-
 	def __init__(self) -> None:
 		super().__init__()
-		self.image = Dragon.im_dragon
 		self.life = 9
 
 	def marshall(self) -> Mapping[str, Any]:
@@ -664,7 +613,7 @@ class Dragon(Creature):
 		return s
 
 	def draw(self, screen: pygame.Surface) -> None:
-		self.image = Dragon.im_dragon[self.civ]
+		self.image = units.get('dragon', self.civ)
 		screen.blit(self.image, self.rect())
 
 	def can_fly(self) -> bool:
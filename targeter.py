@@ -3,6 +3,8 @@ import civ
 import terrain
 import sprite
 import collections
+import profiler
+import bitboard
 
 class Spot():
 	def __init__(self, tile: Tuple[int, int], steps: int, prev: Optional['Spot']) -> None:
@@ -13,16 +15,27 @@ class Spot():
 
 class Targeter():
 	def __init__(self, terr: terrain.Terrain, civs: List['civ.Civ']) -> None:
+		self.grid = bitboard.grid(terr.w, terr.h)
 		self.sprites: List[List[Optional[sprite.Sprite]]] = [[None for i in range(terr.w)] for j in range(terr.h)]
 		self.civs: List[List[int]] = [[-1 for i in range(terr.w)] for j in range(terr.h)]
+		self.occupied = 0 # bitboard of the tiles with a sprite on them
+		self.civ_masks = [ 0 ] * len(civs) # bitboard of each civ's tiles
+		self.exhausted = 0 # bitboard of the tiles with an exhausted sprite on them
 		for i, civ in enumerate(civs):
 			for sprite in civ.population:
 				self.sprites[sprite.tile[1]][sprite.tile[0]] = sprite
 				self.civs[sprite.tile[1]][sprite.tile[0]] = i
+				b = self.grid.bit(sprite.tile[0], sprite.tile[1])
+				self.civ_masks[i] |= b
+				if sprite.exhausted:
+					self.exhausted |= b
+		for m in self.civ_masks:
+			self.occupied |= m
 
 	def occupant(self, tile: Tuple[int, int]) -> Tuple[Optional[sprite.Sprite], int]:
 		return self.sprites[tile[1]][tile[0]], self.civs[tile[1]][tile[0]]
 
+	@profiler.timed('Targeter.nearest_open_spot')
 	def nearest_open_spot(self, tile: Tuple[int, int], terr: terrain.Terrain, allow_water: bool) -> Tuple[int, int]:
 		s = set()
 		q: Deque[Tuple[int, int]] = collections.deque()
@@ -36,11 +49,16 @@ class Targeter():
 				if terr.tile(neigh) == 1 and not allow_water:
 					continue # Don't go on water
 				if self.occupant(neigh)[0] is None:
+					profiler.count('bfs nodes visited', len(s))
 					return neigh # Found one!
 				s.add(neigh)
 				q.append(neigh)
+		profiler.count('bfs nodes visited', len(s))
 		return -1, -1 # No available spot
 
+	# Returns the unoccupied tiles that a unit at start can move to. The unit can pass through other units.
+	# Units on land can go onto water if can_enter_water, but only go further over water (or units on water onto land) if can_move_on_water.
+	@profiler.timed('Targeter.get_move_targets')
 	def get_move_targets(self,
 		start: Tuple[int, int],
 		terr: terrain.Terrain,
@@ -48,31 +66,18 @@ class Targeter():
 		can_enter_water: bool,
 		can_move_on_water: bool,
 	) -> List[Spot]:
+		g = self.grid
+		water = terr.masks()[1]
 		started_on_water = (terr.tile(start) == 1)
-		s = set()
-		q: Deque[Spot] = collections.deque()
-		s.add(start)
-		q.append(Spot(start, 0, None))
-		targets: List[Spot] = []
-		while len(q) > 0:
-			spot = q.popleft()
-			spr, civ = self.occupant(spot.tile)
-			if spr is None:
-				targets.append(spot)
-			keep_going = True
-			if spot.steps >= steps: keep_going = False
-			if started_on_water:
-				if terr.tile(spot.tile) != 1 and not can_move_on_water: keep_going = False
-			else:
-				if terr.tile(spot.tile) == 1 and not can_move_on_water: keep_going = False
-			if keep_going:
-				for neigh in terr.adjacent(spot.tile):
-					if neigh in s: continue # Already been there
-					if not started_on_water and terr.tile(neigh) == 1 and not can_enter_water: continue # Don't go on water
-					s.add(neigh)
-					q.append(Spot(neigh, spot.steps + 1, spot))
-		return targets
+		enterable = g.full if started_on_water or can_enter_water else g.full & ~water
+		through = g.full if can_move_on_water else (water if started_on_water else g.full & ~water)
+		layers = g.flood(g.bit(start[0], start[1]), through, enterable, steps)
+		profiler.count('bfs nodes visited', sum(layer.bit_count() for layer in layers))
+		return [ Spot(tile, i, None) for i, layer in enumerate(layers) for tile in g.spots(layer & ~self.occupied) ]
 
+	# Returns the tiles with an opponent of active_civ that a unit at start can attack.
+	# Units that can shoot reach over water and other units. Others stop at water and at the first unit in the way.
+	@profiler.timed('Targeter.get_attack_targets')
 	def get_attack_targets(self,
 		start: Tuple[int, int],
 		terr: terrain.Terrain,
@@ -80,23 +85,11 @@ class Targeter():
 		active_civ: int,
 		shoot: bool,
 	) -> List[Spot]:
-		s = set()
-		q: Deque[Spot] = collections.deque()
-		s.add(start)
-		q.append(Spot(start, 0, None))
-		targets: List[Spot] = []
-		while len(q) > 0:
-			spot = q.popleft()
-			spr, civ = self.occupant(spot.tile)
-			keep_going = True
-			if spot.steps >= steps: keep_going = False
-			if spot.steps > 0 and spr is not None:
-				if not civ == active_civ: targets.append(spot)
-				if not shoot: keep_going = False
-			if keep_going:
-				for neigh in terr.adjacent(spot.tile):
-					if neigh in s: continue # Already been there
-					if terr.tile(neigh) == 1 and not shoot: continue # Don't go on water
-					s.add(neigh)
-					q.append(Spot(neigh, spot.steps + 1, spot))
-		return targets
+		g = self.grid
+		origin = g.bit(start[0], start[1])
+		enterable = g.full if shoot else g.full & ~terr.masks()[1]
+		through = g.full if shoot else (g.full & ~self.occupied) | origin
+		layers = g.flood(origin, through, enterable, steps)
+		profiler.count('bfs nodes visited', sum(layer.bit_count() for layer in layers))
+		opponents = self.occupied & ~self.civ_masks[active_civ]
+		return [ Spot(tile, i, None) for i, layer in enumerate(layers) if i > 0 for tile in g.spots(layer & opponents) ]
@@ -1,8 +1,14 @@
-from typing import List, Tuple, Optional, Mapping, Any
+from typing import List, Tuple, Optional, Mapping, Any, Dict, Callable
+import os
+import concurrent.futures
 import cv2
-import random
 import numpy as np
 import image
+import atlas
+import profiler
+import rng
+import hexgrid
+import bitboard
 
 class Terrain():
 	w = 16
@@ -15,122 +21,240 @@ class Terrain():
 		cv2.imread('pics/game/desert.png', -1),  # 4
 		cv2.imread('pics/game/mountain.png', -1),# 5
 	]
-	borders: List[np.ndarray] = [
-		cv2.imread('pics/civ0/border.png', -1),
-		cv2.imread('pics/civ1/border.png', -1),
-		cv2.imread('pics/civ2/border.png', -1),
-		cv2.imread('pics/civ3/border.png', -1),
-	]
-	borders_dotted: List[np.ndarray] = [
-		cv2.imread('pics/civ0/border_dotted.png', -1),
-		cv2.imread('pics/civ1/border_dotted.png', -1),
-		cv2.imread('pics/civ2/border_dotted.png', -1),
-		cv2.imread('pics/civ3/border_dotted.png', -1),
-	]
+	border_base = cv2.imread('pics/base/border.png', -1)
+	border_dotted_base = cv2.imread('pics/base/border_dotted.png', -1)
+	border_cache: Dict[Tuple[int, bool], np.ndarray] = {}
+	scaled_cache: Dict[int, np.ndarray] = {}
+	render_threads = min(8, os.cpu_count() or 1)
+	pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
 
 	def __init__(self) -> None:
 		self.qw = 88
 		self.hh = 152
 		self.scale = 0.36
 		self.tiles: List[List[int]] = [[1 for i in range(self.w)] for j in range(self.h)] # all water
+		self.type_masks: Optional[List[int]] = None # a bitboard of the tiles of each type (made when first needed)
+		self.canvas: Optional[np.ndarray] = None
+		self.warp_cache: Dict[Tuple[int, int, int], Tuple[np.ndarray, int, int]] = {}
+		self.make_tilt()
 
 	def marshall(self) -> List[List[int]]:
-		return self.tiles
+		return [ row[:] for row in self.tiles ]
 
 	def unmarshall(self, ob: List[List[int]]) -> None:
 		assert len(ob) == 16 and len(ob[0]) == 16
 		self.tiles = ob
+		self.type_masks = None
 
 	def tile(self, spot: Tuple[int, int]) -> int:
 		return self.tiles[spot[1]][spot[0]]
 
 	def set_tile(self, spot: Tuple[int, int], t: int) -> None:
+		if self.type_masks is not None:
+			b = 1 << (spot[1] * self.w + spot[0])
+			self.type_masks[self.tile(spot)] &= ~b
+			self.type_masks[t] |= b
 		self.tiles[spot[1]][spot[0]] = t
 
-	def generate_terrain(self) -> None:
-		min_islands = 6
-		max_islands = 12
-		min_island_size = 15
-		max_island_size = 45
-		consistency = 8
-
-		# Add some islands
-		num_islands = random.randrange(min_islands, max_islands)
-		for i in range(num_islands):
-			# Start in a random place
-			x = random.randrange(self.w)
-			y = random.randrange(self.h)
-			island_size = random.randrange(min_island_size, max_island_size)
-			tile_type = random.randrange(2, 6)
-
-			# Grow the land
-			for j in range(island_size):
-				if random.randrange(consistency) == 0:
-					tile_type = random.randrange(2, 6)
-				self.tiles[y][x] = tile_type
-				adj = self.adjacent((x, y))
-				x, y = adj[random.randrange(len(adj))]
+	# Returns a bitboard (see bitboard.py) of the tiles of each type
+	def masks(self) -> List[int]:
+		if self.type_masks is None:
+			masks = [ 0 ] * 6
+			for y, row in enumerate(self.tiles):
+				for x, t in enumerate(row):
+					masks[t] |= 1 << (y * self.w + x)
+			self.type_masks = masks
+		return self.type_masks
+
+	# Returns a bitboard of the tiles of any of the specified types
+	def mask(self, types: List[int]) -> int:
+		masks = self.masks()
+		m = 0
+		for t in types:
+			m |= masks[t]
+		return m
+
+	# Makes a new map. Land is where smoothed random noise is highest, and a second smoothed noise field
+	# picks the kind of land, so neighboring tiles tend to be the same kind. Islands too small to be worth visiting are sunk.
+	@profiler.timed('Terrain.generate_terrain')
+	def generate_terrain(self, rand: rng.Stream) -> None:
+		land_fraction = 0.45
+		smoothness = 3
+		min_island_size = 4
+
+		noise = np.random.Generator(np.random.PCG64(rand.next64())).random((2, self.h, self.w))
+		for i in range(smoothness):
+			noise = hexgrid.smooth(noise)
+		height, kind = noise
+		land = height > np.quantile(height, 1. - land_fraction)
+		count, islands = hexgrid.label(land)
+		sizes = np.bincount(islands.ravel(), minlength = count + 1)
+		land &= sizes[islands] >= min_island_size
+		tiles = np.ones((self.h, self.w), dtype = np.intp) # water
+		if land.any():
+			# Split the land evenly among forest, land, desert, and mountain
+			tiles[land] = 2 + np.searchsorted(np.quantile(kind[land], [0.25, 0.5, 0.75]), kind[land])
+		self.tiles = tiles.tolist()
+		self.type_masks = None
+
+	# Returns n different starting spots on land, spread out as far as possible. Spots are only picked on islands with room to grow
+	# (or on the biggest island, if none is big enough). Each spot is the one farthest, in steps,
+	# from the spots picked before it, with ties broken at random. If those islands run out of tiles,
+	# the next biggest island is added, and if the land runs out, spots go on water.
+	@profiler.timed('Terrain.start_spots')
+	def start_spots(self, n: int, rand: rng.Stream) -> List[Tuple[int, int]]:
+		min_island_size = 12
+		assert n <= self.w * self.h
+		count, islands = hexgrid.label(np.array(self.tiles) >= 2)
+		sizes = np.bincount(islands.ravel(), minlength = count + 1)
+		sizes[0] = 0 # (water)
+		candidates = sizes[islands] >= max(1, min(min_island_size, sizes.max()))
+		if not candidates.any():
+			candidates[:, :] = True # (there is no land at all)
+		taken = np.zeros((self.h, self.w), dtype = bool)
+		farness = np.full((self.h, self.w), self.w + self.h)
+		spots: List[Tuple[int, int]] = []
+		for i in range(n):
+			while not (candidates & ~taken).any():
+				left_out = np.where(candidates, 0, sizes[islands]) # (the size of the island of each tile that is not a candidate yet)
+				if left_out.max() > 0:
+					candidates |= islands == islands.flat[left_out.argmax()]
+				else:
+					candidates[:, :] = True
+			score = np.where(candidates & ~taken, farness, -1)
+			best = np.flatnonzero(score == score.max())
+			y, x = divmod(int(best[rand.randrange(len(best))]), self.w)
+			spots.append((x, y))
+			taken[y, x] = True
+			farness = np.minimum(farness, hexgrid.distance_from(x, y, self.w, self.h))
+		return spots
+
+	# Returns the border image for the specified civilization, tinted from the neutral gray base art
+	@staticmethod
+	def border(civ: int, dotted: bool) -> np.ndarray:
+		key = (civ, dotted)
+		if key not in Terrain.border_cache:
+			base = Terrain.border_dotted_base if dotted else Terrain.border_base
+			b, g, r = atlas.civ_color(civ)
+			gray = float(base[:, :, 0].max())
+			Terrain.border_cache[key] = image.tint(base, b / gray, g / gray, r / gray)
+		return Terrain.border_cache[key]
 
 	def corner(self, x: int, y: int) -> Tuple[int, int]:
 		xx = 3 * x * self.qw
 		yy = (2 * y + (0 if (x & 1) == 0 else 1)) * self.hh
 		return (int(xx * self.scale), int(yy * self.scale))
 
+	# Makes the transforms that tilt the flat hex grid back into the screen
+	def make_tilt(self) -> None:
+		w = int((1 + (3 * self.w)) * self.qw * self.scale)
+		h = int((1 + (2 * self.h)) * self.hh * self.scale)
+		ww = 0.6 * w
+		hh = 0.4 * h
+		corners_bef = np.float32([[[0., 0.]], [[w, 0.]], [[w, h]], [[0., h]]])
+		corners_aft = np.float32([[[(w - ww) / 2., 0.]], [[(w - ww) / 2. + ww, 0.]], [[w, hh]], [[0., hh]]])
+		self.transform = cv2.getPerspectiveTransform(corners_bef, corners_aft)
+		self.untransform = np.linalg.pinv(self.transform)
+		self.canvas_size = (int(w), int(hh))
+
+		# Find where the center of every tile goes, all at once
+		centers = np.float32([ [ [ 2 * self.qw * self.scale + xx, self.hh * self.scale + yy ] ] for xx, yy in [ self.corner(x, y) for y in range(self.h) for x in range(self.w) ] ])
+		pixels = cv2.perspectiveTransform(centers, self.transform)
+		self.tile_pixels = [ (int(p[0, 0]), int(p[0, 1])) for p in pixels ]
+
+	# Returns the scaled-down copy of a tile or border image. (These are the flat hexes before tilting.)
+	@staticmethod
+	def scaled(key: int, pic: np.ndarray, scale: float) -> np.ndarray:
+		if key not in Terrain.scaled_cache:
+			transform = np.float32([[scale, 0., 0.], [0., scale, 0.], [0., 0., 1.]])
+			Terrain.scaled_cache[key], _, _ = image.perspective_warp(pic, transform)
+		return Terrain.scaled_cache[key]
+
+	# Returns a picture already warped to its final place on the screen at tile (x, y), and where to blit it.
+	# key identifies the picture: 0-5 are the tile types, and 6 and up are the civ borders.
+	def warped(self, x: int, y: int, key: int, pic: np.ndarray) -> Tuple[np.ndarray, int, int]:
+		cache_key = (x, y, key)
+		if cache_key not in self.warp_cache:
+			xx, yy = self.corner(x, y)
+			offset = np.eye(3)
+			offset[0, 2] = xx
+			offset[1, 2] = yy
+			warped, px, py = image.perspective_warp_to4(self.scaled(key, pic, self.scale), np.matmul(self.transform, offset))
+			if key < 6:
+				# Double the coverage along the edges of tiles so the anti-aliased edges of neighbors
+				# fill each other in instead of leaving a dark seam between them
+				warped[:, :, 3] = cv2.multiply(warped[:, :, 3], 2)
+			self.warp_cache[cache_key] = (warped, px, py)
+		return self.warp_cache[cache_key]
+
 	def update_canvas(self, owned_spots: List[List[Tuple[int, int, bool]]], visibility: List[List[bool]]) -> None:
-		# Make a scaling transform
-		corners_bef = np.float32([[[0., 0.]], [[1., 0.]], [[1., 1.]], [[0., 1.]]])
-		corners_aft = np.float32([[[0., 0.]], [[self.scale, 0.]], [[self.scale, self.scale]], [[0., self.scale]]])
-		transform = cv2.getPerspectiveTransform(corners_bef, corners_aft)
+		w, h = self.canvas_size
+		if self.canvas is None:
+			self.canvas = np.empty((h, w, 3), dtype = np.uint8)
+		self.render(self.canvas, self.tiles, owned_spots, visibility)
 
-		# Make a canvas
-		wid = int((1 + (3 * self.w)) * self.qw * self.scale)
-		hgt = int((1 + (2 * self.h)) * self.hh * self.scale)
-		canvas = np.full((hgt, wid, 3), 0, dtype = np.uint8)
+	# Sets how many threads render uses to composite the canvas
+	@staticmethod
+	def set_render_threads(n: int) -> None:
+		Terrain.render_threads = max(1, n)
+		if Terrain.pool is not None:
+			Terrain.pool.shutdown()
+			Terrain.pool = None
 
-		# Draw the tiles
+	# Draws the board into canvas. It does not read the board from self, only the cached pictures, so one
+	# worker thread at a time may call it with a snapshot of the tiles.
+	# If cancelled returns True partway through, this gives up and returns False.
+	@profiler.timed('Terrain.render')
+	def render(self,
+		canvas: np.ndarray,
+		tiles: List[List[int]],
+		owned_spots: List[List[Tuple[int, int, bool]]],
+		visibility: List[List[bool]],
+		cancelled: Callable[[], bool] = lambda: False,
+	) -> bool:
+		# Gather the pictures to draw, from back to front. (This also fills the warp cache, so the
+		# compositing threads below only read it.)
+		blits: List[Tuple[np.ndarray, int, int]] = []
 		for y in range(self.h):
+			if cancelled():
+				return False
 			for x in range(self.w):
-				xx, yy = self.corner(x, y)
-				offset = np.eye(3)
-				offset[0, 2] = xx
-				offset[1, 2] = yy
-				corrected_transform = np.matmul(offset, transform)
 				tile = 0
 				if visibility[y][x]:
-					tile = self.tiles[y][x]
-				image.perspective_blit4(canvas, self.images[tile], corrected_transform)
-
-		# Draw ownership borders
+					tile = tiles[y][x]
+				blits.append(self.warped(x, y, tile, self.images[tile]))
 		for i in range(len(owned_spots)):
 			spots = owned_spots[i]
 			for spot in spots:
 				if visibility[spot[1]][spot[0]]:
-					xx, yy = self.corner(spot[0], spot[1])
-					offset = np.eye(3)
-					offset[0, 2] = xx
-					offset[1, 2] = yy
-					corrected_transform = np.matmul(offset, transform)
-					if spot[2]:
-						pic = self.borders_dotted[i]
-					else:
-						pic = self.borders[i]
-					image.perspective_blit4(canvas, pic, corrected_transform)
-
-		# Tilt the canvas back
-		h, w = canvas.shape[0:2]
-		ww = 0.6 * w
-		hh = 0.4 * h
-		corners_bef = np.float32([[[0., 0.]], [[w, 0.]], [[w, h]], [[0., h]]])
-		corners_aft = np.float32([[[(w - ww) / 2., 0.]], [[(w - ww) / 2. + ww, 0.]], [[w, hh]], [[0., hh]]])
-		self.transform = cv2.getPerspectiveTransform(corners_bef, corners_aft)
-		self.untransform = np.linalg.pinv(self.transform)
-		self.canvas = cv2.warpPerspective(canvas, self.transform, (int(w), int(hh)))
+					key = 6 + 2 * i + (1 if spot[2] else 0)
+					blits.append(self.warped(spot[0], spot[1], key, self.border(i, spot[2])))
+
+		# Composite them in horizontal bands, one per thread. Each band draws every picture that overlaps it
+		# (clipped to the band) in the same order, so the hex edges that straddle bands come out exactly as
+		# they would if drawn all at once.
+		if Terrain.render_threads <= 1:
+			Terrain.composite(canvas, blits, 0)
+		else:
+			if Terrain.pool is None:
+				Terrain.pool = concurrent.futures.ThreadPoolExecutor(Terrain.render_threads, thread_name_prefix='composite')
+			step = (canvas.shape[0] + Terrain.render_threads - 1) // Terrain.render_threads
+			futures = [ Terrain.pool.submit(Terrain.composite, canvas[top:top + step], blits, top) for top in range(0, canvas.shape[0], step) ]
+			for f in futures:
+				f.result()
+		return True
+
+	# Clears band and draws the overlapping part of each picture into it. top is the band's first row in the canvas.
+	@staticmethod
+	def composite(band: np.ndarray, blits: List[Tuple[np.ndarray, int, int]], top: int) -> None:
+		band.fill(0)
+		bottom = top + band.shape[0]
+		for pic, px, py in blits:
+			if py < bottom and py + pic.shape[0] > top:
+				image.blit4(band, pic, px, py - top)
 
 	def tile_to_pixel(self, x: int, y: int) -> Tuple[int, int]:
-		xx, yy = self.corner(x, y)
-		point_bef = np.float32([[[2 * self.qw * self.scale + xx, self.hh * self.scale + yy]]])
-		point_aft = cv2.perspectiveTransform(point_bef, self.transform)
-		return int(point_aft[0, 0, 0]), int(point_aft[0, 0, 1])
+		return self.tile_pixels[y * self.w + x]
 
 	def pixel_to_tile(self, x: int, y: int) -> Tuple[int, int]:
 		point_bef = np.float32([[[x, y]]])
@@ -167,15 +291,10 @@ class Terrain():
 		return hood
 
 	def get_tile_spots(self, acceptable_types: List[int]) -> List[Tuple[int, int]]:
-		candidates: List[Tuple[int, int]] = []
-		for y in range(self.h):
-			for x in range(self.w):
-				if self.tile((x, y)) in acceptable_types:
-					candidates.append((x, y))
-		return candidates
+		return bitboard.grid(self.w, self.h).spots(self.mask(acceptable_types))
 
-	def random_tile(self, acceptable_types: List[int]) -> Optional[Tuple[int, int]]:
+	def random_tile(self, acceptable_types: List[int], rand: rng.Stream) -> Optional[Tuple[int, int]]:
 		candidates = self.get_tile_spots(acceptable_types)
 		if len(candidates) < 1:
 			return None
-		return candidates[random.randrange(len(candidates))]
+		return candidates[rand.randrange(len(candidates))]
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The game loads its pictures from paths relative to the repository, and there is no display to open here
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(root)
+sys.path.insert(0, root)
+import gaia # (it starts pygame's fonts, which some of the modules it imports need as they load)
@@ -0,0 +1,23 @@
+import json
+import gaia
+import actions
+import rng
+
+# Helpers for the tests that play games headless
+
+def headless_model(num_civs: int, seed: int) -> gaia.Model:
+	m = gaia.Model()
+	m.display_mode = False
+	m.draws_canvas = False
+	m.start_game(num_civs, seed)
+	m.message = ''
+	return m
+
+def snapshot(m: gaia.Model) -> str:
+	return json.dumps(m.marshall(), sort_keys = True)
+
+# Makes count random legal actions, chosen with rand
+def play_randomly(m: gaia.Model, rand: rng.Stream, count: int) -> None:
+	for i in range(count):
+		codes = actions.legal_actions(m)
+		m.make(actions.decode(codes[rand.randrange(len(codes))]))
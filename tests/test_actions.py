@@ -0,0 +1,41 @@
+from typing import Set
+import gaia
+import actions
+import rng
+from games import headless_model, snapshot
+
+# Every legal code decodes to an action that encodes (and marshalls) back to the same code
+def test_encode_decode_round_trip() -> None:
+	kinds: Set[str] = set()
+	for seed in range(4):
+		m = headless_model(2 + seed % 3, seed)
+		rand = rng.Stream(seed)
+		for i in range(300):
+			codes = actions.legal_actions(m)
+			assert len(set(codes)) == len(codes)
+			for code in codes:
+				act = actions.decode(code)
+				kinds.add(act.descr)
+				assert actions.encode(act.descr, act.doer, act.target) == code
+				again = gaia.Action.unmarshall(act.marshall())
+				assert actions.encode(again.descr, again.doer, again.target) == code
+			m.make(actions.decode(codes[rand.randrange(len(codes))]))
+	assert { 'End', 'move', 'attack', 'gnome', 'hut' } <= kinds
+
+# Model.make does every legal action: each one changes the position (and can be taken back)
+def test_legal_actions_are_made() -> None:
+	for seed in range(3):
+		m = headless_model(2 + seed % 3, 10 + seed)
+		rand = rng.Stream(seed)
+		m.searching += 1 # (so Ends can be taken back too)
+		for i in range(60):
+			codes = actions.legal_actions(m)
+			before = snapshot(m)
+			for code in codes:
+				m.make(actions.decode(code))
+				assert snapshot(m) != before, actions.decode(code).marshall()
+				m.unmake()
+				assert snapshot(m) == before
+			for k in range(5):
+				codes = actions.legal_actions(m)
+				m.make(actions.decode(codes[rand.randrange(len(codes))]))
@@ -0,0 +1,34 @@
+import gc
+import os
+from typing import Any
+import numpy as np
+import pytest
+import dataset
+
+def rows(n: int, start: int) -> Any:
+	planes = np.zeros((n, dataset.channel_count, 16, 16), dtype = np.uint8)
+	planes[:, 0, 0, 0] = np.arange(start, start + n) % 256
+	scalars = np.arange(start, start + n, dtype = np.int32)[:, np.newaxis].repeat(dataset.scalar_count, axis = 1)
+	labels = np.zeros((n, dataset.label_count), dtype = np.int64)
+	return planes, scalars, labels
+
+# A partly filled last shard is cut down to its positions when the writer closes. No memory map of the old file
+# may be open when it is replaced (Windows refuses to replace a mapped file).
+def test_last_shard_is_trimmed(tmp_path: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+	replace = os.replace
+	def checked_replace(src: str, dst: str) -> None:
+		gc.collect()
+		assert not any(isinstance(ob, np.memmap) and ob.filename is not None and os.path.abspath(ob.filename) == os.path.abspath(dst) for ob in gc.get_objects())
+		replace(src, dst)
+	monkeypatch.setattr(os, 'replace', checked_replace)
+
+	writer = dataset.ShardWriter(str(tmp_path), shard_size = 64)
+	writer.add_game(*rows(50, 0))
+	writer.add_game(*rows(30, 50))
+	writer.close()
+	assert np.load(writer.filename('shard0000', 'scalars')).shape[0] == 64
+	assert np.load(writer.filename('shard0001', 'scalars')).shape[0] == 16
+	d = dataset.Dataset(str(tmp_path))
+	assert len(d) == 80
+	assert [ int(d[i][1][0]) for i in range(80) ] == list(range(80))
+	assert int(d[79][0][0, 0, 0]) == 79
@@ -0,0 +1,70 @@
+import actions
+import rng
+import zobrist
+from games import headless_model, snapshot
+
+# Making random actions and unmaking them all should pass back through every position, hash included
+def test_make_unmake_round_trip() -> None:
+	for seed in range(4):
+		m = headless_model(2 + seed % 3, seed)
+		rand = rng.Stream(seed)
+		m.searching += 1 # (so turns can be taken back too)
+		states = []
+		ends = 0
+		for i in range(300):
+			codes = actions.legal_actions(m)
+			states.append((snapshot(m), m.hash_key, len(codes)))
+			code = codes[rand.randrange(len(codes))]
+			ends += code == 0
+			m.make(actions.decode(code))
+		assert ends > 0
+		for i in reversed(range(len(states))):
+			m.unmake()
+			state, hash_key, legal_count = states[i]
+			assert snapshot(m) == state
+			assert m.hash_key == hash_key
+			assert len(actions.legal_actions(m)) == legal_count
+		assert len(m.history) == 0
+		m.rehash()
+		assert m.hash_key == states[0][1]
+
+# Outside of a search, the deltas of earlier turns are dropped, but the last action (even an End) can still be unmade
+def test_deltas_are_dropped_at_end_of_turn() -> None:
+	m = headless_model(2, 5)
+	rand = rng.Stream(5)
+	for i in range(500):
+		codes = actions.legal_actions(m)
+		m.make(actions.decode(codes[rand.randrange(len(codes))]))
+		assert all(d.act.descr != 'End' for d in m.deltas[1:])
+		if m.history[-1].descr == 'End':
+			assert len(m.deltas) == 1
+	before = snapshot(m)
+	m.make(actions.decode(0))
+	m.unmake()
+	assert snapshot(m) == before
+
+# After every action, the incrementally kept hash is the one a rehash from scratch would give
+def test_hash_matches_rehash_after_every_action() -> None:
+	builds = { 'hut', 'fort', 'castle', 'farm', 'mine' }
+	seen = set()
+	for seed in range(6):
+		m = headless_model(2 + seed % 3, seed)
+		rand = rng.Stream(seed)
+		for i in range(400):
+			codes = actions.legal_actions(m)
+			act = actions.decode(codes[rand.randrange(len(codes))])
+			doer = m.civs[m.active_civ].population[act.doer] if act.doer >= 0 else None
+			had_raft = getattr(doer, 'raft', False)
+			m.make(act)
+			seen.add('build' if act.descr in builds else act.descr)
+			if act.descr == 'move' and getattr(doer, 'raft', False) and not had_raft:
+				seen.add('raft boarding')
+			assert m.hash_key == zobrist.position_key(m.terr.tiles, m.civs, m.active_civ), (seed, i, act.marshall())
+	assert { 'End', 'move', 'attack', 'build', 'raft boarding' } <= seen
+
+# Headless games and searches do not keep each civ's last state (only the hot-seat replay on the screen needs it)
+def test_headless_ends_keep_no_last_state() -> None:
+	m = headless_model(3, 2)
+	for i in range(6):
+		m.make(actions.decode(0))
+	assert all(len(c.last_state) == 0 for c in m.civs)
@@ -0,0 +1,36 @@
+import json
+import rng
+from games import headless_model, snapshot, play_randomly
+
+# The same seed gives the same map and the same game
+def test_same_seed_same_game() -> None:
+	for seed in (1, 77, 4096):
+		a = headless_model(3, seed)
+		b = headless_model(3, seed)
+		assert a.terr.tiles == b.terr.tiles
+		assert snapshot(a) == snapshot(b)
+		play_randomly(a, rng.Stream(seed), 300)
+		play_randomly(b, rng.Stream(seed), 300)
+		assert snapshot(a) == snapshot(b)
+	assert headless_model(3, 1).terr.tiles != headless_model(3, 2).terr.tiles
+
+# A game saved and loaded (random streams included) goes on the same as the game it was saved from
+def test_same_play_after_save_and_load() -> None:
+	for seed in (5, 31):
+		a = headless_model(2, seed)
+		rand = rng.Stream(seed)
+		play_randomly(a, rand, 150)
+		b = headless_model(2, seed + 1)
+		b.unmarshall(json.loads(json.dumps(a.marshall())))
+		assert b.hash_key == a.hash_key
+		play_randomly(a, rng.Stream(rand.state), 300)
+		play_randomly(b, rng.Stream(rand.state), 300)
+		assert snapshot(a) == snapshot(b)
+		assert a.rng.marshall() == b.rng.marshall()
+
+def test_stream_round_trip() -> None:
+	r = rng.Rng(12345)
+	r.play.next64()
+	copy = rng.Rng.unmarshall(json.loads(json.dumps(r.marshall())))
+	assert [ copy.play.next64() for i in range(10) ] == [ r.play.next64() for i in range(10) ]
+	assert [ copy.map.randrange(1000) for i in range(10) ] == [ r.map.randrange(1000) for i in range(10) ]
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Any, Callable, List, Tuple
+import pytest
+import actions
+import server
+
+# Waits until cond() is true, or fails the test after a few seconds
+async def until(cond: Callable[[], bool], timeout: float = 5.) -> None:
+	deadline = time.time() + timeout
+	while not cond():
+		assert time.time() < deadline
+		await asyncio.sleep(0.01)
+
+class Seat():
+	def __init__(self, seat: Any, token: Any = None) -> None:
+		self.actions: List[Tuple[int, bool]] = []
+		self.snapshots: List[int] = []
+		self.client = server.GameClient(seat, lambda index, act, own: self.actions.append((index, own)), lambda index, state: self.snapshots.append(index), token)
+
+	def connect(self, port: int) -> 'asyncio.Task[None]':
+		return asyncio.create_task(self.client.run('127.0.0.1', port))
+
+# Plays a game over loopback through an action, a turned down action, a reconnection, and the end of the game
+def test_loopback_game(monkeypatch: pytest.MonkeyPatch) -> None:
+	monkeypatch.setattr(server.GameClient, 'retry_delay', 0.05)
+
+	async def play() -> None:
+		game = server.GameServer(2, 3)
+		await game.start(port = 0)
+		seats = [ Seat(0), Seat(1) ]
+		tasks = [ s.connect(game.port()) for s in seats ]
+		for s in seats:
+			await s.client.catch_up()
+		mover = seats[game.model.active_civ]
+		waiter = seats[1 - game.model.active_civ]
+
+		# An action goes to every client
+		mover.client.send(actions.decode(0))
+		await until(lambda: all(s.client.count == 1 for s in seats))
+		assert mover.actions == [ (0, True) ]
+		assert waiter.actions == [ (0, False) ]
+
+		# An action out of turn is turned down, and the client gets the game again
+		mover.client.send(actions.decode(0))
+		await until(lambda: len(mover.snapshots) == 1 and mover.client.count == 1)
+		assert mover.client.rejected == [ (1, 'not your turn') ]
+		assert mover.snapshots == [ 0 ]
+		assert mover.actions == [ (0, True), (0, False) ]
+		assert len(game.log) == 1
+
+		# Nobody else can take a seat, or ask for one in the wrong shape
+		intruder = Seat(0)
+		task = intruder.connect(game.port())
+		with pytest.raises(ConnectionRefusedError):
+			await intruder.client.catch_up()
+		await task
+		reader, writer = await asyncio.open_connection('127.0.0.1', game.port())
+		writer.write(server.encode_message({ 'type': 'hello', 'seat': '0', 'since': 0 }))
+		assert await reader.read() == b''
+		writer.close()
+
+		# A player whose connection drops takes their seat again, and catches up on what they missed
+		old = game.seats[mover.client.seat]
+		assert mover.client.writer is not None
+		mover.client.writer.close()
+		waiter.client.send(actions.decode(0))
+		await until(lambda: game.seats.get(mover.client.seat) not in (None, old) and mover.client.count == 2)
+		assert mover.actions[-1] == (1, False)
+		assert waiter.actions == [ (0, False), (1, True) ]
+
+		# Once one civ is left, the game is over
+		game.model.civs[waiter.client.seat].population.clear()
+		mover.client.send(actions.decode(0))
+		await until(lambda: len(mover.client.rejected) == 2)
+		assert mover.client.rejected[-1] == (2, 'the game is over')
+
+		for s in seats:
+			s.client.close()
+		await asyncio.gather(*tasks)
+		await game.close()
+
+	asyncio.run(play())
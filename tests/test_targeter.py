@@ -0,0 +1,79 @@
+from typing import Deque, List, Set, Tuple
+import collections
+import rng
+import terrain
+import targeter
+from games import headless_model, play_randomly
+
+# Straightforward breadth-first searches with the semantics of the move and attack rules,
+# each returning the set of (tile, steps) it finds
+
+def reference_move_targets(tt: targeter.Targeter, start: Tuple[int, int], terr: terrain.Terrain, steps: int,
+	can_enter_water: bool, can_move_on_water: bool) -> Set[Tuple[Tuple[int, int], int]]:
+	started_on_water = terr.tile(start) == 1
+	seen = { start }
+	q: Deque[Tuple[Tuple[int, int], int]] = collections.deque([ (start, 0) ])
+	targets = set()
+	while len(q) > 0:
+		tile, n = q.popleft()
+		if tt.occupant(tile)[0] is None:
+			targets.add((tile, n))
+		if n >= steps or ((terr.tile(tile) == 1) != started_on_water and not can_move_on_water):
+			continue
+		for neigh in terr.adjacent(tile):
+			if neigh in seen or (not started_on_water and terr.tile(neigh) == 1 and not can_enter_water):
+				continue
+			seen.add(neigh)
+			q.append((neigh, n + 1))
+	return targets
+
+def reference_attack_targets(tt: targeter.Targeter, start: Tuple[int, int], terr: terrain.Terrain, steps: int,
+	active_civ: int, shoot: bool) -> Set[Tuple[Tuple[int, int], int]]:
+	seen = { start }
+	q: Deque[Tuple[Tuple[int, int], int]] = collections.deque([ (start, 0) ])
+	targets = set()
+	while len(q) > 0:
+		tile, n = q.popleft()
+		spr, c = tt.occupant(tile)
+		if n > 0 and spr is not None:
+			if c != active_civ:
+				targets.add((tile, n))
+			if not shoot:
+				continue
+		if n >= steps:
+			continue
+		for neigh in terr.adjacent(tile):
+			if neigh in seen or (terr.tile(neigh) == 1 and not shoot):
+				continue
+			seen.add(neigh)
+			q.append((neigh, n + 1))
+	return targets
+
+# Returns the found targets as a set, after checking that they come in order of steps, and in row-major order within a step
+def found(spots: List[targeter.Spot]) -> Set[Tuple[Tuple[int, int], int]]:
+	keys = [ (s.steps, s.tile[1], s.tile[0]) for s in spots ]
+	assert keys == sorted(keys)
+	assert len(set(keys)) == len(keys)
+	return { (s.tile, s.steps) for s in spots }
+
+# Compares the flood fills of Targeter with the searches above from every tile, on positions from seeded random games
+def test_targets_match_breadth_first_search() -> None:
+	every_tile = [ (x, y) for y in range(terrain.Terrain.h) for x in range(terrain.Terrain.w) ]
+	checked_water = False
+	for seed in range(5):
+		m = headless_model(2 + seed % 3, seed)
+		rand = rng.Stream(seed)
+		for round in range(3):
+			play_randomly(m, rand, 120)
+			tt = targeter.Targeter(m.terr, m.civs)
+			for start in every_tile:
+				checked_water |= m.terr.tile(start) == 1
+				steps = 1 + rand.randrange(5)
+				for enter, move_on in [ (False, False), (True, False), (True, True) ]:
+					assert found(tt.get_move_targets(start, m.terr, steps, enter, move_on)) == \
+						reference_move_targets(tt, start, m.terr, steps, enter, move_on)
+				for shoot in (False, True):
+					civ_index = rand.randrange(len(m.civs))
+					assert found(tt.get_attack_targets(start, m.terr, steps, civ_index, shoot)) == \
+						reference_attack_targets(tt, start, m.terr, steps, civ_index, shoot)
+	assert checked_water
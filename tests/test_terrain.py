@@ -0,0 +1,98 @@
+from typing import Dict, List, Tuple
+import numpy as np
+import hexgrid
+import terrain
+import rng
+
+w = terrain.Terrain.w
+h = terrain.Terrain.h
+
+# The steps from a tile to every tile, found by a breadth-first search over Terrain.adjacent
+def bfs_distances(start: Tuple[int, int]) -> np.ndarray:
+	d = np.full((h, w), -1)
+	d[start[1], start[0]] = 0
+	frontier = [ start ]
+	while len(frontier) > 0:
+		next_frontier: List[Tuple[int, int]] = []
+		for spot in frontier:
+			for x, y in terrain.Terrain.adjacent(spot):
+				if d[y, x] < 0:
+					d[y, x] = d[spot[1], spot[0]] + 1
+					next_frontier.append((x, y))
+		frontier = next_frontier
+	return d
+
+# The connected groups of True tiles in mask, found by breadth-first search, as a group number for each tile (or -1)
+def bfs_groups(mask: np.ndarray) -> np.ndarray:
+	groups = np.full((h, w), -1)
+	count = 0
+	for y in range(h):
+		for x in range(w):
+			if mask[y, x] and groups[y, x] < 0:
+				groups[y, x] = count
+				frontier = [ (x, y) ]
+				while len(frontier) > 0:
+					spot = frontier.pop()
+					for nx, ny in terrain.Terrain.adjacent(spot):
+						if mask[ny, nx] and groups[ny, nx] < 0:
+							groups[ny, nx] = count
+							frontier.append((nx, ny))
+				count += 1
+	return groups
+
+def test_distance_from() -> None:
+	for y in range(h):
+		for x in range(w):
+			assert (hexgrid.distance_from(x, y, w, h) == bfs_distances((x, y))).all()
+
+def test_label() -> None:
+	gen = np.random.Generator(np.random.PCG64(7))
+	masks = [ gen.random((h, w)) < density for density in (0.1, 0.3, 0.5, 0.6, 0.8) for i in range(4) ]
+	for seed in range(4):
+		t = terrain.Terrain()
+		t.generate_terrain(rng.Stream(seed))
+		masks.append(np.array(t.tiles) >= 2)
+	for mask in masks:
+		count, labels = hexgrid.label(mask)
+		groups = bfs_groups(mask)
+		assert count == groups.max() + 1
+		assert ((labels == 0) == ~mask).all()
+		pairs: Dict[int, int] = {} # (each BFS group must have exactly one label, and each label one group)
+		for g, l in zip(groups[mask], labels[mask]):
+			assert pairs.setdefault(int(g), int(l)) == l
+		assert len(set(pairs.values())) == len(pairs)
+
+# Generated maps only keep islands of at least 4 tiles
+def test_generated_islands() -> None:
+	for seed in range(10):
+		t = terrain.Terrain()
+		t.generate_terrain(rng.Stream(seed))
+		land = np.array(t.tiles) >= 2
+		groups = bfs_groups(land)
+		assert land.any()
+		assert np.bincount(groups[land]).min() >= 4
+
+def test_start_spots() -> None:
+	for seed in range(10):
+		t = terrain.Terrain()
+		t.generate_terrain(rng.Stream(seed))
+		for n in (2, 3, 4):
+			spots = t.start_spots(n, rng.Stream(seed))
+			assert len(set(spots)) == n
+			assert all(t.tile(spot) >= 2 for spot in spots)
+
+# When the islands have fewer tiles than there are civs, spots still differ: they fill the biggest island,
+# then the next biggest, and then go on water
+def test_start_spots_on_tiny_islands() -> None:
+	t = terrain.Terrain()
+	for spot in [ (3, 3), (3, 4), (4, 4) ]:
+		t.set_tile(spot, 3)
+	t.set_tile((12, 10), 2)
+	for seed in range(8):
+		spots = t.start_spots(6, rng.Stream(seed))
+		assert len(set(spots)) == 6
+		assert set(spots[:3]) == { (3, 3), (3, 4), (4, 4) }
+		assert spots[3] == (12, 10)
+		assert all(t.tile(spot) == 1 for spot in spots[4:])
+	water = terrain.Terrain()
+	assert len(set(water.start_spots(5, rng.Stream(1)))) == 5
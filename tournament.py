@@ -0,0 +1,292 @@
+from typing import List, Dict, Tuple, Set, Any, Sequence, Optional
+import os
+import sys
+import json
+import math
+import argparse
+import importlib
+import itertools
+from abc import abstractmethod
+import concurrent.futures
+
+# Run headless, from the directory that holds the pics folder
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import gaia
+import actions
+import ai
+import rng
+
+# Plays computer players against each other and rates them, to compare AI versions and rule tweaks.
+#
+# A player is a policy, named by a spec string (see make_policy), so games can be played in worker processes.
+# Games are scheduled in tables of 2 to 4 seats, and every table plays each of its seeds once in each rotation
+# of its seats, so no player gets a better seat or a better map than the others at the table.
+# Every finished game is appended to a checkpoint file at once, so a long tournament that stops can be resumed
+# and only plays the games it has not played yet.
+
+# Picks actions for the active civ in a game. (Subclass this to plug in another player.)
+class Policy():
+	@abstractmethod
+	def choose(self, model: gaia.Model, rand: rng.Stream) -> gaia.Action:
+		raise NotImplementedError('stub')
+
+class RandomPolicy(Policy):
+	def choose(self, model: gaia.Model, rand: rng.Stream) -> gaia.Action:
+		codes = actions.legal_actions(model)
+		return actions.decode(codes[rand.randrange(len(codes))])
+
+# Picks the action that scores best right after it is made (ties are broken at random)
+class GreedyPolicy(Policy):
+	def choose(self, model: gaia.Model, rand: rng.Stream) -> gaia.Action:
+		civ_index = model.active_civ
+		best: List[int] = []
+		best_score = float('-inf')
+		for code in actions.legal_actions(model):
+			model.make(actions.decode(code))
+			score = ai.evaluate(model, civ_index)
+			model.unmake()
+			if score > best_score:
+				best = [ code ]
+				best_score = score
+			elif score == best_score:
+				best.append(code)
+		return actions.decode(best[rand.randrange(len(best))])
+
+# The computer player's search, with a fixed number of playouts per action instead of a time budget (so games can be repeated exactly)
+class MonteCarloPolicy(Policy):
+	def __init__(self, playouts: int = 2) -> None:
+		self.playouts = playouts # (of each legal action)
+
+	def choose(self, model: gaia.Model, rand: rng.Stream) -> gaia.Action:
+		return actions.decode(ai.choose_by_playouts(model, rand, self.playouts))
+
+builtin_policies = {
+	'random': RandomPolicy,
+	'greedy': GreedyPolicy,
+	'mc': MonteCarloPolicy,
+}
+
+# Makes a policy from a spec: 'random', 'greedy', 'mc' or 'mc:N' (N playouts of each legal action),
+# or 'module:name', where name is a Policy class (or any function that returns an object with a choose method like Policy's) in an importable module.
+def make_policy(spec: str) -> Policy:
+	name, _, arg = spec.partition(':')
+	if name in builtin_policies:
+		return builtin_policies[name](int(arg)) if len(arg) > 0 else builtin_policies[name]()
+	if len(arg) == 0:
+		raise ValueError('Unrecognized policy: ' + spec)
+	policy = getattr(importlib.import_module(name), arg)()
+	if not callable(getattr(policy, 'choose', None)):
+		raise ValueError(spec + ' did not make a Policy')
+	return policy
+
+# Plays one game, with the policy in each seat named by specs. Returns its result: the players, the seed, the cut-off, how many actions
+# were made, and each seat's place (0 for the best). Civs that are knocked out earlier get worse places, and civs that are
+# still standing when the game is cut off after max_actions share a place.
+# (This runs in the worker processes.)
+def play_game(specs: List[str], seed: int, max_actions: int) -> Dict[str, Any]:
+	m = gaia.Model()
+	m.display_mode = False
+	m.draws_canvas = False
+	m.start_game(len(specs), seed)
+	m.message = ''
+	policies = [ make_policy(spec) for spec in specs ]
+	streams = [ rng.Stream(seed * 8 + seat + 1) for seat in range(len(specs)) ]
+	places = [ 0 ] * len(specs)
+	standing = [ True ] * len(specs)
+	while sum(standing) > 1 and len(m.history) < max_actions:
+		seat = m.active_civ
+		act = policies[seat].choose(m, streams[seat])
+		if actions.encode(act.descr, act.doer, act.target) not in actions.legal_actions(m):
+			raise ValueError(specs[seat] + ' chose an illegal action: ' + str(act.marshall()))
+		m.make(act)
+		now_standing = [ c.alive and len(c.population) > 0 for c in m.civs ]
+		for i in range(len(specs)):
+			if standing[i] and not now_standing[i]:
+				places[i] = sum(now_standing)
+		standing = now_standing
+	return { 'players': specs, 'seed': seed, 'max_actions': max_actions, 'actions': len(m.history), 'places': places }
+
+def game_key(players: Sequence[str], seed: int, max_actions: int) -> Tuple[Tuple[str, ...], int, int]:
+	return (tuple(players), seed, max_actions)
+
+# Every table of seats players, each playing every seed once in every rotation of its seats
+def round_robin(entrants: List[str], seats: int, seeds: List[int]) -> List[Tuple[List[str], int]]:
+	games: List[Tuple[List[str], int]] = []
+	for table in itertools.combinations(entrants, seats):
+		for seed in seeds:
+			for r in range(seats):
+				games.append((list(table[r:] + table[:r]), seed))
+	return games
+
+# Seats players with similar ratings together, preferring players who have not met yet. Players left over
+# when the entrants do not divide into tables sit the round out. (They are the lowest rated ones.)
+def swiss_tables(entrants: List[str], seats: int, ratings: Dict[str, float], met: Set[Tuple[str, str]]) -> List[List[str]]:
+	waiting = sorted(entrants, key = lambda p: (-ratings[p], entrants.index(p)))
+	tables: List[List[str]] = []
+	while len(waiting) >= seats:
+		table = [ waiting.pop(0) ]
+		while len(table) < seats:
+			fresh = [ p for p in waiting if all((p, q) not in met for q in table) ]
+			p = fresh[0] if len(fresh) > 0 else waiting[0]
+			waiting.remove(p)
+			table.append(p)
+		tables.append(table)
+	return tables
+
+
+# Fits Elo ratings to the results by maximum likelihood (a Bradley-Terry model, fit by minorization-maximization).
+# Each game counts as a match between every two seats at its table: the better place wins, and equal places draw.
+# A prior of one drawn match between every two players keeps the ratings of players who always win or always lose finite.
+def fit_ratings(entrants: List[str], results: List[Dict[str, Any]]) -> np.ndarray:
+	n = len(entrants)
+	index = { p: i for i, p in enumerate(entrants) }
+	wins = np.full((n, n), 0.5) - np.eye(n) * 0.5 # wins[i, j] is i's score against j
+	matches = np.ones((n, n)) - np.eye(n)
+	for r in results:
+		for a, b in itertools.combinations(range(len(r['players'])), 2):
+			i = index[r['players'][a]]
+			j = index[r['players'][b]]
+			s = 1. if r['places'][a] < r['places'][b] else 0. if r['places'][a] > r['places'][b] else 0.5
+			wins[i, j] += s
+			wins[j, i] += 1. - s
+			matches[i, j] += 1.
+			matches[j, i] += 1.
+	gamma = np.ones(n)
+	for it in range(2000):
+		new_gamma = wins.sum(axis = 1) / (matches / (gamma[:, None] + gamma[None, :])).sum(axis = 1)
+		new_gamma /= math.exp(np.log(new_gamma).mean())
+		done = np.abs(new_gamma - gamma).max() < 1e-9
+		gamma = new_gamma
+		if done:
+			break
+	return 1500. + 400. * np.log10(gamma)
+
+# Returns the confidence interval of each rating, by refitting the ratings to games sampled (with replacement) from the results
+def rating_intervals(entrants: List[str], results: List[Dict[str, Any]], confidence: float = 0.95, samples: int = 200) -> Tuple[np.ndarray, np.ndarray]:
+	rand = rng.Stream(0xe10)
+	fits = np.array([ fit_ratings(entrants, [ results[rand.randrange(len(results))] for i in range(len(results)) ]) for s in range(samples) ])
+	tail = (1. - confidence) / 2.
+	return np.quantile(fits, tail, axis = 0), np.quantile(fits, 1. - tail, axis = 0)
+
+
+# Runs the games of a tournament in a pool of worker processes, and keeps the results in a checkpoint file of JSON lines.
+# Results in the checkpoint of players who are not entered, or of games with another cut-off, are left out.
+class Tournament():
+	def __init__(self, entrants: List[str], checkpoint: str, processes: int, max_actions: int) -> None:
+		for spec in entrants:
+			make_policy(spec) # (so a bad spec fails now, not in a worker)
+		self.entrants = entrants
+		self.checkpoint = checkpoint
+		self.processes = processes
+		self.max_actions = max_actions
+		self.results: List[Dict[str, Any]] = []
+		if os.path.exists(checkpoint):
+			with open(checkpoint, mode='rb') as file:
+				b = file.read()
+			complete = b.rfind(b'\n') + 1
+			if complete < len(b):
+				os.truncate(checkpoint, complete) # (the last line was cut off when the tournament stopped)
+			for line in b[:complete].splitlines():
+				r = json.loads(line)
+				if all(p in entrants for p in r['players']) and r.get('max_actions') == max_actions:
+					self.results.append(r)
+		self.done = { game_key(r['players'], r['seed'], self.max_actions) for r in self.results }
+
+	# Plays the games that have not been played yet. If round is specified, it is recorded in their results.
+	def play(self, games: List[Tuple[List[str], int]], round: Optional[int] = None) -> None:
+		todo = [ (players, seed) for players, seed in games if game_key(players, seed, self.max_actions) not in self.done ]
+		if len(todo) == 0:
+			return
+		with concurrent.futures.ProcessPoolExecutor(max_workers = self.processes) as pool, open(self.checkpoint, mode='a') as file:
+			futures = [ pool.submit(play_game, players, seed, self.max_actions) for players, seed in todo ]
+			for finished, f in enumerate(concurrent.futures.as_completed(futures)):
+				r = f.result()
+				if round is not None:
+					r['round'] = round
+				file.write(json.dumps(r) + '\n')
+				file.flush()
+				os.fsync(file.fileno())
+				self.results.append(r)
+				self.done.add(game_key(r['players'], r['seed'], self.max_actions))
+				print('{}/{} {} seed {}: places {} after {} actions'.format(finished + 1, len(futures), ' vs '.join(r['players']), r['seed'], r['places'], r['actions']), file=sys.stderr)
+
+	def run_round_robin(self, seat_counts: List[int], seeds: List[int]) -> None:
+		for seats in seat_counts:
+			self.play(round_robin(self.entrants, seats, seeds))
+
+	# Plays rounds of Swiss pairings, cycling through the table sizes. Each round gets its own seeds.
+	# The tables of a round are drawn only from the results of the rounds before it (taken in a fixed order),
+	# so a tournament that is picked up again draws the same tables and only plays the games it is missing.
+	def run_swiss(self, seat_counts: List[int], seeds: List[int], rounds: int) -> None:
+		for round in range(rounds):
+			seats = seat_counts[round % len(seat_counts)]
+			earlier = sorted((r for r in self.results if r.get('round', rounds) < round), key = lambda r: (r['round'], r['players'], r['seed']))
+			ratings = dict(zip(self.entrants, fit_ratings(self.entrants, earlier)))
+			met = { (a, b) for r in earlier for a in r['players'] for b in r['players'] if a != b }
+			round_seeds = [ seed + round * len(seeds) for seed in seeds ]
+			self.play([ (table[r:] + table[:r], seed) for table in swiss_tables(self.entrants, seats, ratings, met) for seed in round_seeds for r in range(seats) ], round)
+
+	# Returns a row for each player, best first: its spec, games, average score in its matches, rating, and the low and high ends of its rating's confidence interval
+	def standings(self) -> List[Dict[str, Any]]:
+		ratings = fit_ratings(self.entrants, self.results)
+		low, high = rating_intervals(self.entrants, self.results) if len(self.results) > 0 else (ratings, ratings)
+		rows: List[Dict[str, Any]] = []
+		for i, p in enumerate(self.entrants):
+			games = [ r for r in self.results if p in r['players'] ]
+			scores: List[float] = []
+			for r in games:
+				a = r['players'].index(p)
+				scores += [ 1. if r['places'][a] < r['places'][b] else 0. if r['places'][a] > r['places'][b] else 0.5 for b in range(len(r['players'])) if b != a ]
+			rows.append({
+				'player': p,
+				'games': len(games),
+				'score': sum(scores) / len(scores) if len(scores) > 0 else 0.,
+				'rating': float(ratings[i]),
+				'low': float(low[i]),
+				'high': float(high[i]),
+			})
+		rows.sort(key = lambda row: -row['rating'])
+		return rows
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description='Plays computer players against each other, headless, and rates them')
+	parser.add_argument('players', nargs='+', help='policy specs: random, greedy, mc, mc:N (N playouts of each legal action), or module:name for a Policy class')
+	parser.add_argument('--format', choices=['round-robin', 'swiss'], default='round-robin', help='how tables are drawn')
+	parser.add_argument('--seats', type=int, nargs='+', default=[2], help='players per game (2 to 4). Tables of each size are played.')
+	parser.add_argument('--seeds', type=int, default=2, help='maps each table plays (in every rotation of its seats)')
+	parser.add_argument('--first-seed', type=int, default=1, help='seed of the first map')
+	parser.add_argument('--rounds', type=int, default=5, help='rounds of a Swiss tournament')
+	parser.add_argument('--max-actions', type=int, default=1000, help='actions after which a game is cut off')
+	parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='worker processes that play games (default: one per core)')
+	parser.add_argument('--checkpoint', default='tournament.jsonl', help='file of finished games. A tournament that stopped picks up from it.')
+	parser.add_argument('--out', help='write the standings as JSON to this file')
+	args = parser.parse_args()
+
+	if len(set(args.players)) != len(args.players):
+		parser.error('each player can only be entered once')
+	for seats in args.seats:
+		if seats < 2 or seats > 4 or seats > len(args.players):
+			parser.error('tables must have from 2 to 4 seats, and no more than the number of players')
+	seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+	try:
+		t = Tournament(args.players, args.checkpoint, args.processes, args.max_actions)
+	except (ValueError, ImportError, AttributeError) as e:
+		parser.error(str(e))
+	if args.format == 'swiss':
+		t.run_swiss(args.seats, seeds, args.rounds)
+	else:
+		t.run_round_robin(args.seats, seeds)
+	rows = t.standings()
+	print('{:<24} {:>6} {:>6} {:>7}   {}'.format('player', 'games', 'score', 'elo', '95% interval'), file=sys.stderr)
+	for row in rows:
+		print('{:<24} {:>6} {:>6.3f} {:>7.0f}   {:.0f} to {:.0f}'.format(row['player'], row['games'], row['score'], row['rating'], row['low'], row['high']), file=sys.stderr)
+	if args.out:
+		with open(args.out, mode='w') as file:
+			file.write(json.dumps(rows, indent=1))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,76 @@
+from typing import List, Tuple
+import functools
+import rng
+import sprite
+import civ
+import terrain
+
+# Zobrist hashing. Every feature of a position (a tile's type, a unit of some kind and civ on some tile, that unit's
+# life, raft, and exhausted flag, each civ's resources, and whose turn it is) gets a random 64-bit key, and a
+# position's hash is the XOR of the keys of its features. So when a feature changes, the hash changes by XORing
+# out its old key and XORing in its new one, no matter how big the board is. (See Model.hash_key.)
+
+seed = 0x67a1a5eed2b0b157 # (fixed, so hashes are the same in every process and every run)
+
+# What each kind of key is for
+TILE = 1
+UNIT = 2
+LIFE = 3
+RAFT = 4
+EXHAUSTED = 5
+FOOD = 6
+WOOD = 7
+GOLD = 8
+DEAD = 9
+ACTIVE = 10
+
+unit_kinds = { name: i for i, name in enumerate([ 'Building', 'Farm', 'Mine', 'Gnome', 'Dwarf', 'Trebuchet', 'Elf', 'Dragon' ]) }
+
+# Returns the key of a feature, which is a kind of key followed by whatever distinguishes it (such as a tile index)
+@functools.lru_cache(maxsize = 1 << 16)
+def key(*parts: int) -> int:
+	h = seed
+	for part in parts:
+		h = rng.Stream(h ^ part).next64()
+	return h
+
+def tile_key(spot: Tuple[int, int], t: int) -> int:
+	return key(TILE, spot[1] * terrain.Terrain.w + spot[0], t)
+
+def terrain_key(tiles: List[List[int]]) -> int:
+	h = 0
+	for y, row in enumerate(tiles):
+		for x, t in enumerate(row):
+			h ^= key(TILE, y * terrain.Terrain.w + x, t)
+	return h
+
+# Returns the key of a unit of the specified civ. (Units are told apart by their tiles, since no two share one.)
+def unit_key(s: sprite.Sprite, civ_index: int) -> int:
+	i = s.tile[1] * terrain.Terrain.w + s.tile[0]
+	state = s.state() if isinstance(s, sprite.Building) else 0
+	h = key(UNIT, i, civ_index, unit_kinds[type(s).__name__], state) ^ key(LIFE, i, s.life)
+	if s.exhausted:
+		h ^= key(EXHAUSTED, i)
+	if getattr(s, 'raft', False): # (Dragons never need one)
+		h ^= key(RAFT, i)
+	return h
+
+# Returns the key of a civ's resources (and whether it is still in the game)
+def civ_key(c: civ.Civ, civ_index: int) -> int:
+	h = key(FOOD, civ_index, c.food) ^ key(WOOD, civ_index, c.wood) ^ key(GOLD, civ_index, c.gold)
+	if not c.alive:
+		h ^= key(DEAD, civ_index)
+	return h
+
+def active_key(civ_index: int) -> int:
+	return key(ACTIVE, civ_index)
+
+# Returns the hash of a whole position, computed from scratch
+def position_key(tiles: List[List[int]], civs: List[civ.Civ], active_civ: int) -> int:
+	h = terrain_key(tiles) ^ active_key(active_civ)
+	for i, c in enumerate(civs):
+		h ^= civ_key(c, i)
+		for s in c.population:
+			h ^= unit_key(s, i)
+	return h
+